@@ -0,0 +1,136 @@
+import asyncio
+import collections
+import math
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+# Executor kinds for generation work
+POOL_MODES = ("thread", "process")
+
+
+# Raised when a request is shed instead of admitted
+class Overloaded(Exception):
+    def __init__(self, detail, retry_after):
+        super().__init__(detail)
+        self.retry_after = retry_after
+
+
+# Executor running CPU-heavy generation work. Worker processes are spawned,
+# not forked, since the API process runs background threads.
+def create_executor(mode, workers):
+    if mode == "thread":
+        return ThreadPoolExecutor(max_workers=workers, thread_name_prefix="generation")
+    if mode == "process":
+        return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    raise ValueError(f"Unknown pool mode {mode!r} (expected one of {', '.join(POOL_MODES)})")
+
+
+# Concurrency limit of one endpoint, used from the event loop.
+# At most `limit` requests run at once; up to `queue_size` more wait in
+# arrival order for at most `timeout` seconds, and the rest are shed at once.
+# A released slot is handed straight to the next waiter.
+class AdmissionGate:
+    def __init__(self, name, limit, queue_size, timeout):
+        self.name = name
+        self.limit = limit
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.active = 0
+        self.admitted = 0
+        self.shed = 0
+        self.timed_out = 0
+        self._waiters = collections.deque()
+
+    async def acquire(self):
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            self.admitted += 1
+            return
+        if len(self._waiters) >= self.queue_size:
+            self.shed += 1
+            raise Overloaded(f"Too many {self.name} requests in progress", math.ceil(self.timeout))
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, self.timeout)
+        except asyncio.TimeoutError:
+            self._forfeit(waiter)
+            self.timed_out += 1
+            raise Overloaded(f"Timed out waiting for a {self.name} slot", math.ceil(self.timeout)) from None
+        except asyncio.CancelledError:
+            self._forfeit(waiter)
+            raise
+
+    # Give back a slot handed to a waiter that stopped waiting
+    def _forfeit(self, waiter):
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+        if waiter.done() and not waiter.cancelled():
+            self.release()
+
+    def release(self):
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                self.admitted += 1
+                return
+        self.active -= 1
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.release()
+
+    # Counters for the admin endpoint
+    def stats(self):
+        return {
+            "limit": self.limit,
+            "active": self.active,
+            "waiting": len(self._waiters),
+            "admitted": self.admitted,
+            "shed": self.shed,
+            "timed_out": self.timed_out,
+        }
+
+
+# Per-client token buckets: `rate` requests per second on average with
+# bursts of up to `burst`. Only the `max_clients` most recently seen clients
+# are tracked; a forgotten client starts again with a full bucket.
+class RateLimiter:
+    def __init__(self, rate, burst, max_clients=100000):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self.limited = 0
+        self._buckets = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    # 0 when the client may proceed (taking a token), otherwise the number of
+    # seconds until a token is available
+    def check(self, client, now=None):
+        if now is None:
+            now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(client, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens >= 1:
+                wait = 0
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / self.rate
+                self.limited += 1
+            self._buckets[client] = (tokens, now)
+            if len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        return wait
+
+    # Counters for the admin endpoint
+    def stats(self):
+        return {"rate": self.rate, "burst": self.burst, "clients": len(self._buckets), "limited": self.limited}
@@ -1,140 +1,231 @@
-from fastapi import FastAPI, Query
-from fastapi.responses import JSONResponse
-import random
+from fastapi import FastAPI, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import iterate_in_threadpool, run_in_threadpool
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+import asyncio
+import contextvars
+import csv
+import functools
+import hmac
+import io
+import itertools
 import json
-from datetime import datetime, timedelta
 import os
-import uuid
+import time
+from typing import List, Optional
+
+from pydantic import BaseModel
+
+from admission import AdmissionGate, Overloaded, RateLimiter, create_executor
+from envelope import EnvelopeBuilder, with_node_id
+from geo_index import GeoIndex
+from history_cache import HistoryCache
+from history_store import HistoryStore, iter_blocks
+from ingest import IngestError, IngestStore, decode_instance
+from latest_cache import LatestReadingCache
+from listing import Listing, ListingError, decode_listing_cursor, encode_listing_cursor, query_subject
+from live import TickScheduler
+from metrics import (
+    CONTENT_TYPE as METRICS_CONTENT_TYPE, LATENCY_BUCKETS, SIZE_BUCKETS, MetricsMiddleware, MetricsRegistry,
+    RuntimeMonitor, points_generated,
+)
+from rollup import AGGREGATES, BucketAggregator
+from noise import KeyedNoise, resource_ids
+from param_specs import generate_values, sampling_interval
+from profiling import Profiler, current_profile, phase, timed
+from snapshot import SnapshotError, SnapshotManager
+from static_cache import RenderedPageCache, render_json, serve
+from time_query import TimeQueryError, parse_interval, resolve_range
+from timeseries import CSV_TIME_FORMAT, format_timestamp, format_timestamps
 
 app = FastAPI(title="IoT Data API", description="API for IoT sensor data and descriptors")
 
-# Load node configuration from nodes.json
-with open(os.path.join(os.path.dirname(__file__), "nodes.json"), "r") as f:
-    nodes_config = json.load(f)
+# Content instances expire two years after creation
+EXPIRY_SECONDS = 730 * 86400
+
+# History defaults: the last week at 6-hour steps, pages of at most this many points
+HISTORY_DEFAULT_SPAN = 7 * 86400
+HISTORY_DEFAULT_INTERVAL = 6 * 3600
+HISTORY_MAX_PAGE = int(os.environ.get("HISTORY_MAX_PAGE", "10000"))
+
+# Streamed history and exports are not paged, only capped; they are generated
+# in chunks of HISTORY_CHUNK points so memory stays flat
+HISTORY_MAX_STREAM = int(os.environ.get("HISTORY_MAX_STREAM", "100000000"))
+HISTORY_CHUNK = 1024
+EXPORT_DEFAULT_INTERVAL = 15 * 60
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+# Aggregation: raw points default to the node's Data Interval (else
+# EXPORT_DEFAULT_INTERVAL) over the last week, rolled up into hourly buckets.
+# Raw points are folded AGGREGATE_CHUNK at a time and capped per request.
+AGGREGATE_DEFAULT_BUCKET = 3600
+AGGREGATE_MAX_POINTS = int(os.environ.get("AGGREGATE_MAX_POINTS", "10000000"))
+AGGREGATE_CHUNK = 65536
+
+# History pages, batches and aggregations run on a pool of OFFLOAD_WORKERS
+# threads, or worker processes with OFFLOAD_MODE=process, instead of the event
+# loop. History, batch, export and aggregation requests each run at most *_CONCURRENCY at
+# a time; up to ADMISSION_QUEUE more wait at most ADMISSION_TIMEOUT seconds
+# and the rest get 503. CLIENT_RATE_LIMIT (requests per second, with bursts
+# of CLIENT_RATE_BURST) caps each client on those endpoints with 429s.
+OFFLOAD_MODE = os.environ.get("OFFLOAD_MODE", "thread")
+OFFLOAD_WORKERS = int(os.environ.get("OFFLOAD_WORKERS", str(os.cpu_count() or 4)))
+HISTORY_CONCURRENCY = int(os.environ.get("HISTORY_CONCURRENCY", str(OFFLOAD_WORKERS)))
+EXPORT_CONCURRENCY = int(os.environ.get("EXPORT_CONCURRENCY", str(OFFLOAD_WORKERS)))
+AGGREGATE_CONCURRENCY = int(os.environ.get("AGGREGATE_CONCURRENCY", str(OFFLOAD_WORKERS)))
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", str(OFFLOAD_WORKERS)))
+ADMISSION_QUEUE = int(os.environ.get("ADMISSION_QUEUE", "64"))
+ADMISSION_TIMEOUT = float(os.environ.get("ADMISSION_TIMEOUT", "30"))
+CLIENT_RATE_LIMIT = float(os.environ.get("CLIENT_RATE_LIMIT", "0"))
+CLIENT_RATE_BURST = float(os.environ.get("CLIENT_RATE_BURST", str(max(1.0, 2 * CLIENT_RATE_LIMIT))))
+
+# Maximum number of nodes one batch request may address
+BATCH_MAX_NODES = int(os.environ.get("BATCH_MAX_NODES", "10000"))
+BATCH_STREAM_CHUNK = 256
+
+# Live subscriptions: nodes without a "Data Interval" parameter push every
+# LIVE_DEFAULT_INTERVAL seconds; each connection buffers at most
+# LIVE_QUEUE_SIZE readings and idle streams get a heartbeat every LIVE_HEARTBEAT
+LIVE_DEFAULT_INTERVAL = int(os.environ.get("LIVE_DEFAULT_INTERVAL", "10"))
+LIVE_QUEUE_SIZE = int(os.environ.get("LIVE_QUEUE_SIZE", "100"))
+LIVE_HEARTBEAT = 15.0
+LIVE_TICK = 1.0
+
+# /data, /data/batch and live pushes share one reading per node per sampling
+# slot: the node's Data Interval, else LATEST_DEFAULT_INTERVAL seconds
+LATEST_DEFAULT_INTERVAL = int(os.environ.get("LATEST_DEFAULT_INTERVAL", str(LIVE_DEFAULT_INTERVAL)))
+
+# Filtered, sorted or paged list queries return LISTING_DEFAULT_LIMIT rows
+# per page unless asked for fewer, and never more than LISTING_MAX_LIMIT
+LISTING_DEFAULT_LIMIT = int(os.environ.get("LISTING_DEFAULT_LIMIT", "1000"))
+LISTING_MAX_LIMIT = int(os.environ.get("LISTING_MAX_LIMIT", "10000"))
+
+# Rendered (and compressed) list query pages are cached per configuration
+# version, up to LISTING_CACHE_BYTES in total
+LISTING_CACHE_BYTES = int(os.environ.get("LISTING_CACHE_BYTES", str(16 * 1024 * 1024)))
+
+listing_pages = RenderedPageCache(LISTING_CACHE_BYTES)
+
+# Static topology responses may be stored but must be revalidated (ETag/304)
+STATIC_CACHE_CONTROL = os.environ.get("STATIC_CACHE_CONTROL", "public, no-cache")
+
+# Node configuration file, polled for changes every NODES_RELOAD_INTERVAL
+# seconds (0 disables hot reload)
+NODES_CONFIG_PATH = os.environ.get("NODES_CONFIG", os.path.join(os.path.dirname(__file__), "nodes.json"))
+NODES_RELOAD_INTERVAL = float(os.environ.get("NODES_RELOAD_INTERVAL", "2"))
+
+# Admin endpoints (/admin/...) are disabled unless this is set, and then
+# require its value in the X-Admin-Token header
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
+
+# Request profiling is off by default. With PROFILE_REQUESTS=1, history
+# requests sent with an X-Profile: 1 header or ?profile=1 (and the admin token
+# when one is set) get their wall time by phase in a Server-Timing header.
+# PROFILE_SAMPLE_EVERY=N also profiles one history request in N unasked.
+# Recorded profiles are listed at /admin/profiles.
+PROFILE_REQUESTS = int(os.environ.get("PROFILE_REQUESTS", "0")) > 0
+PROFILE_SAMPLE_EVERY = int(os.environ.get("PROFILE_SAMPLE_EVERY", "0"))
+
+profiler = Profiler(PROFILE_SAMPLE_EVERY)
+
+# Directory of pre-generated columnar history (data_generator.py --format columnar).
+# When set, history and latest values are read from it where it has them and
+# generated otherwise; stores are re-checked every HISTORY_STORE_REFRESH seconds.
+HISTORY_STORE_DIR = os.environ.get("HISTORY_STORE_DIR")
+HISTORY_STORE_REFRESH = float(os.environ.get("HISTORY_STORE_REFRESH", "5"))
+
+history_store = HistoryStore(HISTORY_STORE_DIR, HISTORY_STORE_REFRESH) if HISTORY_STORE_DIR else None
+
+# Rendered history is cached in blocks of HISTORY_CACHE_BLOCK points, keyed by
+# (node, interval, block), up to HISTORY_CACHE_BYTES in total (0 disables it)
+HISTORY_CACHE_BYTES = int(os.environ.get("HISTORY_CACHE_BYTES", str(64 * 1024 * 1024)))
+HISTORY_CACHE_BLOCK = 1024
+
+history_cache = HistoryCache(HISTORY_CACHE_BYTES)
+
+# Pushed readings (POST /ingest) are kept in per-node rings of INGEST_CAPACITY
+# readings, INGEST_MAX_BYTES for all rings together, and written behind to
+# CSV files in INGEST_DIR every INGEST_FLUSH_INTERVAL seconds when it is set.
+# A request carries at most INGEST_MAX_BATCH instances whose ct may be up to
+# INGEST_MAX_SKEW seconds ahead of the server clock.
+INGEST_DIR = os.environ.get("INGEST_DIR")
+INGEST_CAPACITY = int(os.environ.get("INGEST_CAPACITY", "4096"))
+INGEST_MAX_BYTES = int(os.environ.get("INGEST_MAX_BYTES", str(256 * 1024 * 1024)))
+INGEST_FLUSH_INTERVAL = float(os.environ.get("INGEST_FLUSH_INTERVAL", "1"))
+INGEST_MAX_BATCH = int(os.environ.get("INGEST_MAX_BATCH", "10000"))
+INGEST_MAX_SKEW = 300
+
+# A node's latest pushed reading is served as its current reading for
+# INGEST_READING_TTL seconds (0: one sampling interval of the node), after
+# which synthesized readings take over again until the next push
+INGEST_READING_TTL = int(os.environ.get("INGEST_READING_TTL", "0"))
+
+ingest_store = IngestStore(INGEST_CAPACITY, INGEST_MAX_BYTES, INGEST_DIR, INGEST_FLUSH_INTERVAL)
+
+history_gate = AdmissionGate("history", HISTORY_CONCURRENCY, ADMISSION_QUEUE, ADMISSION_TIMEOUT)
+export_gate = AdmissionGate("export", EXPORT_CONCURRENCY, ADMISSION_QUEUE, ADMISSION_TIMEOUT)
+aggregate_gate = AdmissionGate("aggregate", AGGREGATE_CONCURRENCY, ADMISSION_QUEUE, ADMISSION_TIMEOUT)
+batch_gate = AdmissionGate("batch", BATCH_CONCURRENCY, ADMISSION_QUEUE, ADMISSION_TIMEOUT)
+client_limiter = RateLimiter(CLIENT_RATE_LIMIT, CLIENT_RATE_BURST) if CLIENT_RATE_LIMIT > 0 else None
+
+# Created on first use, so worker processes importing this module start none
+generation_pool = None
 
 # Helper function to find node details
-def find_node(node_id):
-    for domain in nodes_config["domains"]:
-        for sensor_type in domain["sensor_types"]:
-            for node in sensor_type["nodes"]:
-                if node["node_id"] == node_id:
-                    return {
-                        "node": node,
-                        "sensor_type": sensor_type,
-                        "domain": domain
-                    }
-    return None
+def find_node(node_id, snap=None):
+    return (snap or snapshots.current()).registry.find_node(node_id)
 
 # Helper function to get parameters for a node
-def get_node_parameters(node_id):
-    node_info = find_node(node_id)
-    if not node_info:
-        return None
-    
-    parameters = []
-    sensor_type = node_info["sensor_type"]
-    domain = node_info["domain"]
-    
-    for param_name in sensor_type["parameters"]:
-        # Find the parameter details in the domain parameters
-        for param in domain["parameters"]:
-            if param["parameter_name"] == param_name:
-                parameters.append(param)
-                break
-    
-    return parameters
-
-# Helper function to generate random values for parameters
-def generate_random_data(parameters):
-    data = []
-    for param in parameters:
-        if param["data_type"] == "float":
-            # Extract numeric part from resolution
-            resolution_str = param["resolution"]
-            decimal_places = 1  # default
-            if "." in resolution_str:
-                parts = resolution_str.split(".")
-                if len(parts) > 1 and len(parts[1]) > 0:
-                    num_str = ""
-                    for char in parts[1]:
-                        if char.isdigit():
-                            num_str += char
-                        else:
-                            break
-                    if num_str:
-                        decimal_places = len(num_str)
-            
-            # Extract numeric part from accuracy for range
-            accuracy_str = param["accuracy"]
-            range_val = 1.0  # default
-            for part in accuracy_str.split():
-                if part.startswith("±"):
-                    num_str = ""
-                    for char in part[1:]:
-                        if char.isdigit() or char == '.':
-                            num_str += char
-                        else:
-                            break
-                    if num_str:
-                        range_val = float(num_str)
-                    break
-            
-            # Generate a random value based on typical ranges for the parameter
-            base_value = 0
-            if "Temperature" in param["parameter_name"]:
-                base_value = random.uniform(15, 35)
-            elif "Humidity" in param["parameter_name"]:
-                base_value = random.uniform(30, 90)
-            elif "PM2.5" in param["parameter_name"]:
-                base_value = random.uniform(5, 50)
-            elif "CO2" in param["parameter_name"]:
-                base_value = random.uniform(350, 1500)
-            elif "O3" in param["parameter_name"]:
-                base_value = random.uniform(0.01, 0.08)
-            elif "NO2" in param["parameter_name"]:
-                base_value = random.uniform(0.01, 0.1)
-            elif "pH" in param["parameter_name"]:
-                base_value = random.uniform(6.5, 8.5)
-            elif "Turbidity" in param["parameter_name"]:
-                base_value = random.uniform(0.5, 10)
-            elif "Dissolved Oxygen" in param["parameter_name"]:
-                base_value = random.uniform(4, 12)
-            else:
-                base_value = random.uniform(0, 100)
-            
-            # Add some random variation within the accuracy range
-            value = round(base_value + random.uniform(-range_val, range_val), decimal_places)
-            data.append(str(value))
-    
-    return data
+def get_node_parameters(node_id, snap=None):
+    return (snap or snapshots.current()).registry.get_node_parameters(node_id)
 
-# Helper function to create response in the required format
-def create_response(content):
-    now = datetime.utcnow()
-    timestamp = now.strftime("%Y%m%dT%H%M%S")
-    expiry = (now + timedelta(days=730)).strftime("%Y%m%dT%H%M%S")
-    
-    # Generate random IDs for pi and ri
-    pi = f"3-{random.randint(10000000000000000000, 99999999999999999999)}"
-    ri = f"4-{random.randint(10000000000000000000, 99999999999999999999)}"
-    rn = f"4-{random.randint(10000000000000000, 99999999999999999)}"
-    
-    return {
-        "m2m:cin": {
-            "pi": pi,
-            "ri": ri,
-            "ty": 4,
-            "ct": timestamp,
-            "st": random.randint(10000, 99999),
-            "rn": rn,
-            "lt": timestamp,
-            "et": expiry,
-            "lbl": ["string"],
-            "cs": len(str(content)),
-            "cr": f"SOriginAE-{uuid.uuid4().hex[:2].upper()}",
-            "con": str(content)
-        }
-    }
+# Helper function to get compiled parameter specs for a node
+def get_node_specs(node_id, snap=None):
+    return (snap or snapshots.current()).node_specs.get(node_id)
+
+# Helper function to generate random values for parameters.
+# Values are a pure function of (node, parameter, timestamp).
+def generate_random_data(node_id, specs, timestamp=None):
+    if timestamp is None:
+        timestamp = int(time.time())
+    return [str(value) for value in generate_values(specs, timestamp, KeyedNoise(node_id))]
+
+# Helper function to get the latest values of a node and their timestamp.
+# The history store answers when it holds the current point of its grid.
+def latest_values(node_id, specs, timestamp=None):
+    if timestamp is None:
+        timestamp = int(time.time())
+    if history_store is not None:
+        block = history_store.latest(node_id, specs, timestamp)
+        if block is not None:
+            return block.timestamp_values()[0], block.string_rows()[0]
+    return timestamp, generate_random_data(node_id, specs, timestamp)
+
+latest_cache = LatestReadingCache()
+
+# Helper function to build the encoded reading of a node for a sampling slot
+def build_reading(node_id, specs, slot):
+    timestamp, data = latest_values(node_id, specs, slot)
+    return create_response(data, timestamp)
+
+# Helper function to get the shared encoded reading of a node for the slot
+# containing `now`; a node that pushes readings gets its latest pushed one
+# while it is recent (see INGEST_READING_TTL)
+def cached_reading(node_id, specs, now=None):
+    if now is None:
+        now = int(time.time())
+    interval = sampling_interval(specs, LATEST_DEFAULT_INTERVAL)
+    pushed = ingest_store.latest_reading(node_id, specs, create_response, now - (INGEST_READING_TTL or interval))
+    if pushed is not None:
+        return pushed
+    slot = now - now % interval
+    return latest_cache.get(node_id, slot, specs, lambda: build_reading(node_id, specs, slot))
+
+# Builds the m2m:cin envelopes of dynamic responses
+envelopes = EnvelopeBuilder(EXPIRY_SECONDS)
+
+# Helper function to create response in the required format, rendered to JSON bytes
+def create_response(content, timestamp=None):
+    return envelopes.render(content, timestamp)
 
 @app.get("/descriptor")
 async def get_descriptor(node: str = Query(..., description="Node ID to get descriptor for")):
@@ -151,33 +242,236 @@ async def get_descriptor(node: str = Query(..., description="Node ID to get desc
     
     # Format the parameters as a descriptor
     descriptor = [param["parameter_name"] for param in parameters]
-    return create_response(descriptor)
+    return Response(content=create_response(descriptor), media_type="application/json")
 
 @app.get("/data")
 async def get_data(node: str = Query(..., description="Node ID to get data for")):
     """
     Get the latest data for a specific node.
-    Returns randomly generated data for the given node.
+    Returns the node's reading for the current sampling interval, shared by every caller in that interval.
     """
-    parameters = get_node_parameters(node)
-    if not parameters:
+    specs = get_node_specs(node)
+    if not specs:
         return JSONResponse(
             status_code=404,
             content={"detail": f"Node with ID {node} not found"}
         )
     
-    # Generate random data for the parameters
-    data = generate_random_data(parameters)
-    return create_response(data)
+    # One reading per sampling slot is generated (or read from the history
+    # store) and shared by every caller
+    return Response(content=cached_reading(node, specs), media_type="application/json")
 
-@app.get("/domains")
-async def get_domains():
+# Helper function to resolve the nodes of a batch request: explicit ids
+# and/or selectors, which are combined with AND.
+# Returns (node ids, unknown ids) or raises ValueError for a bad request.
+def select_batch_nodes(snap, nodes, domain_id, sensor_type_id, node_area):
+    registry = snap.registry
+    if nodes is None and domain_id is None and sensor_type_id is None and node_area is None:
+        raise ValueError("Give node ids or at least one of domain_id, sensor_type_id, node_area")
+    
+    selected = registry.select_nodes(domain=domain_id, sensor_type=sensor_type_id, area=node_area)
+    not_found = []
+    if nodes is not None:
+        wanted = []
+        seen = set()
+        for node_id in nodes:
+            if node_id in seen:
+                continue
+            seen.add(node_id)
+            if node_id in registry.nodes:
+                wanted.append(node_id)
+            else:
+                not_found.append(node_id)
+        if domain_id is None and sensor_type_id is None and node_area is None:
+            selected = wanted
+        else:
+            matching = frozenset(selected)
+            selected = [node_id for node_id in wanted if node_id in matching]
+    
+    if len(selected) > BATCH_MAX_NODES:
+        raise ValueError(f"Batch matches {len(selected)} nodes, more than the limit of {BATCH_MAX_NODES}")
+    return selected, not_found
+
+# Helper function to split a comma-separated id list
+def split_ids(value):
+    if value is None:
+        return None
+    return [part.strip() for part in value.split(",") if part.strip()]
+
+# Helper function to build the records of a batch as (node_id, record).
+# `build(node_id, specs, *args)` returns the encoded record of one node.
+def iter_batch_records(snap, node_ids, build, *args):
+    for node_id in node_ids:
+        specs = snap.node_specs.get(node_id)
+        if specs:
+            yield node_id, build(node_id, specs, *args)
+
+# Helper function to render a batch as one JSON document
+def render_batch(snap, node_ids, not_found, build, *args):
+    records = iter_batch_records(snap, node_ids, build, *args)
+    results = b",".join(encode_record(node_id) + b":" + record for node_id, record in records)
+    return b'{"results":{' + results + b'},"not_found":' + encode_record(not_found) + b"}"
+
+# Helper function to build the batch response for a list of nodes, off the
+# event loop and behind the batch gate. Batches are always built in this
+# process, whose latest_cache holds the one shared reading per sampling slot
+# (and pushed readings): with OFFLOAD_MODE=process they run in the threadpool.
+async def batch_response(request, snap, node_ids, not_found, stream, build, *args):
+    denied = await admit(request, batch_gate)
+    if denied is not None:
+        return denied
+    
+    if wants_stream(request, stream):
+        lines = (with_node_id(node_id, record) for node_id, record in iter_batch_records(snap, node_ids, build, *args))
+        chunks = iter(lambda: list(itertools.islice(lines, BATCH_STREAM_CHUNK)), [])
+        return StreamingResponse(release_after(ndjson_records(chunks), batch_gate), media_type=NDJSON_MEDIA_TYPE)
+    
+    try:
+        if OFFLOAD_MODE == "process":
+            body = await run_in_threadpool(render_batch, snap, node_ids, not_found, build, *args)
+        else:
+            body = await asyncio.get_running_loop().run_in_executor(
+                generation_executor(), functools.partial(render_batch, snap, node_ids, not_found, build, *args)
+            )
+    finally:
+        batch_gate.release()
+    return Response(content=body, media_type="application/json")
+
+# Request body of the POST batch endpoints
+class BatchRequest(BaseModel):
+    nodes: Optional[List[str]] = None
+    domain_id: Optional[str] = None
+    sensor_type_id: Optional[str] = None
+    node_area: Optional[str] = None
+
+# Helper function shared by the batch endpoints
+async def batch_endpoint(request, selection, stream, build, *args):
+    snap = snapshots.current()
+    try:
+        node_ids, not_found = select_batch_nodes(
+            snap, selection.nodes, selection.domain_id, selection.sensor_type_id, selection.node_area
+        )
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"detail": str(e)})
+    return await batch_response(request, snap, node_ids, not_found, stream, build, *args)
+
+# Helper function to build the latest reading record of one node in a batch
+def batch_reading(node_id, specs, timestamp):
+    return cached_reading(node_id, specs, timestamp)
+
+# Helper function to build the descriptor record of one node in a batch
+def node_descriptor(node_id, specs):
+    return create_response([spec.name for spec in specs])
+
+@app.get("/data/batch")
+async def get_data_batch(
+    request: Request,
+    nodes: Optional[str] = Query(None, description="Comma-separated node IDs"),
+    domain_id: Optional[str] = Query(None, description="Select the nodes of a domain"),
+    sensor_type_id: Optional[str] = Query(None, description="Select the nodes of a sensor type"),
+    node_area: Optional[str] = Query(None, description="Select the nodes in an area"),
+    stream: bool = Query(False, description="Stream one NDJSON record per node"),
+):
     """
-    Get a list of all available domains.
-    Returns information about all domains in the system.
+    Get the latest data for many nodes in one call.
+    Returns an m2m:cin reading per matching node, keyed by node ID, plus the IDs that were not found.
+    """
+    selection = BatchRequest(nodes=split_ids(nodes), domain_id=domain_id, sensor_type_id=sensor_type_id, node_area=node_area)
+    return await batch_endpoint(request, selection, stream, batch_reading, int(time.time()))
+
+@app.post("/data/batch")
+async def post_data_batch(request: Request, selection: BatchRequest, stream: bool = Query(False, description="Stream one NDJSON record per node")):
+    """
+    Get the latest data for many nodes in one call.
+    Same as GET /data/batch with the node IDs and selectors in the request body.
+    """
+    return await batch_endpoint(request, selection, stream, batch_reading, int(time.time()))
+
+@app.get("/descriptor/batch")
+async def get_descriptor_batch(
+    request: Request,
+    nodes: Optional[str] = Query(None, description="Comma-separated node IDs"),
+    domain_id: Optional[str] = Query(None, description="Select the nodes of a domain"),
+    sensor_type_id: Optional[str] = Query(None, description="Select the nodes of a sensor type"),
+    node_area: Optional[str] = Query(None, description="Select the nodes in an area"),
+    stream: bool = Query(False, description="Stream one NDJSON record per node"),
+):
+    """
+    Get the descriptors of many nodes in one call.
+    Returns an m2m:cin descriptor per matching node, keyed by node ID, plus the IDs that were not found.
+    """
+    selection = BatchRequest(nodes=split_ids(nodes), domain_id=domain_id, sensor_type_id=sensor_type_id, node_area=node_area)
+    return await batch_endpoint(request, selection, stream, node_descriptor)
+
+@app.post("/descriptor/batch")
+async def post_descriptor_batch(request: Request, selection: BatchRequest, stream: bool = Query(False, description="Stream one NDJSON record per node")):
+    """
+    Get the descriptors of many nodes in one call.
+    Same as GET /descriptor/batch with the node IDs and selectors in the request body.
+    """
+    return await batch_endpoint(request, selection, stream, node_descriptor)
+
+# Helper function to decode and store the instances of an ingest request body.
+# Returns the summary reported to the gateway.
+def ingest_instances(instances, snap):
+    now = int(time.time())
+    readings = []
+    positions = []
+    errors = []
+    for index, instance in enumerate(instances):
+        try:
+            readings.append(decode_instance(instance, snap.node_specs.get, now, INGEST_MAX_SKEW))
+            positions.append(index)
+        except IngestError as e:
+            errors.append((index, str(e)))
+    ingest_store.count_rejected(len(errors))
+    errors.extend((positions[index], detail) for index, detail in ingest_store.ingest(readings))
+    errors.sort()
+    return {
+        "accepted": len(instances) - len(errors),
+        "rejected": len(errors),
+        "errors": [{"index": index, "detail": detail} for index, detail in errors[:100]],
+    }
+
+@app.post("/ingest")
+async def ingest(request: Request):
+    """
+    Push m2m:cin content instances from devices or gateways.
+    Takes one {"node_id", "m2m:cin"} instance, a JSON array of them or NDJSON; con holds the node's values in parameter order (or by parameter name).
     """
+    body = await request.body()
+    try:
+        if NDJSON_MEDIA_TYPE in request.headers.get("content-type", ""):
+            instances = [json.loads(line) for line in body.splitlines() if line.strip()]
+        else:
+            instances = json.loads(body)
+    except ValueError:
+        return JSONResponse(status_code=400, content={"detail": "Body must be JSON or NDJSON"})
+    if not isinstance(instances, list):
+        instances = [instances]
+    if len(instances) > INGEST_MAX_BATCH:
+        return JSONResponse(
+            status_code=413,
+            content={"detail": f"At most {INGEST_MAX_BATCH} instances per request"}
+        )
+    
+    snap = snapshots.current()
+    return await run_in_threadpool(ingest_instances, instances, snap)
+
+@app.on_event("startup")
+async def start_ingest_flusher():
+    ingest_store.start_flushing()
+
+@app.on_event("shutdown")
+async def stop_ingest_flusher():
+    await run_in_threadpool(ingest_store.stop_flushing)
+
+# Helper functions to build the static topology responses.
+# They only depend on the configuration, so each is rendered to bytes once
+# per configuration snapshot and then served from its static cache.
+def build_domains_list(snap):
     domains_list = []
-    for domain in nodes_config["domains"]:
+    for domain in snap.config["domains"]:
         domains_list.append({
             "domain_id": domain["domain_id"],
             "domain_name": domain["domain_name"],
@@ -185,32 +479,11 @@ async def get_domains():
             "parameter_count": len(domain["parameters"]),
             "sensor_type_count": len(domain["sensor_types"])
         })
-    
     return domains_list
 
-@app.get("/domains/{domain_id}")
-async def get_domain(domain_id: str):
-    """
-    Get detailed information about a specific domain.
-    Returns domain information including parameters and sensor types.
-    """
-    for domain in nodes_config["domains"]:
-        if domain["domain_id"] == domain_id:
-            return domain
-    
-    return JSONResponse(
-        status_code=404,
-        content={"detail": f"Domain with ID {domain_id} not found"}
-    )
-
-@app.get("/sensor_types")
-async def get_sensor_types():
-    """
-    Get a list of all available sensor types.
-    Returns information about all sensor types in the system.
-    """
+def build_sensor_types_list(snap):
     sensor_types_list = []
-    for domain in nodes_config["domains"]:
+    for domain in snap.config["domains"]:
         for sensor_type in domain["sensor_types"]:
             sensor_types_list.append({
                 "sensor_type_id": sensor_type["sensor_type_id"],
@@ -220,36 +493,11 @@ async def get_sensor_types():
                 "parameter_count": len(sensor_type["parameters"]),
                 "node_count": len(sensor_type["nodes"])
             })
-    
     return sensor_types_list
 
-@app.get("/sensor_types/{sensor_type_id}")
-async def get_sensor_type(sensor_type_id: str):
-    """
-    Get detailed information about a specific sensor type.
-    Returns sensor type information including parameters and nodes.
-    """
-    for domain in nodes_config["domains"]:
-        for sensor_type in domain["sensor_types"]:
-            if sensor_type["sensor_type_id"] == sensor_type_id:
-                result = sensor_type.copy()
-                result["domain_id"] = domain["domain_id"]
-                result["domain_name"] = domain["domain_name"]
-                return result
-    
-    return JSONResponse(
-        status_code=404,
-        content={"detail": f"Sensor type with ID {sensor_type_id} not found"}
-    )
-
-@app.get("/nodes")
-async def get_nodes():
-    """
-    Get a list of all available nodes.
-    Returns information about all nodes in the system.
-    """
+def build_nodes_list(snap):
     nodes_list = []
-    for domain in nodes_config["domains"]:
+    for domain in snap.config["domains"]:
         for sensor_type in domain["sensor_types"]:
             for node in sensor_type["nodes"]:
                 nodes_list.append({
@@ -262,295 +510,1056 @@ async def get_nodes():
                     "node_area": node["node_area"],
                     "node_protocol": node["node_protocol"]
                 })
-    
     return nodes_list
 
-@app.get("/nodes/{node_id}")
-async def get_node(node_id: str):
-    """
-    Get detailed information about a specific node.
-    Returns node information including location and protocol details.
-    """
-    node_info = find_node(node_id)
-    if not node_info:
-        return JSONResponse(
-            status_code=404,
-            content={"detail": f"Node with ID {node_id} not found"}
-        )
-    
+def build_parameters_list(snap):
+    parameters_list = []
+    for domain in snap.config["domains"]:
+        for param in domain["parameters"]:
+            param_copy = param.copy()
+            param_copy["domain_id"] = domain["domain_id"]
+            param_copy["domain_name"] = domain["domain_name"]
+            parameters_list.append(param_copy)
+    return parameters_list
+
+def build_sensor_type_detail(snap, sensor_type_id):
+    sensor_type_info = snap.registry.find_sensor_type(sensor_type_id)
+    if sensor_type_info is None:
+        return None
+    result = sensor_type_info["sensor_type"].copy()
+    result["domain_id"] = sensor_type_info["domain"]["domain_id"]
+    result["domain_name"] = sensor_type_info["domain"]["domain_name"]
+    return result
+
+def build_node_detail(snap, node_id):
+    node_info = snap.registry.find_node(node_id)
+    if node_info is None:
+        return None
     result = node_info["node"].copy()
     result["domain_id"] = node_info["domain"]["domain_id"]
     result["domain_name"] = node_info["domain"]["domain_name"]
     result["sensor_type_id"] = node_info["sensor_type"]["sensor_type_id"]
     result["sensor_type_name"] = node_info["sensor_type"]["sensor_type_name"]
     result["parameters"] = node_info["sensor_type"]["parameters"]
-    
     return result
 
+# Helper function to add the coordinates of each node to its /nodes row
+def build_geo_rows(snap, nodes_list):
+    geo_rows = []
+    for row in nodes_list:
+        node = snap.registry.find_node(row["node_id"])["node"]
+        geo_rows.append(dict(
+            row, node_latitude=node.get("node_latitude"), node_longitude=node.get("node_longitude")
+        ))
+    return geo_rows
+
+# Helper function to pre-render the static list endpoints of a new snapshot
+# and index their rows for listing queries before it is published
+def warm_snapshot(snap):
+    sensor_types_list = build_sensor_types_list(snap)
+    nodes_list = build_nodes_list(snap)
+    parameters_list = build_parameters_list(snap)
+    snap.static_cache.warm({
+        "config": lambda: snap.config,
+        "domains": lambda: build_domains_list(snap),
+        "sensor_types": lambda: sensor_types_list,
+        "nodes": lambda: nodes_list,
+        "parameters": lambda: parameters_list,
+    })
+    snap.listings.update({
+        "sensor_types": Listing(sensor_types_list, ("domain_id",)),
+        "nodes": Listing(nodes_list, ("domain_id", "sensor_type_id", "node_area", "node_protocol")),
+        "parameters": Listing(parameters_list, ("domain_id", "data_type", "parameter_name")),
+    })
+    snap.geo = GeoIndex(build_geo_rows(snap, nodes_list))
+
+# Load the configuration snapshot; later versions are swapped in atomically
+snapshots = SnapshotManager(NODES_CONFIG_PATH, on_build=warm_snapshot, poll_interval=NODES_RELOAD_INTERVAL)
+snapshots.reload()
+
+@app.on_event("startup")
+async def start_config_watcher():
+    snapshots.start_watching()
+
+@app.on_event("shutdown")
+async def stop_config_watcher():
+    snapshots.stop_watching()
+
+# Helper function to serve a static response from a snapshot's cache, or a 404
+def cached_response(request, snap, key, build, not_found):
+    rendered = snap.static_cache.get(key, build)
+    if rendered is None:
+        return JSONResponse(status_code=404, content={"detail": not_found})
+    return serve(request, rendered, STATIC_CACHE_CONTROL)
+
+# Helper function to answer a list endpoint. Without query options the whole
+# list is served from the snapshot's static cache; otherwise the indexed rows
+# are filtered, sorted, paged and projected, with the total in X-Total-Count
+# and the next page's cursor in the X-Next-Cursor and Link headers. Rendered
+# pages are cached in listing_pages.
+def listing_response(request, snap, key, filters, fields, sort, limit, offset, cursor):
+    if all(value is None for value in filters.values()) and fields is None and sort is None \
+            and limit is None and offset is None and cursor is None:
+        return cached_response(request, snap, key, lambda: list(snap.listings[key].rows), None)
+    
+    listing = snap.listings[key]
+    fields = [field.strip() for field in fields.split(",") if field.strip()] if fields else None
+    subject = query_subject(key, filters, sort, fields)
+    try:
+        if cursor is not None:
+            offset = decode_listing_cursor(subject, cursor)
+        elif offset is None:
+            offset = 0
+        elif offset < 0:
+            raise ListingError("offset must not be negative")
+        if limit is None:
+            limit = LISTING_DEFAULT_LIMIT
+        elif limit < 1:
+            raise ListingError("limit must be positive")
+        limit = min(limit, LISTING_MAX_LIMIT)
+        cache_key = (snap.version, subject, offset, limit)
+        cached = listing_pages.get(cache_key)
+        if cached is None:
+            page = listing.query(filters, sort, fields, offset, limit)
+            cached = render_json(page.rows), (page.total, page.next_offset)
+            listing_pages.put(cache_key, *cached)
+    except ListingError as e:
+        return JSONResponse(status_code=400, content={"detail": str(e)})
+    
+    rendered, (total, next_offset) = cached
+    response = serve(request, rendered, STATIC_CACHE_CONTROL)
+    response.headers["X-Total-Count"] = str(total)
+    if next_offset is not None:
+        next_cursor = encode_listing_cursor(subject, next_offset)
+        next_url = request.url.remove_query_params(["offset", "cursor"]).include_query_params(cursor=next_cursor)
+        response.headers["X-Next-Cursor"] = next_cursor
+        response.headers["Link"] = f'<{next_url}>; rel="next"'
+    return response
+
+@app.get("/domains")
+async def get_domains(request: Request):
+    """
+    Get a list of all available domains.
+    Returns information about all domains in the system.
+    """
+    snap = snapshots.current()
+    return cached_response(request, snap, "domains", lambda: build_domains_list(snap), None)
+
+@app.get("/domains/{domain_id}")
+async def get_domain(request: Request, domain_id: str):
+    """
+    Get detailed information about a specific domain.
+    Returns domain information including parameters and sensor types.
+    """
+    snap = snapshots.current()
+    return cached_response(
+        request, snap, ("domain", domain_id), lambda: snap.registry.find_domain(domain_id),
+        f"Domain with ID {domain_id} not found"
+    )
+
+@app.get("/sensor_types")
+async def get_sensor_types(
+    request: Request,
+    domain_id: Optional[str] = Query(None, description="Only sensor types of this domain"),
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return"),
+    sort: Optional[str] = Query(None, description="Field to sort by, prefixed with - for descending"),
+    limit: Optional[int] = Query(None, description="Maximum number of rows in this page"),
+    offset: Optional[int] = Query(None, description="Number of rows to skip"),
+    cursor: Optional[str] = Query(None, description="Continuation cursor from X-Next-Cursor"),
+):
+    """
+    Get a list of all available sensor types.
+    Returns information about all sensor types in the system, optionally filtered, sorted and paged.
+    """
+    snap = snapshots.current()
+    return listing_response(
+        request, snap, "sensor_types", {"domain_id": domain_id}, fields, sort, limit, offset, cursor
+    )
+
+@app.get("/sensor_types/{sensor_type_id}")
+async def get_sensor_type(request: Request, sensor_type_id: str):
+    """
+    Get detailed information about a specific sensor type.
+    Returns sensor type information including parameters and nodes.
+    """
+    snap = snapshots.current()
+    return cached_response(
+        request, snap, ("sensor_type", sensor_type_id), lambda: build_sensor_type_detail(snap, sensor_type_id),
+        f"Sensor type with ID {sensor_type_id} not found"
+    )
+
+@app.get("/nodes")
+async def get_nodes(
+    request: Request,
+    domain_id: Optional[str] = Query(None, description="Only nodes of this domain"),
+    sensor_type_id: Optional[str] = Query(None, description="Only nodes of this sensor type"),
+    node_area: Optional[str] = Query(None, description="Only nodes in this area"),
+    node_protocol: Optional[str] = Query(None, description="Only nodes using this protocol"),
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return"),
+    sort: Optional[str] = Query(None, description="Field to sort by, prefixed with - for descending"),
+    limit: Optional[int] = Query(None, description="Maximum number of rows in this page"),
+    offset: Optional[int] = Query(None, description="Number of rows to skip"),
+    cursor: Optional[str] = Query(None, description="Continuation cursor from X-Next-Cursor"),
+):
+    """
+    Get a list of all available nodes.
+    Returns information about all nodes in the system, optionally filtered, sorted and paged.
+    """
+    snap = snapshots.current()
+    filters = {
+        "domain_id": domain_id, "sensor_type_id": sensor_type_id,
+        "node_area": node_area, "node_protocol": node_protocol,
+    }
+    return listing_response(request, snap, "nodes", filters, fields, sort, limit, offset, cursor)
+
+# Helper function to render spatial query results, each optionally joined
+# with the node's latest reading (as /data returns it)
+def geo_response(snap, rows, readings, total):
+    def render():
+        records = []
+        for row in rows:
+            record = encode_record(row)
+            specs = snap.node_specs.get(row["node_id"]) if readings else None
+            if specs:
+                record = record[:-1] + b',"reading":' + cached_reading(row["node_id"], specs) + b"}"
+            records.append(record)
+        return Response(
+            content=b"[" + b",".join(records) + b"]", media_type="application/json",
+            headers={"X-Total-Count": str(total)}
+        )
+    return render
+
+@app.get("/nodes/within")
+async def get_nodes_within(
+    min_lat: float = Query(..., ge=-90, le=90, description="South edge of the bounding box"),
+    min_lon: float = Query(..., ge=-180, le=180, description="West edge (greater than max_lon to cross the antimeridian)"),
+    max_lat: float = Query(..., ge=-90, le=90, description="North edge of the bounding box"),
+    max_lon: float = Query(..., ge=-180, le=180, description="East edge of the bounding box"),
+    limit: Optional[int] = Query(None, ge=1, description="Maximum number of nodes to return"),
+    readings: bool = Query(False, description="Include each node's latest reading"),
+):
+    """
+    Get the nodes inside a bounding box.
+    Returns /nodes rows with coordinates, optionally with each node's latest reading.
+    """
+    if min_lat > max_lat:
+        return JSONResponse(status_code=400, content={"detail": "min_lat must not exceed max_lat"})
+    snap = snapshots.current()
+    positions = snap.geo.within(min_lat, min_lon, max_lat, max_lon)
+    limit = min(limit or LISTING_DEFAULT_LIMIT, LISTING_MAX_LIMIT)
+    rows = [snap.geo.rows[position] for position in positions[:limit]]
+    render = geo_response(snap, rows, readings, len(positions))
+    return await run_in_threadpool(render) if readings else render()
+
+@app.get("/nodes/nearest")
+async def get_nearest_nodes(
+    lat: float = Query(..., ge=-90, le=90, description="Latitude of the reference point"),
+    lon: float = Query(..., ge=-180, le=180, description="Longitude of the reference point"),
+    k: int = Query(10, ge=1, description="Number of nodes to return"),
+    max_distance_km: Optional[float] = Query(None, ge=0, description="Only nodes within this distance"),
+    readings: bool = Query(False, description="Include each node's latest reading"),
+):
+    """
+    Get the nodes nearest to a point.
+    Returns /nodes rows with coordinates and distance_km, nearest first, optionally with each node's latest reading.
+    """
+    snap = snapshots.current()
+    nearest = snap.geo.nearest(lat, lon, min(k, LISTING_MAX_LIMIT), max_distance_km)
+    rows = [dict(snap.geo.rows[position], distance_km=round(distance, 3)) for position, distance in nearest]
+    render = geo_response(snap, rows, readings, len(rows))
+    return await run_in_threadpool(render) if readings else render()
+
+@app.get("/nodes/{node_id}")
+async def get_node(request: Request, node_id: str):
+    """
+    Get detailed information about a specific node.
+    Returns node information including location and protocol details.
+    """
+    snap = snapshots.current()
+    return cached_response(
+        request, snap, ("node", node_id), lambda: build_node_detail(snap, node_id),
+        f"Node with ID {node_id} not found"
+    )
+
 @app.get("/parameters")
-async def get_parameters():
+async def get_parameters(
+    request: Request,
+    domain_id: Optional[str] = Query(None, description="Only parameters of this domain"),
+    data_type: Optional[str] = Query(None, description="Only parameters of this data type"),
+    parameter_name: Optional[str] = Query(None, description="Only parameters with this name"),
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return"),
+    sort: Optional[str] = Query(None, description="Field to sort by, prefixed with - for descending"),
+    limit: Optional[int] = Query(None, description="Maximum number of rows in this page"),
+    offset: Optional[int] = Query(None, description="Number of rows to skip"),
+    cursor: Optional[str] = Query(None, description="Continuation cursor from X-Next-Cursor"),
+):
     """
     Get a list of all available parameters across all domains.
-    Returns information about all parameters in the system.
+    Returns information about all parameters in the system, optionally filtered, sorted and paged.
     """
-    parameters_list = []
-    for domain in nodes_config["domains"]:
-        for param in domain["parameters"]:
-            param_copy = param.copy()
-            param_copy["domain_id"] = domain["domain_id"]
-            param_copy["domain_name"] = domain["domain_name"]
-            parameters_list.append(param_copy)
-    
-    return parameters_list
+    snap = snapshots.current()
+    filters = {"domain_id": domain_id, "data_type": data_type, "parameter_name": parameter_name}
+    return listing_response(request, snap, "parameters", filters, fields, sort, limit, offset, cursor)
 
 @app.get("/domains/{domain_id}/parameters")
-async def get_domain_parameters(domain_id: str):
+async def get_domain_parameters(request: Request, domain_id: str):
     """
     Get parameters for a specific domain.
     Returns all parameters defined for the given domain.
     """
-    for domain in nodes_config["domains"]:
-        if domain["domain_id"] == domain_id:
-            return domain["parameters"]
-    
-    return JSONResponse(
-        status_code=404,
-        content={"detail": f"Domain with ID {domain_id} not found"}
+    snap = snapshots.current()
+    domain = snap.registry.find_domain(domain_id)
+    return cached_response(
+        request, snap, ("domain_parameters", domain_id), lambda: domain["parameters"] if domain else None,
+        f"Domain with ID {domain_id} not found"
     )
 
 @app.get("/sensor_types/{sensor_type_id}/nodes")
-async def get_sensor_type_nodes(sensor_type_id: str):
+async def get_sensor_type_nodes(request: Request, sensor_type_id: str):
     """
     Get nodes for a specific sensor type.
     Returns all nodes associated with the given sensor type.
     """
-    for domain in nodes_config["domains"]:
-        for sensor_type in domain["sensor_types"]:
-            if sensor_type["sensor_type_id"] == sensor_type_id:
-                return sensor_type["nodes"]
-    
-    return JSONResponse(
-        status_code=404,
-        content={"detail": f"Sensor type with ID {sensor_type_id} not found"}
+    snap = snapshots.current()
+    sensor_type_info = snap.registry.find_sensor_type(sensor_type_id)
+    return cached_response(
+        request, snap, ("sensor_type_nodes", sensor_type_id),
+        lambda: sensor_type_info["sensor_type"]["nodes"] if sensor_type_info else None,
+        f"Sensor type with ID {sensor_type_id} not found"
     )
 
 @app.get("/config")
-async def get_full_config():
+async def get_full_config(request: Request):
     """
     Get the complete configuration information.
     Returns the entire JSON structure with all domains, sensor types, nodes, and parameters.
     """
-    return nodes_config
+    snap = snapshots.current()
+    return cached_response(request, snap, "config", lambda: snap.config, None)
 
 @app.get("/get-all")
-async def get_all():
+async def get_all(request: Request):
     """
     Get the complete configuration in a single response.
     Returns the entire JSON structure with all domains, sensor types, nodes, and parameters.
     Similar to /config endpoint but with a different route name.
     """
-    return nodes_config
+    snap = snapshots.current()
+    return cached_response(request, snap, "config", lambda: snap.config, None)
+
+# Helper function to get blocks of a node's history on a time grid: pushed
+# readings where the node has them, else the history store or synthesis
+def iter_node_blocks(node, specs, start, interval, count, chunk):
+    blocks = iter_blocks(history_store, node, specs, start, interval, count, chunk)
+    window = ingest_store.window(node, specs, sampling_interval(specs, LATEST_DEFAULT_INTERVAL))
+    if window is not None:
+        blocks = (window.overlay(block, interval) for block in blocks)
+    return timed("generation", blocks)
+
+# Helper function to build m2m:cin history points for a node on a time grid,
+# from the history store where it covers the range.
+# Yields lists of at most `chunk` points so callers can stream large ranges.
+def iter_history_points(node, specs, start, interval, count, chunk=HISTORY_CHUNK):
+    for block in iter_node_blocks(node, specs, start, interval, count, chunk):
+        timestamps = block.timestamp_values()
+        created = format_timestamps(timestamps)
+        expires = format_timestamps([ts + EXPIRY_SECONDS for ts in timestamps])
+        
+        data_points = []
+        
+        for timestamp, expiry, values in zip(created, expires, block.string_rows()):
+            # Generate consistent IDs for the same node and timestamp
+            ids = resource_ids(node, timestamp)
+            
+            data_point = {
+                "m2m:cin": {
+                    "pi": ids["pi"],
+                    "ri": ids["ri"],
+                    "ty": 4,
+                    "ct": timestamp,
+                    "st": ids["st"],
+                    "rn": ids["rn"],
+                    "lt": timestamp,
+                    "et": expiry,
+                    "lbl": ["historical"],
+                    "cs": len(str(values)),
+                    "cr": ids["cr"],
+                    "con": str(values)
+                }
+            }
+            
+            data_points.append(data_point)
+        
+        yield data_points
+
+# Helper function to render a record as JSONResponse would
+def encode_record(record):
+    return json.dumps(record, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+# Helper function to render `count` history points of a node, from point
+# `first` of the interval grid on, as encoded m2m:cin records
+def render_history_records(node, specs, first, count, interval):
+    with phase("serialization"):
+        return [
+            encode_record(point)
+            for points in timed("envelope", iter_history_points(node, specs, first * interval, interval, count))
+            for point in points
+        ]
+
+# Helper function to get a node's history points as encoded m2m:cin records.
+# Points are grouped in blocks of HISTORY_CACHE_BLOCK on the global interval
+# grid; cached points are reused and only the missing edges of a block's
+# cached run are generated, so a cold request costs no more than its points.
+# Yields lists of records in time order.
+def iter_history_records(node, specs, start, interval, count):
+    # History of nodes that push readings changes with every push
+    if not history_cache.enabled or ingest_store.has(node, specs):
+        for points in timed("envelope", iter_history_points(node, specs, start, interval, count)):
+            with phase("serialization"):
+                records = [encode_record(point) for point in points]
+            yield records
+        return
+    first = start // interval
+    for block in range(first // HISTORY_CACHE_BLOCK, (first + count - 1) // HISTORY_CACHE_BLOCK + 1):
+        block_first = block * HISTORY_CACHE_BLOCK
+        # Points [lo, hi) of this block are requested
+        lo = max(first, block_first) - block_first
+        hi = min(first + count, block_first + HISTORY_CACHE_BLOCK) - block_first
+        key = (node, interval, block)
+        with phase("lookup"):
+            cached = history_cache.get(key, specs)
+        if cached is None or cached[0] > hi or cached[0] + len(cached[1]) < lo:
+            # Nothing cached next to the requested points
+            cached_first, records = lo, render_history_records(node, specs, block_first + lo, hi - lo, interval)
+            history_cache.put(key, specs, records, cached_first)
+        else:
+            cached_first, records = cached
+            cached_last = cached_first + len(records)
+            if lo < cached_first or hi > cached_last:
+                head = render_history_records(node, specs, block_first + lo, cached_first - lo, interval) if lo < cached_first else []
+                tail = render_history_records(node, specs, block_first + cached_last, hi - cached_last, interval) if hi > cached_last else []
+                cached_first, records = min(lo, cached_first), head + records + tail
+                history_cache.put(key, specs, records, cached_first)
+        yield records[lo - cached_first:hi - cached_first]
+
+# Helper function to render chunks of encoded records as newline-delimited JSON
+def ndjson_records(chunks):
+    for records in chunks:
+        yield b"".join(record + b"\n" for record in records)
+
+# Helper function to tell whether a request asked for a streamed response
+def wants_stream(request, stream):
+    return stream or NDJSON_MEDIA_TYPE in request.headers.get("accept", "")
+
+# Helper function to render history of nodes as CSV chunks.
+# Columns match data_generator.save_to_csv: timestamp followed by parameter
+# names. With `node_column` a leading node_id column is added and `columns`
+# is the union of parameter names, so several nodes can share one file.
+def iter_csv_chunks(nodes, columns, start, interval, count, node_column=False, chunk=HISTORY_CHUNK):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow((["node_id"] if node_column else []) + ["timestamp"] + list(columns))
+    positions = {name: index for index, name in enumerate(columns)}
+    
+    for node_id, specs in nodes:
+        slots = [positions[spec.name] for spec in specs]
+        for block in iter_node_blocks(node_id, specs, start, interval, count, chunk):
+            timestamps = format_timestamps(block.timestamp_values(), CSV_TIME_FORMAT)
+            for timestamp, values in zip(timestamps, block.rows()):
+                row = [""] * len(columns)
+                for slot, value in zip(slots, values):
+                    row[slot] = value
+                writer.writerow(([node_id] if node_column else []) + [timestamp] + row)
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    
+    tail = buffer.getvalue()
+    if tail:
+        yield tail.encode("utf-8")
+
+# Helper function to admit an expensive request: the client's rate limit
+# first, then the endpoint's gate. Returns the error response of a shed
+# request, or None once the caller holds a slot it must release.
+async def admit(request, gate):
+    if client_limiter is not None:
+        wait = client_limiter.check(request.client.host if request.client else None)
+        if wait:
+            return JSONResponse(
+                status_code=429,
+                content={"detail": "Rate limit exceeded"},
+                headers={"Retry-After": str(max(1, int(wait + 0.999)))}
+            )
+    try:
+        await gate.acquire()
+    except Overloaded as e:
+        return JSONResponse(status_code=503, content={"detail": str(e)}, headers={"Retry-After": str(e.retry_after)})
+    return None
+
+# Helper function to stream a sync iterator, releasing the gate slot once it is done
+async def release_after(chunks, gate):
+    try:
+        async for chunk in iterate_in_threadpool(chunks):
+            yield chunk
+    finally:
+        gate.release()
+
+# Helper function to get the generation pool, created on first use
+def generation_executor():
+    global generation_pool
+    if generation_pool is None:
+        generation_pool = create_executor(OFFLOAD_MODE, OFFLOAD_WORKERS)
+    return generation_pool
+
+# Helper function to run `fn(node, specs, *args)` on the generation pool.
+# Worker processes look the specs up in their own copy of the configuration;
+# nodes with pushed readings and profiled requests are served from this
+# process, which holds their readings and profile.
+async def offload(fn, snap, node, specs, *args):
+    loop = asyncio.get_running_loop()
+    profiled = current_profile.get() is not None
+    if OFFLOAD_MODE == "process":
+        if profiled or ingest_store.has(node, specs):
+            return await run_in_threadpool(fn, node, specs, *args)
+        return await loop.run_in_executor(generation_executor(), call_in_worker, snap.digest, fn, node, *args)
+    call = functools.partial(fn, node, specs, *args)
+    if profiled:
+        call = functools.partial(contextvars.copy_context().run, call)
+    return await loop.run_in_executor(generation_executor(), call)
+
+# Helper function to run generation work in a worker process, against the
+# same configuration as the process that sent it
+def call_in_worker(digest, fn, node, *args):
+    snap = snapshots.current()
+    if snap.digest != digest:
+        snap, _ = snapshots.reload()
+    return fn(node, snap.node_specs.get(node), *args)
+
+# Helper function to render a page of a node's history as a JSON array
+def render_history_page(node, specs, start, interval, count):
+    records = itertools.chain.from_iterable(iter_history_records(node, specs, start, interval, count))
+    with phase("serialization"):
+        return b"[" + b",".join(records) + b"]"
+
+# Helper function to start profiling a request if it asks for a profile and
+# may have one, or is sampled; returns the profile or None
+def start_profile(request, route):
+    flag = request.headers.get("x-profile") or request.query_params.get("profile")
+    requested = (
+        PROFILE_REQUESTS and flag not in (None, "", "0", "false")
+        and (not ADMIN_TOKEN or has_admin_token(request))
+    )
+    return profiler.start(route, requested)
+
+# Decorator profiling an endpoint (see start_profile), which must take the
+# request as `request`. Streamed responses are produced after the endpoint
+# returns, so they are not profiled.
+def profiled(route):
+    def decorate(endpoint):
+        @functools.wraps(endpoint)
+        async def wrapper(*args, **kwargs):
+            profile = start_profile(kwargs["request"], route)
+            if profile is None:
+                return await endpoint(*args, **kwargs)
+            token = current_profile.set(profile)
+            try:
+                response = await endpoint(*args, **kwargs)
+            finally:
+                current_profile.reset(token)
+            if isinstance(response, StreamingResponse):
+                return response
+            profiler.record(profile)
+            if not profile.sampled:
+                response.headers["Server-Timing"] = profile.server_timing()
+            return response
+        return wrapper
+    return decorate
 
 @app.get("/get-all-data")
-async def get_all_data(node: str = Query(..., description="Node ID to get historical data for")):
+@profiled("/get-all-data")
+async def get_all_data(
+    request: Request,
+    node: str = Query(..., description="Node ID to get historical data for"),
+    start: Optional[str] = Query(None, description="Range start (epoch seconds, ISO 8601 or YYYYMMDDTHHMMSS)"),
+    end: Optional[str] = Query(None, description="Range end, inclusive (defaults to now)"),
+    interval: Optional[str] = Query(None, description="Point spacing, e.g. 60, 15m, 6h, 1d"),
+    limit: Optional[int] = Query(None, description="Maximum number of points in this page"),
+    cursor: Optional[str] = Query(None, description="Continuation cursor from X-Next-Cursor"),
+    cra: Optional[str] = Query(None, description="oneM2M createdAfter (exclusive range start)"),
+    crb: Optional[str] = Query(None, description="oneM2M createdBefore (exclusive range end)"),
+    lim: Optional[int] = Query(None, description="oneM2M limit, alias of limit"),
+    stream: bool = Query(False, description="Stream all points as NDJSON instead of one JSON page"),
+):
     """
-    Get one week of historical data for a specific node.
-    Returns data points for the last week, with each point having the m2m:cin format.
+    Get historical data for a specific node.
+    Returns data points on an interval grid (by default the last week at 6-hour steps), each in the m2m:cin format.
+    Large ranges are paged; the next page's cursor is returned in the X-Next-Cursor and Link headers.
+    With ?stream=1 or Accept: application/x-ndjson the whole range is streamed, one record per line.
     """
-    parameters = get_node_parameters(node)
-    if not parameters:
+    with phase("lookup"):
+        specs = get_node_specs(node)
+    if not specs:
         return JSONResponse(
             status_code=404,
             content={"detail": f"Node with ID {node} not found"}
         )
     
-    # Generate data for one week with 6-hour intervals (28 data points)
-    end_time = datetime.now()
-    start_time = end_time - timedelta(days=7)
-    current_time = start_time
+    streaming = wants_stream(request, stream)
+    try:
+        with phase("lookup"):
+            query = resolve_range(
+                node, int(time.time()), HISTORY_DEFAULT_SPAN, HISTORY_DEFAULT_INTERVAL,
+                HISTORY_MAX_STREAM if streaming else HISTORY_MAX_PAGE,
+                start=start, end=end, interval=interval, limit=limit, cursor=cursor, cra=cra, crb=crb, lim=lim,
+            )
+    except TimeQueryError as e:
+        return JSONResponse(status_code=400, content={"detail": str(e)})
     
-    data_points = []
+    denied = await admit(request, history_gate)
+    if denied is not None:
+        return denied
     
-    while current_time <= end_time:
-        # Create a seed based on the timestamp to ensure consistent values for the same time
-        seed = int(current_time.timestamp())
-        random.seed(seed)
-        
-        # Generate data for this timestamp
-        values = []
-        for param in parameters:
-            if param["data_type"] == "float":
-                # Extract numeric part from resolution
-                resolution_str = param["resolution"]
-                decimal_places = 1  # default
-                if "." in resolution_str:
-                    parts = resolution_str.split(".")
-                    if len(parts) > 1 and len(parts[1]) > 0:
-                        num_str = ""
-                        for char in parts[1]:
-                            if char.isdigit():
-                                num_str += char
-                            else:
-                                break
-                        if num_str:
-                            decimal_places = len(num_str)
-                
-                # Extract numeric part from accuracy for range
-                accuracy_str = param["accuracy"]
-                range_val = 1.0  # default
-                for part in accuracy_str.split():
-                    if part.startswith("±"):
-                        num_str = ""
-                        for char in part[1:]:
-                            if char.isdigit() or char == '.':
-                                num_str += char
-                            else:
-                                break
-                        if num_str:
-                            range_val = float(num_str)
-                        break
-                
-                # Generate a value with realistic patterns based on time
-                hour = current_time.hour
-                day_of_year = current_time.timetuple().tm_yday
-                
-                # Base value with appropriate patterns
-                base_value = 0
-                if "Temperature" in param["parameter_name"]:
-                    # Daily variation (higher during day, lower at night)
-                    base_value = 20 + 7 * (1 - abs(hour - 12) / 12)
-                    # Seasonal variation (simplified)
-                    seasonal_factor = 0.5 * (1 + (day_of_year % 365) / 365 * 2 - 1)
-                    base_value += seasonal_factor * 5
-                elif "Humidity" in param["parameter_name"] or "Relative Humidity" in param["parameter_name"]:
-                    # Inverse to temperature - higher at night, lower during day
-                    base_value = 60 - 20 * (1 - abs(hour - 12) / 12)
-                elif "PM2.5" in param["parameter_name"] or "PM10" in param["parameter_name"]:
-                    # Higher during rush hours
-                    rush_hour_factor = max(0, 1 - min(abs(hour - 8), abs(hour - 18)) / 4)
-                    base_value = 15 + rush_hour_factor * 30
-                elif "CO" in param["parameter_name"]:
-                    # Higher during rush hours
-                    rush_hour_factor = max(0, 1 - min(abs(hour - 8), abs(hour - 18)) / 4)
-                    base_value = 0.5 + rush_hour_factor * 1.0
-                elif "NO2" in param["parameter_name"]:
-                    # Higher during rush hours
-                    rush_hour_factor = max(0, 1 - min(abs(hour - 8), abs(hour - 18)) / 4)
-                    base_value = 0.02 + rush_hour_factor * 0.05
-                elif "pH" in param["parameter_name"]:
-                    base_value = 7.0 + random.uniform(-0.5, 0.5)
-                elif "Turbidity" in param["parameter_name"]:
-                    # Check if it's a "rainy day" (using a hash of the day)
-                    is_rainy = (hash(f"{current_time.day}-{current_time.month}") % 7) < 2
-                    base_value = 2.0 + (5.0 if is_rainy else 0)
-                elif "Dissolved Oxygen" in param["parameter_name"]:
-                    # Temperature affects dissolved oxygen (inverse relationship)
-                    temp = 20 + 7 * (1 - abs(hour - 12) / 12)
-                    base_value = 14 - temp * 0.3
-                    if base_value < 4:
-                        base_value = 4
-                elif "TDS" in param["parameter_name"]:
-                    # Slight daily variation
-                    base_value = 250 + random.uniform(-20, 20) + 15 * (1 - abs(hour - 12) / 12)
-                elif "AQI" in param["parameter_name"]:
-                    # Correlates with pollution patterns
-                    rush_hour_factor = max(0, 1 - min(abs(hour - 8), abs(hour - 18)) / 4)
-                    base_value = 60 + rush_hour_factor * 50
-                else:
-                    base_value = random.uniform(0, 100)
-                
-                # Add some random noise within the accuracy range
-                value = round(base_value + random.uniform(-range_val, range_val), decimal_places)
-                values.append(str(value))
-            elif param["data_type"] == "integer":
-                # For integer type parameters (like AQI)
-                base_value = 0
-                if "AQI" in param["parameter_name"]:
-                    # Correlates with pollution patterns
-                    rush_hour_factor = max(0, 1 - min(abs(hour - 8), abs(hour - 18)) / 4)
-                    base_value = 60 + int(rush_hour_factor * 50)
-                elif "Data Interval" in param["parameter_name"]:
-                    base_value = 60  # 60 seconds default
-                else:
-                    base_value = random.randint(0, 100)
-                
-                values.append(str(base_value))
-            elif param["data_type"] == "string":
-                # For string type parameters (like AQL)
-                if "AQL" in param["parameter_name"]:
-                    aqi = 0
-                    # Use the AQI value if we've already calculated it
-                    for p, v in zip(parameters, values):
-                        if "AQI" in p["parameter_name"]:
-                            try:
-                                aqi = int(float(v))
-                                break
-                            except:
-                                pass
-                    
-                    # If no AQI was found, calculate a simulated one
-                    if aqi == 0:
-                        rush_hour_factor = max(0, 1 - min(abs(hour - 8), abs(hour - 18)) / 4)
-                        aqi = 60 + int(rush_hour_factor * 50)
-                    
-                    # Determine AQL based on AQI
-                    if aqi <= 50:
-                        aql = "Good"
-                    elif aqi <= 100:
-                        aql = "Moderate"
-                    elif aqi <= 150:
-                        aql = "Unhealthy for Sensitive Groups"
-                    elif aqi <= 200:
-                        aql = "Unhealthy"
-                    elif aqi <= 300:
-                        aql = "Very Unhealthy"
-                    else:
-                        aql = "Hazardous"
-                    
-                    values.append(aql)
-                elif "AQI-MP" in param["parameter_name"]:
-                    # Main pollutant - pick one randomly with higher chance for common ones
-                    pollutants = ["PM2.5", "PM10", "NO2", "O3", "CO", "SO2"]
-                    weights = [0.4, 0.25, 0.15, 0.1, 0.05, 0.05]
-                    mp = random.choices(pollutants, weights=weights, k=1)[0]
-                    values.append(mp)
-                else:
-                    values.append("Unknown")
-        
-        # Reset the random seed to ensure other operations aren't affected
-        random.seed()
-        
-        # Create a m2m:cin response for this data point
-        timestamp = current_time.strftime("%Y%m%dT%H%M%S")
-        expiry = (current_time + timedelta(days=730)).strftime("%Y%m%dT%H%M%S")
-        
-        # Generate consistent IDs for the same timestamp
-        hash_base = f"{node}-{timestamp}"
-        pi = f"3-{abs(hash(hash_base + 'pi')) % 90000000000000000000 + 10000000000000000000}"
-        ri = f"4-{abs(hash(hash_base + 'ri')) % 90000000000000000000 + 10000000000000000000}"
-        rn = f"4-{abs(hash(hash_base + 'rn')) % 90000000000000000 + 10000000000000000}"
-        
-        data_point = {
-            "m2m:cin": {
-                "pi": pi,
-                "ri": ri,
-                "ty": 4,
-                "ct": timestamp,
-                "st": abs(hash(hash_base + 'st')) % 90000 + 10000,
-                "rn": rn,
-                "lt": timestamp,
-                "et": expiry,
-                "lbl": ["historical"],
-                "cs": len(str(values)),
-                "cr": f"SOriginAE-{hash(hash_base + 'cr') % 256:02X}",
-                "con": str(values)
-            }
-        }
-        
-        data_points.append(data_point)
-        current_time += timedelta(hours=6)  # 6-hour intervals
+    if streaming:
+        # Records are generated chunk by chunk as the client reads them
+        chunks = iter_history_records(node, specs, query.start, query.interval, query.count)
+        return StreamingResponse(release_after(ndjson_records(chunks), history_gate), media_type=NDJSON_MEDIA_TYPE)
+    
+    # Only the points of this page are generated (or taken from the cache)
+    try:
+        body = await offload(
+            render_history_page, snapshots.current(), node, specs, query.start, query.interval, query.count
+        )
+    finally:
+        history_gate.release()
+    
+    headers = {}
+    next_cursor = query.next_cursor(node)
+    if next_cursor is not None:
+        next_url = request.url.remove_query_params(
+            ["start", "end", "interval", "cursor", "cra", "crb", "lim"]
+        ).include_query_params(cursor=next_cursor)
+        headers["X-Next-Cursor"] = next_cursor
+        headers["Link"] = f'<{next_url}>; rel="next"'
+    
+    return Response(content=body, media_type="application/json", headers=headers)
+
+# Helper function to resolve the time range of a CSV export
+def resolve_export_range(subject, start, end, interval):
+    return resolve_range(
+        subject, int(time.time()), HISTORY_DEFAULT_SPAN, EXPORT_DEFAULT_INTERVAL, HISTORY_MAX_STREAM,
+        start=start, end=end, interval=interval,
+    )
+
+@app.get("/nodes/{node_id}/export.csv")
+async def export_node_csv(
+    request: Request,
+    node_id: str,
+    start: Optional[str] = Query(None, description="Range start (epoch seconds, ISO 8601 or YYYYMMDDTHHMMSS)"),
+    end: Optional[str] = Query(None, description="Range end, inclusive (defaults to now)"),
+    interval: Optional[str] = Query(None, description="Point spacing, e.g. 60, 15m, 6h, 1d"),
+):
+    """
+    Export historical data for a specific node as CSV.
+    Streams the same columns as the data generator's CSV files (by default the last week at 15-minute steps).
+    """
+    specs = get_node_specs(node_id)
+    if not specs:
+        return JSONResponse(
+            status_code=404,
+            content={"detail": f"Node with ID {node_id} not found"}
+        )
+    
+    try:
+        query = resolve_export_range(node_id, start, end, interval)
+    except TimeQueryError as e:
+        return JSONResponse(status_code=400, content={"detail": str(e)})
+    
+    chunks = iter_csv_chunks(
+        [(node_id, specs)], [spec.name for spec in specs], query.start, query.interval, query.count
+    )
+    denied = await admit(request, export_gate)
+    if denied is not None:
+        return denied
+    return StreamingResponse(
+        release_after(chunks, export_gate),
+        media_type="text/csv",
+        headers={"Content-Disposition": f'attachment; filename="{node_id}_historical_data.csv"'}
+    )
+
+@app.get("/domains/{domain_id}/export.csv")
+async def export_domain_csv(
+    request: Request,
+    domain_id: str,
+    start: Optional[str] = Query(None, description="Range start (epoch seconds, ISO 8601 or YYYYMMDDTHHMMSS)"),
+    end: Optional[str] = Query(None, description="Range end, inclusive (defaults to now)"),
+    interval: Optional[str] = Query(None, description="Point spacing, e.g. 60, 15m, 6h, 1d"),
+):
+    """
+    Export historical data for every node of a domain as one CSV.
+    Rows carry a node_id column; parameter columns are the domain's parameters, empty where a node lacks one.
+    """
+    snap = snapshots.current()
+    domain = snap.registry.find_domain(domain_id)
+    if domain is None:
+        return JSONResponse(
+            status_code=404,
+            content={"detail": f"Domain with ID {domain_id} not found"}
+        )
+    
+    try:
+        query = resolve_export_range(domain_id, start, end, interval)
+    except TimeQueryError as e:
+        return JSONResponse(status_code=400, content={"detail": str(e)})
+    
+    nodes = []
+    columns = [param["parameter_name"] for param in domain["parameters"]]
+    for sensor_type in domain["sensor_types"]:
+        for node in sensor_type["nodes"]:
+            specs = get_node_specs(node["node_id"], snap)
+            if specs:
+                nodes.append((node["node_id"], specs))
+                columns.extend(spec.name for spec in specs if spec.name not in columns)
+    
+    chunks = iter_csv_chunks(nodes, columns, query.start, query.interval, query.count, node_column=True)
+    denied = await admit(request, export_gate)
+    if denied is not None:
+        return denied
+    return StreamingResponse(
+        release_after(chunks, export_gate),
+        media_type="text/csv",
+        headers={"Content-Disposition": f'attachment; filename="{domain_id}_historical_data.csv"'}
+    )
+
+# Helper function to roll up a node's history into buckets in one streaming pass
+def aggregate_history(node, specs, indexes, start, interval, count, bucket):
+    aggregator = BucketAggregator(specs, indexes, bucket)
+    for block in iter_node_blocks(node, specs, start, interval, count, AGGREGATE_CHUNK):
+        aggregator.add(block)
+    return aggregator.results()
+
+@app.get("/nodes/{node_id}/aggregate")
+async def aggregate_node_data(
+    request: Request,
+    node_id: str,
+    parameters: Optional[str] = Query(None, description="Comma-separated parameter names (defaults to all)"),
+    start: Optional[str] = Query(None, description="Range start (epoch seconds, ISO 8601 or YYYYMMDDTHHMMSS)"),
+    end: Optional[str] = Query(None, description="Range end, inclusive (defaults to now)"),
+    bucket: str = Query("1h", description="Bucket size, e.g. 15m, 1h, 1d"),
+    interval: Optional[str] = Query(None, description="Spacing of the raw points (defaults to the node's Data Interval)"),
+):
+    """
+    Get per-bucket rollups of a node's historical data.
+    Numeric parameters report min/max/mean/last and string parameters mode/last, for buckets aligned to the epoch (by default hourly over the last week).
+    """
+    specs = get_node_specs(node_id)
+    if not specs:
+        return JSONResponse(
+            status_code=404,
+            content={"detail": f"Node with ID {node_id} not found"}
+        )
     
-    return data_points
+    names = split_ids(parameters)
+    if names:
+        positions = {spec.name: index for index, spec in enumerate(specs)}
+        unknown = [name for name in names if name not in positions]
+        if unknown:
+            return JSONResponse(status_code=400, content={"detail": f"Unknown parameters: {', '.join(unknown)}"})
+        indexes = [positions[name] for name in dict.fromkeys(names)]
+    else:
+        indexes = list(range(len(specs)))
+    
+    try:
+        bucket_seconds = parse_interval(bucket)
+        query = resolve_range(
+            node_id, int(time.time()), HISTORY_DEFAULT_SPAN, sampling_interval(specs, EXPORT_DEFAULT_INTERVAL),
+            AGGREGATE_MAX_POINTS, start=start, end=end, interval=interval,
+        )
+    except TimeQueryError as e:
+        return JSONResponse(status_code=400, content={"detail": str(e)})
+    if bucket_seconds < query.interval:
+        return JSONResponse(status_code=400, content={"detail": "Bucket must not be smaller than the interval"})
+    if query.next_start is not None:
+        return JSONResponse(
+            status_code=400,
+            content={"detail": f"Range spans more than {AGGREGATE_MAX_POINTS} points; use a larger interval"}
+        )
+    
+    denied = await admit(request, aggregate_gate)
+    if denied is not None:
+        return denied
+    try:
+        rollups = await offload(
+            aggregate_history, snapshots.current(), node_id, specs, indexes,
+            query.start, query.interval, query.count, bucket_seconds
+        )
+    finally:
+        aggregate_gate.release()
+    return {
+        "node_id": node_id,
+        "start": format_timestamp(query.start),
+        "end": format_timestamp(query.end),
+        "interval": query.interval,
+        "bucket": bucket_seconds,
+        "parameters": [
+            {"name": specs[index].name, "data_type": specs[index].data_type, "aggregates": list(AGGREGATES[specs[index].data_type])}
+            for index in indexes
+        ],
+        "buckets": [
+            {"start": format_timestamp(bucket_start), "count": count, "values": values}
+            for bucket_start, count, values in rollups
+        ],
+    }
+
+# Helper function to get the live sampling interval of a node, or None
+def live_interval(node_id):
+    specs = get_node_specs(node_id)
+    if not specs:
+        return None
+    return sampling_interval(specs, LIVE_DEFAULT_INTERVAL)
+
+# Helper function to generate one tick's readings, serialized once for all subscribers
+def build_live_readings(node_ids, timestamp):
+    snap = snapshots.current()
+    readings = {}
+    for node_id in node_ids:
+        specs = snap.node_specs.get(node_id)
+        if specs:
+            readings[node_id] = with_node_id(node_id, cached_reading(node_id, specs, timestamp)).decode("utf-8")
+    return readings
+
+# One scheduler generates every subscribed node's reading once per interval
+live_scheduler = TickScheduler(live_interval, build_live_readings, tick=LIVE_TICK)
+
+@app.on_event("shutdown")
+async def stop_live_scheduler():
+    await live_scheduler.stop()
+
+@app.get("/subscribe")
+async def subscribe_events(
+    nodes: Optional[str] = Query(None, description="Comma-separated node IDs"),
+    domain_id: Optional[str] = Query(None, description="Select the nodes of a domain"),
+    sensor_type_id: Optional[str] = Query(None, description="Select the nodes of a sensor type"),
+    node_area: Optional[str] = Query(None, description="Select the nodes in an area"),
+):
+    """
+    Subscribe to live readings of a set of nodes as Server-Sent Events.
+    Each node emits a "reading" event once per its Data Interval; slow clients lose their oldest readings and get a "dropped" event.
+    """
+    try:
+        node_ids, _ = select_batch_nodes(snapshots.current(), split_ids(nodes), domain_id, sensor_type_id, node_area)
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"detail": str(e)})
+    if not node_ids:
+        return JSONResponse(status_code=404, content={"detail": "No nodes matched the subscription"})
+    
+    async def events():
+        subscription = live_scheduler.subscribe(node_ids, LIVE_QUEUE_SIZE)
+        try:
+            yield b"retry: 5000\n\n"
+            while True:
+                readings = await subscription.next_batch(LIVE_HEARTBEAT)
+                dropped = subscription.take_dropped()
+                if dropped:
+                    yield f"event: dropped\ndata: {dropped}\n\n".encode()
+                if not readings:
+                    yield b": keep-alive\n\n"
+                    continue
+                yield "".join(f"event: reading\ndata: {reading}\n\n" for reading in readings).encode("utf-8")
+        finally:
+            live_scheduler.unsubscribe(subscription)
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.websocket("/ws")
+async def subscribe_websocket(websocket: WebSocket):
+    """
+    Subscribe to live readings over a WebSocket.
+    The first client message selects nodes like POST /data/batch; each reading is then sent as a JSON text message.
+    """
+    await websocket.accept()
+    try:
+        selection = BatchRequest(**await websocket.receive_json())
+        node_ids, _ = select_batch_nodes(
+            snapshots.current(), selection.nodes, selection.domain_id, selection.sensor_type_id, selection.node_area
+        )
+    except WebSocketDisconnect:
+        return
+    except (ValueError, TypeError) as e:
+        await websocket.close(code=1008, reason=str(e)[:120])
+        return
+    
+    subscription = live_scheduler.subscribe(node_ids, LIVE_QUEUE_SIZE)
+    receiver = asyncio.ensure_future(websocket.receive())
+    try:
+        while True:
+            if receiver.done():
+                # Only a disconnect matters; other client messages are ignored
+                if receiver.result()["type"] == "websocket.disconnect":
+                    break
+                receiver = asyncio.ensure_future(websocket.receive())
+            for reading in await subscription.next_batch(LIVE_HEARTBEAT):
+                await websocket.send_text(reading)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        receiver.cancel()
+        live_scheduler.unsubscribe(subscription)
+
+# Request, generation, cache and event loop figures for /metrics
+metrics_registry = MetricsRegistry()
+http_requests = metrics_registry.counter(
+    "http_requests_total", "HTTP requests by method, route and status", ("method", "route", "status")
+)
+http_latency = metrics_registry.histogram(
+    "http_request_duration_seconds", "Time to the last byte of the response", LATENCY_BUCKETS,
+    ("method", "route", "status")
+)
+http_sizes = metrics_registry.histogram(
+    "http_response_size_bytes", "Response body size", SIZE_BUCKETS, ("method", "route")
+)
+app.add_middleware(MetricsMiddleware, requests=http_requests, latency=http_latency, sizes=http_sizes)
+
+runtime_monitor = RuntimeMonitor()
+
+# Helper function to list (cache, hits, misses) of the API's caches
+def cache_counts():
+    static = snapshots.current().static_cache
+    return [
+        ("history", history_cache.hits, history_cache.misses),
+        ("latest", latest_cache.hits + latest_cache.coalesced, latest_cache.misses),
+        ("static", static.hits, static.misses),
+        ("listing", listing_pages.hits, listing_pages.misses),
+    ]
+
+metrics_registry.collected(
+    "iot_points_generated_total", "Points generated by parameter model", "counter", ("model",),
+    lambda: [((model,), count) for model, count in points_generated.by_model()]
+)
+metrics_registry.collected(
+    "iot_points_generated_per_second", "Points generated per second over the last 10 seconds", "gauge", (),
+    lambda: [((), runtime_monitor.points_per_second)]
+)
+metrics_registry.collected(
+    "event_loop_lag_seconds", "Delay of the event loop in waking up from a timer", "gauge", (),
+    lambda: [((), runtime_monitor.lag)]
+)
+metrics_registry.collected(
+    "event_loop_lag_max_seconds", "Largest event loop delay seen", "gauge", (),
+    lambda: [((), runtime_monitor.max_lag)]
+)
+metrics_registry.collected(
+    "cache_requests_total", "Cache lookups by cache and result", "counter", ("cache", "result"),
+    lambda: [
+        item for name, hits, misses in cache_counts()
+        for item in (((name, "hit"), hits), ((name, "miss"), misses))
+    ]
+)
+metrics_registry.collected(
+    "cache_hit_ratio", "Share of cache lookups that were hits", "gauge", ("cache",),
+    lambda: [((name,), hits / (hits + misses) if hits + misses else 0.0) for name, hits, misses in cache_counts()]
+)
+metrics_registry.collected(
+    "admission_requests_total", "Expensive requests by endpoint and outcome", "counter", ("endpoint", "outcome"),
+    lambda: [
+        item for gate in (history_gate, batch_gate, export_gate, aggregate_gate)
+        for item in (
+            ((gate.name, "admitted"), gate.admitted), ((gate.name, "shed"), gate.shed),
+            ((gate.name, "timed_out"), gate.timed_out),
+        )
+    ]
+)
+metrics_registry.collected(
+    "ingest_readings_total", "Pushed readings by result", "counter", ("result",),
+    lambda: [(("accepted",), ingest_store.accepted), (("rejected",), ingest_store.rejected)]
+)
+
+@app.on_event("startup")
+async def start_runtime_monitor():
+    app.state.runtime_monitor = asyncio.ensure_future(runtime_monitor.run())
+
+@app.on_event("shutdown")
+async def stop_runtime_monitor():
+    app.state.runtime_monitor.cancel()
+
+@app.get("/metrics")
+async def get_metrics():
+    """
+    Get the API's metrics in the Prometheus text format.
+    Covers per-route request counts, latency and response size histograms, generated points, cache hit ratios and event loop lag.
+    """
+    return Response(content=metrics_registry.render(), headers={"Content-Type": METRICS_CONTENT_TYPE})
+
+# Helper function to tell whether a request carries the admin token
+def has_admin_token(request):
+    token = request.headers.get("x-admin-token", "")
+    return hmac.compare_digest(token.encode("utf-8"), ADMIN_TOKEN.encode("utf-8"))
+
+# Helper function to reject admin calls: all of them when no admin token is
+# configured, otherwise those without it
+def check_admin(request):
+    if not ADMIN_TOKEN:
+        return JSONResponse(status_code=404, content={"detail": "Not Found"})
+    if not has_admin_token(request):
+        return JSONResponse(status_code=403, content={"detail": "Admin token required"})
+    return None
+
+@app.get("/admin/snapshot")
+async def get_snapshot_info(request: Request):
+    """
+    Get the version of the configuration snapshot being served.
+    Returns the snapshot version, source file details, counts and configuration conflicts.
+    """
+    denied = check_admin(request)
+    if denied is not None:
+        return denied
+    
+    result = snapshots.current().describe()
+    result["last_error"] = snapshots.last_error
+    if history_store is not None:
+        result["history_store"] = {"directory": history_store.directory, "open_stores": len(history_store)}
+    result["history_cache"] = history_cache.stats()
+    result["latest_cache"] = latest_cache.stats()
+    result["listing_cache"] = listing_pages.stats()
+    result["ingest"] = ingest_store.stats()
+    result["admission"] = {gate.name: gate.stats() for gate in (history_gate, batch_gate, export_gate, aggregate_gate)}
+    if client_limiter is not None:
+        result["rate_limit"] = client_limiter.stats()
+    return result
+
+@app.get("/admin/profiles")
+async def get_profiles(request: Request):
+    """
+    Get the request profiles recorded since startup.
+    Returns the most recent profiles and per-route average wall time by phase (lookup, generation, envelope, serialization).
+    """
+    denied = check_admin(request)
+    if denied is not None:
+        return denied
+    
+    return profiler.stats()
+
+@app.post("/admin/reload")
+async def reload_config(request: Request, force: bool = Query(False, description="Rebuild even if the file is unchanged")):
+    """
+    Reload nodes.json now instead of waiting for the file watcher.
+    The new snapshot is built off the event loop and swapped in atomically; an invalid file keeps the current one.
+    """
+    denied = check_admin(request)
+    if denied is not None:
+        return denied
+    
+    try:
+        snap, changed = await run_in_threadpool(snapshots.reload, force)
+    except SnapshotError as e:
+        return JSONResponse(status_code=422, content={"detail": str(e)})
+    
+    result = snap.describe()
+    result["reloaded"] = changed
+    return result
 
 if __name__ == "__main__":
     import uvicorn
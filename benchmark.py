@@ -0,0 +1,376 @@
+import argparse
+import asyncio
+import copy
+import json
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+# Fleet sizes benchmarked by default: nodes.json itself, then clones of its nodes
+DEFAULT_FLEETS = (8, 1000, 100000)
+
+# Fixed history range (one week before this instant), so runs are comparable
+HISTORY_END = 1700000000
+HISTORY_SPAN = 7 * 86400
+
+# Endpoint cases: name -> path template ({node}, {sensor_type}, {domain} are
+# filled in per request from the fleet, cycling through a seeded shuffle)
+ENDPOINT_CASES = {
+    "data": "/data?node={node}",
+    "descriptor": "/descriptor?node={node}",
+    "history_week": f"/get-all-data?node={{node}}&start={HISTORY_END - HISTORY_SPAN}&end={HISTORY_END}",
+    "history_page": f"/get-all-data?node={{node}}&start={HISTORY_END - 10000 * 60}&interval=60&limit=10000",
+    "nodes": "/nodes",
+    "nodes_filtered": "/nodes?sensor_type_id={sensor_type}&limit=100",
+    "node": "/nodes/{node}",
+    "config": "/config",
+    "domains": "/domains",
+    "domain": "/domains/{domain}",
+    "sensor_types": "/sensor_types",
+    "sensor_type": "/sensor_types/{sensor_type}",
+    "sensor_type_nodes": "/sensor_types/{sensor_type}/nodes",
+    "parameters": "/parameters",
+}
+
+# Metrics compared against a baseline: name -> True when higher is better
+COMPARED_METRICS = {
+    "throughput": True,
+    "p50_ms": False,
+    "p95_ms": False,
+    "p99_ms": False,
+    "seconds_per_node": False,
+    "seconds_per_point": False,
+}
+
+# Build a configuration with `size` nodes: the nodes of `config` followed by
+# numbered clones spread around the originals (deterministic for a seed)
+def synthesize_config(config, size, seed=0):
+    config = copy.deepcopy(config)
+    templates = [
+        (sensor_type, node)
+        for domain in config["domains"]
+        for sensor_type in domain["sensor_types"]
+        for node in sensor_type["nodes"]
+    ]
+    if size <= len(templates):
+        keep = {id(node) for _, node in templates[:size]}
+        for domain in config["domains"]:
+            for sensor_type in domain["sensor_types"]:
+                sensor_type["nodes"] = [node for node in sensor_type["nodes"] if id(node) in keep]
+        return config
+    rng = random.Random(seed)
+    for index in range(len(templates), size):
+        sensor_type, node = templates[index % len(templates)]
+        clone = dict(node)
+        clone["node_id"] = f"{node['node_id']}-{index:06d}"
+        clone["node_name"] = f"{node['node_name']} #{index}"
+        clone["node_latitude"] = round(node["node_latitude"] + rng.uniform(-0.5, 0.5), 4)
+        clone["node_longitude"] = round(node["node_longitude"] + rng.uniform(-0.5, 0.5), 4)
+        sensor_type["nodes"].append(clone)
+    return config
+
+# Default nodes.json, next to this script
+def default_config_path():
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), "nodes.json")
+
+# Send one request to an ASGI app in-process; returns (status, body size)
+async def asgi_request(app, path, method="GET", body=b""):
+    path, _, query = path.partition("?")
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": method,
+        "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": query.encode(),
+        "root_path": "", "headers": [(b"host", b"bench")], "client": ("127.0.0.1", 50000),
+        "server": ("bench", 80),
+    }
+    state = {"status": None, "size": 0, "sent": False}
+
+    async def receive():
+        if not state["sent"]:
+            state["sent"] = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        # The request has been read; park until the response is complete
+        await asyncio.sleep(3600)
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            state["status"] = message["status"]
+        elif message["type"] == "http.response.body":
+            state["size"] += len(message.get("body", b""))
+
+    await app(scope, receive, send)
+    return state["status"], state["size"]
+
+# Nearest-rank percentile of sorted values
+def percentile(values, fraction):
+    if not values:
+        return None
+    return values[min(len(values) - 1, max(0, int(round(fraction * len(values))) - 1))]
+
+# Latency and throughput summary of one case
+def summarize(latencies, elapsed, sizes, errors):
+    latencies = sorted(latencies)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput": len(latencies) / elapsed if elapsed else None,
+        "mean_ms": sum(latencies) / len(latencies) * 1e3 if latencies else None,
+        "p50_ms": percentile(latencies, 0.50) * 1e3 if latencies else None,
+        "p95_ms": percentile(latencies, 0.95) * 1e3 if latencies else None,
+        "p99_ms": percentile(latencies, 0.99) * 1e3 if latencies else None,
+        "max_ms": latencies[-1] * 1e3 if latencies else None,
+        "mean_bytes": sum(sizes) / len(sizes) if sizes else None,
+    }
+
+# Drive one endpoint case for `duration` seconds (at least `min_requests`
+# requests) from `concurrency` concurrent clients
+async def run_case(app, template, fleet, duration, min_requests, concurrency, warmup):
+    paths = [template.format(**params) for params in fleet]
+    for index in range(min(warmup, len(paths))):
+        await asgi_request(app, paths[index])
+
+    latencies, sizes = [], []
+    errors = 0
+    counter = iter(range(sys.maxsize))
+    deadline = time.perf_counter() + duration
+
+    async def client():
+        nonlocal errors
+        while time.perf_counter() < deadline or len(latencies) < min_requests:
+            path = paths[next(counter) % len(paths)]
+            started = time.perf_counter()
+            status, size = await asgi_request(app, path)
+            latencies.append(time.perf_counter() - started)
+            sizes.append(size)
+            if status != 200:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*[client() for _ in range(concurrency)])
+    return summarize(latencies, time.perf_counter() - started, sizes, errors)
+
+# Time generate_weekly_data and generate_all_data on a sample of the fleet
+def run_generator(config_path, node_ids, interval):
+    import data_generator
+    from param_specs import compile_node_specs
+    from topology import build_registry
+
+    node_specs = compile_node_specs(build_registry(data_generator.load_config(config_path)))
+    results = {}
+
+    started = time.perf_counter()
+    points = 0
+    for node_id in node_ids:
+        points += len(data_generator.generate_weekly_data(node_specs, node_id, interval))
+    elapsed = time.perf_counter() - started
+    results["generate_weekly_data"] = {
+        "nodes": len(node_ids), "points": points, "seconds": elapsed,
+        "seconds_per_node": elapsed / len(node_ids), "seconds_per_point": elapsed / points if points else None,
+    }
+
+    for output_format in data_generator.OUTPUT_FORMATS:
+        data_dir = tempfile.mkdtemp(prefix="bench-generator-")
+        try:
+            started = time.perf_counter()
+            nodes, points = data_generator.generate_all_data(
+                node_ids=node_ids, start=HISTORY_END - HISTORY_SPAN, end=HISTORY_END, interval=interval,
+                data_dir=data_dir, config_path=config_path, quiet=True, output_format=output_format,
+            )
+            elapsed = time.perf_counter() - started
+        finally:
+            shutil.rmtree(data_dir, ignore_errors=True)
+        results[f"generate_all_data_{output_format}"] = {
+            "nodes": nodes, "points": points, "seconds": elapsed,
+            "seconds_per_node": elapsed / nodes, "seconds_per_point": elapsed / points if points else None,
+        }
+    return results
+
+# Benchmark one fleet. Runs in a fresh process: the API loads its
+# configuration (NODES_CONFIG) when it is imported.
+def run_fleet(config_path, options):
+    os.environ["NODES_CONFIG"] = config_path
+    os.environ["NODES_RELOAD_INTERVAL"] = "0"
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+    started = time.perf_counter()
+    import api
+    load_seconds = time.perf_counter() - started
+
+    snap = api.snapshots.current()
+    node_ids = list(snap.registry.nodes)
+    rng = random.Random(options["seed"])
+    fleet = []
+    for node_id in rng.sample(node_ids, min(len(node_ids), options["sample_nodes"])):
+        info = snap.registry.find_node(node_id)
+        fleet.append({
+            "node": node_id,
+            "sensor_type": info["sensor_type"]["sensor_type_id"],
+            "domain": info["domain"]["domain_id"],
+        })
+
+    endpoints = {}
+    for name in options["cases"]:
+        endpoints[name] = asyncio.run(run_case(
+            api.app, ENDPOINT_CASES[name], fleet, options["duration"], options["min_requests"],
+            options["concurrency"], options["warmup"],
+        ))
+
+    generator = {}
+    if options["generator_nodes"]:
+        generator = run_generator(config_path, [item["node"] for item in fleet[:options["generator_nodes"]]], options["interval"])
+
+    return {
+        "nodes": len(node_ids),
+        "config_load_seconds": load_seconds,
+        "endpoints": endpoints,
+        "generator": generator,
+    }
+
+# Benchmark every fleet size, each in its own process
+def run_benchmarks(options):
+    with open(options["config"]) as f:
+        config = json.load(f)
+    results = {
+        "meta": {
+            "timestamp": int(time.time()),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "numpy": _numpy_version(),
+            "options": {key: value for key, value in options.items() if key != "config"},
+        },
+        "fleets": {},
+    }
+    work_dir = tempfile.mkdtemp(prefix="bench-fleet-")
+    try:
+        for size in options["fleets"]:
+            path = os.path.join(work_dir, f"nodes-{size}.json")
+            with open(path, "w") as f:
+                json.dump(synthesize_config(config, size, options["seed"]), f)
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+                results["fleets"][str(size)] = executor.submit(run_fleet, path, options).result()
+            if not options["quiet"]:
+                print(format_fleet(size, results["fleets"][str(size)]), file=sys.stderr)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return results
+
+def _numpy_version():
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy.__version__
+
+# Human-readable summary of one fleet's results
+def format_fleet(size, fleet):
+    lines = [f"fleet of {size} nodes (config loaded in {fleet['config_load_seconds']:.2f}s)"]
+    for name, result in fleet["endpoints"].items():
+        lines.append(
+            f"  {name:<18} {result['throughput']:>10.1f} req/s  p50 {result['p50_ms']:8.3f}ms  "
+            f"p95 {result['p95_ms']:8.3f}ms  p99 {result['p99_ms']:8.3f}ms  errors {result['errors']}"
+        )
+    for name, result in fleet["generator"].items():
+        lines.append(
+            f"  {name:<30} {result['seconds_per_node'] * 1e3:8.2f}ms/node  {result['seconds_per_point'] * 1e6:8.3f}us/point"
+        )
+    return "\n".join(lines)
+
+# Flatten results to {(fleet, group, name, metric): value}
+def flatten(results):
+    flat = {}
+    for size, fleet in results["fleets"].items():
+        for group in ("endpoints", "generator"):
+            for name, metrics in fleet.get(group, {}).items():
+                for metric, value in metrics.items():
+                    if metric in COMPARED_METRICS and value is not None:
+                        flat[(size, group, name, metric)] = value
+    return flat
+
+# Compare results against a baseline. Returns rows of
+# (fleet, group, name, metric, baseline, current, relative change, regressed)
+# where the relative change is positive when the current run is worse.
+def compare(baseline, current, threshold):
+    rows = []
+    old, new = flatten(baseline), flatten(current)
+    for key in sorted(old.keys() & new.keys()):
+        before, after = old[key], new[key]
+        if not before:
+            continue
+        change = (after - before) / before
+        if COMPARED_METRICS[key[3]]:
+            change = -change
+        rows.append(key + (before, after, change, change > threshold))
+    return rows
+
+# Command line interface
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the API in-process and the data generator.")
+    parser.add_argument("--config", default=default_config_path(), help="nodes.json the fleets are built from")
+    parser.add_argument("--fleets", default=",".join(str(size) for size in DEFAULT_FLEETS), help="Comma-separated fleet sizes (default: 8,1000,100000)")
+    parser.add_argument("--cases", default=",".join(ENDPOINT_CASES), help="Comma-separated endpoint cases (default: all)")
+    parser.add_argument("--duration", type=float, default=2.0, help="Seconds per endpoint case (default: 2)")
+    parser.add_argument("--min-requests", type=int, default=20, help="Minimum requests per endpoint case (default: 20)")
+    parser.add_argument("--concurrency", type=int, default=1, help="Concurrent in-process clients (default: 1)")
+    parser.add_argument("--warmup", type=int, default=8, help="Requests per case before measuring (default: 8)")
+    parser.add_argument("--sample-nodes", type=int, default=256, help="Nodes the requests cycle through (default: 256)")
+    parser.add_argument("--generator-nodes", type=int, default=8, help="Nodes timed through the generator; 0 skips it (default: 8)")
+    parser.add_argument("--interval", default="15m", help="Generator point spacing (default: 15m)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of fleet synthesis and node sampling (default: 0)")
+    parser.add_argument("--output", help="Write the JSON results to this file (default: stdout)")
+    parser.add_argument("--input", help="Compare these saved results instead of running the benchmarks")
+    parser.add_argument("--compare", help="Baseline results to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Relative slowdown flagged as a regression (default: 0.10)")
+    parser.add_argument("--quiet", action="store_true", help="Do not print per-fleet summaries")
+    args = parser.parse_args(argv)
+
+    from time_query import TimeQueryError, parse_interval
+
+    cases = [name.strip() for name in args.cases.split(",") if name.strip()]
+    unknown = [name for name in cases if name not in ENDPOINT_CASES]
+    if unknown:
+        parser.error(f"unknown cases: {', '.join(unknown)}")
+    try:
+        fleets = [int(size) for size in args.fleets.split(",") if size.strip()]
+        interval = parse_interval(args.interval)
+    except (ValueError, TimeQueryError) as e:
+        parser.error(str(e))
+
+    if args.input:
+        with open(args.input) as f:
+            results = json.load(f)
+    else:
+        results = run_benchmarks({
+            "config": args.config, "fleets": fleets, "cases": cases, "duration": args.duration,
+            "min_requests": args.min_requests, "concurrency": args.concurrency, "warmup": args.warmup,
+            "sample_nodes": args.sample_nodes, "generator_nodes": args.generator_nodes, "interval": interval,
+            "seed": args.seed, "quiet": args.quiet,
+        })
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(results, f, indent=2)
+        elif not args.compare:
+            json.dump(results, sys.stdout, indent=2)
+            print()
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        rows = compare(baseline, results, args.threshold)
+        regressions = 0
+        for size, group, name, metric, before, after, change, regressed in rows:
+            regressions += regressed
+            flag = "REGRESSION" if regressed else ("improved" if change < -args.threshold else "")
+            print(f"{size:>7} {name:<30} {metric:<18} {before:>14.6g} -> {after:<14.6g} {change:+7.1%} {flag}")
+        print(f"{regressions} regression(s) beyond {args.threshold:.0%} in {len(rows)} compared metrics")
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
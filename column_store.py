@@ -0,0 +1,382 @@
+import bisect
+import json
+import mmap
+import os
+import shutil
+import sys
+from array import array
+
+from timeseries import Block
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - exercised on installs without NumPy
+    np = None
+
+# A node's history is a directory "<node_id>.col" holding header.json, a
+# timestamp column and one fixed-width column per parameter:
+#   timestamps.bin   int64 epoch seconds, ascending
+#   000.bin, ...     float -> integer value * 10^decimals, integer -> integer,
+#                    string -> uint8 code into "categories"
+# Numeric columns use the narrowest of int16/int32/int64 that holds every
+# value the parameter's model can produce (see value_bounds).
+# Columns are native byte order (recorded in the header).
+STORE_FORMAT = "ctop-columnar"
+STORE_VERSION = 1
+STORE_SUFFIX = ".col"
+HEADER_FILE = "header.json"
+TIMESTAMP_FILE = "timestamps.bin"
+
+_TIMESTAMP_TYPECODE = "q"
+
+
+# Raised for a missing, unreadable or incompatible store
+class StoreError(Exception):
+    pass
+
+
+# Directory of a node's store under `data_dir`
+def store_path(data_dir, node_id):
+    return os.path.join(data_dir, f"{node_id}{STORE_SUFFIX}")
+
+
+# File name of the index-th parameter column
+def column_file(index):
+    return f"{index:03d}.bin"
+
+
+# Integer typecodes by width, with their value ranges
+_INTEGER_TYPECODES = (("h", -2 ** 15, 2 ** 15 - 1), ("i", -2 ** 31, 2 ** 31 - 1))
+
+
+# (low, high) of the values a numeric parameter's model can produce, or None
+# when it cannot be bounded
+def value_bounds(spec):
+    if spec.hour_table is None:
+        return None
+    low, high = min(spec.hour_table), max(spec.hour_table)
+    if spec.day_table is not None:
+        days = spec.day_table[1:]
+        low, high = low + min(days), high + max(days)
+    if spec.term is not None:
+        kind, a, b = spec.term
+        if kind == "bernoulli":
+            low, high = low + min(0.0, b), high + max(0.0, b)
+        else:
+            low, high = low + a, high + b
+    if spec.data_type == "float":
+        low, high = low - spec.noise, high + spec.noise
+        if spec.clamp is not None:
+            low, high = max(low, spec.clamp[0]), min(high, spec.clamp[1])
+    return low, high
+
+
+# array typecode a parameter is stored as
+def column_typecode(spec):
+    if spec.data_type == "string":
+        return "B"
+    bounds = value_bounds(spec)
+    if bounds is not None:
+        scale = spec.scale if spec.data_type == "float" else 1
+        # One unit of slack on each side for rounding
+        low, high = bounds[0] * scale - 1, bounds[1] * scale + 1
+        for typecode, type_low, type_high in _INTEGER_TYPECODES:
+            if type_low <= low and high <= type_high:
+                return typecode
+    return "q"
+
+
+# Header describing the columns of a node's store
+def make_header(node_id, specs, interval):
+    return {
+        "format": STORE_FORMAT,
+        "version": STORE_VERSION,
+        "node_id": node_id,
+        "interval": interval,
+        "byteorder": sys.byteorder,
+        "columns": [
+            {
+                "name": spec.name,
+                "data_type": spec.data_type,
+                "decimal_places": spec.decimal_places,
+                "typecode": column_typecode(spec),
+                "categories": list(spec.categories) if spec.categories is not None else None,
+            }
+            for spec in specs
+        ],
+    }
+
+
+def write_header(path, header):
+    tmp_path = os.path.join(path, HEADER_FILE + ".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(header, f, indent=2)
+    os.replace(tmp_path, os.path.join(path, HEADER_FILE))
+
+
+def read_header(path):
+    try:
+        with open(os.path.join(path, HEADER_FILE), "r") as f:
+            header = json.load(f)
+    except (OSError, ValueError) as e:
+        raise StoreError(f"cannot read store header in {path}: {e}") from None
+    if header.get("format") != STORE_FORMAT or header.get("version") != STORE_VERSION:
+        raise StoreError(f"{path} is not a version {STORE_VERSION} {STORE_FORMAT} store")
+    if header.get("byteorder") != sys.byteorder:
+        raise StoreError(f"{path} was written with {header.get('byteorder')} byte order")
+    return header
+
+
+# Bytes of one generated column in its stored encoding
+def encode_column(spec, column):
+    typecode = column_typecode(spec)
+    if spec.data_type == "float":
+        scale = spec.scale
+        if np is not None:
+            return np.rint(np.asarray(column, dtype=np.float64) * scale).astype(np.dtype(typecode)).tobytes()
+        return array(typecode, [round(value * scale) for value in column]).tobytes()
+    if np is not None:
+        return np.asarray(column).astype(np.dtype(typecode)).tobytes()
+    return array(typecode, column).tobytes()
+
+
+def encode_timestamps(timestamps):
+    if np is not None:
+        return np.asarray(timestamps, dtype=np.int64).tobytes()
+    return array(_TIMESTAMP_TYPECODE, timestamps).tobytes()
+
+
+# Appends generated blocks to the column files of a directory.
+# Parameter columns are written before the timestamp column, so a reader
+# never sees a timestamp whose values are missing: the row count of a store
+# is the length of its shortest column.
+class ColumnWriter:
+    def __init__(self, path, specs):
+        self.path = path
+        self.specs = specs
+        os.makedirs(path, exist_ok=True)
+        self._files = [open(os.path.join(path, column_file(i)), "ab") for i in range(len(specs))]
+        self._timestamps = open(os.path.join(path, TIMESTAMP_FILE), "ab")
+
+    def write_block(self, block):
+        for spec, column, f in zip(self.specs, block.columns, self._files):
+            f.write(encode_column(spec, column))
+        for f in self._files:
+            f.flush()
+        self._timestamps.write(encode_timestamps(block.timestamps))
+        self._timestamps.flush()
+
+    def close(self):
+        for f in self._files:
+            f.close()
+        self._timestamps.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# Column description from a store header; stands in for a ParameterSpec
+# in blocks read back from the store
+class StoredColumn:
+    __slots__ = ("name", "data_type", "decimal_places", "scale", "typecode", "categories")
+
+    def __init__(self, info):
+        self.name = info["name"]
+        self.data_type = info["data_type"]
+        self.decimal_places = info["decimal_places"]
+        self.scale = 10.0 ** self.decimal_places
+        self.typecode = info["typecode"]
+        self.categories = tuple(info["categories"]) if info.get("categories") is not None else None
+
+    def __repr__(self):
+        return f"StoredColumn({self.name!r}, {self.data_type!r})"
+
+
+# Map a column file read-only; returns (mmap or None, memoryview cast to typecode)
+def _map_column(file_path, typecode):
+    with open(file_path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return None, memoryview(b"").cast(typecode)
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    view = memoryview(mapped)
+    itemsize = array(typecode).itemsize
+    return mapped, view[:size - size % itemsize].cast(typecode)
+
+
+# Read-only, memory-mapped view of a node's store.
+# Slices returned by column() share the mapped pages (no copy); read()
+# decodes a time range into a Block with the same values the generator
+# produced.
+class ColumnStore:
+    def __init__(self, path):
+        self.path = path
+        self.header = read_header(path)
+        self.node_id = self.header["node_id"]
+        self.interval = self.header["interval"]
+        self.columns = tuple(StoredColumn(info) for info in self.header["columns"])
+        self._maps = []
+        try:
+            self.timestamps = self._map(TIMESTAMP_FILE, _TIMESTAMP_TYPECODE)
+            self._views = [self._map(column_file(i), column.typecode) for i, column in enumerate(self.columns)]
+        except OSError as e:
+            self.close()
+            raise StoreError(f"cannot map store {path}: {e}") from None
+        # Rows present in every column (a torn append leaves longer files)
+        self.length = min([len(self.timestamps)] + [len(view) for view in self._views])
+        self._ts_array = np.frombuffer(self.timestamps, dtype=np.int64, count=self.length) if np is not None else None
+        # Whether rows sit on an unbroken interval grid, so a timestamp's row
+        # can be computed instead of searched
+        self.regular = self.length < 2 or self.last - self.first == (self.length - 1) * self.interval
+
+    def _map(self, name, typecode):
+        mapped, view = _map_column(os.path.join(self.path, name), typecode)
+        if mapped is not None:
+            self._maps.append(mapped)
+        return view
+
+    def __len__(self):
+        return self.length
+
+    # First and last stored timestamps, or None when empty
+    @property
+    def first(self):
+        return self.timestamps[0] if self.length else None
+
+    @property
+    def last(self):
+        return self.timestamps[self.length - 1] if self.length else None
+
+    # Row index range [lo, hi) of timestamps in [start, end], by binary search
+    def bounds(self, start, end):
+        if self._ts_array is not None:
+            lo = int(self._ts_array.searchsorted(start, side="left"))
+            hi = int(self._ts_array.searchsorted(end, side="right"))
+        else:
+            lo = bisect.bisect_left(self.timestamps, start, 0, self.length)
+            hi = bisect.bisect_right(self.timestamps, end, 0, self.length)
+        return lo, max(lo, hi)
+
+    # Row of a timestamp on a regular store's grid, or None when it is not stored
+    def row_of(self, timestamp):
+        if not self.length or not self.regular:
+            return None
+        row, off_grid = divmod(timestamp - self.first, self.interval)
+        if off_grid or row < 0 or row >= self.length:
+            return None
+        return row
+
+    # Stored (encoded) values of a column for rows [lo, hi); zero-copy
+    def column(self, index, lo, hi, step=1):
+        return self._views[index][lo:hi:step]
+
+    # Decoded values of a column for rows [lo, hi) (every step-th row)
+    def decode(self, index, lo, hi, step=1):
+        column = self.columns[index]
+        if np is not None:
+            values = np.frombuffer(self._views[index], dtype=np.dtype(column.typecode))[lo:hi:step]
+            if column.data_type == "float":
+                return values / column.scale
+            return values.astype(np.int64) if column.data_type == "integer" else values
+        view = self._views[index][lo:hi:step]
+        if column.data_type == "float":
+            scale = column.scale
+            return array("d", [value / scale for value in view])
+        return array(column.typecode, view)
+
+    # Block of the rows [lo, hi) (every step-th row)
+    def rows_block(self, lo, hi, step=1):
+        if np is not None:
+            timestamps = np.array(self._ts_array[lo:hi:step])
+        else:
+            timestamps = array(_TIMESTAMP_TYPECODE, self.timestamps[lo:hi:step])
+        columns = [self.decode(index, lo, hi, step) for index in range(len(self.columns))]
+        return Block(self.columns, timestamps, columns)
+
+    # Block of the rows with timestamps in [start, end]
+    def read(self, start, end):
+        return self.rows_block(*self.bounds(start, end))
+
+    def close(self):
+        self._views = []
+        self.timestamps = memoryview(b"").cast(_TIMESTAMP_TYPECODE)
+        self._ts_array = None
+        for mapped in self._maps:
+            try:
+                mapped.close()
+            except BufferError:
+                # A caller still holds a zero-copy slice; the map is freed with it
+                pass
+        self._maps = []
+
+
+# Open a node's store under `data_dir`
+def open_store(data_dir, node_id):
+    path = store_path(data_dir, node_id)
+    if not os.path.isdir(path):
+        raise StoreError(f"no store for node {node_id} in {data_dir}")
+    return ColumnStore(path)
+
+
+# Replace the store at `path` with the complete directory `tmp_path`.
+# Readers holding the old store keep their mappings until they close it.
+def publish_store(tmp_path, path):
+    old_path = None
+    if os.path.exists(path):
+        old_path = path + ".old"
+        if os.path.exists(old_path):
+            shutil.rmtree(old_path)
+        os.replace(path, old_path)
+    os.replace(tmp_path, path)
+    if old_path is not None:
+        shutil.rmtree(old_path)
+
+
+# Cut every column of a store back to the rows present in all of them,
+# dropping what an interrupted append left behind. Returns the store.
+def repair_store(path):
+    store = ColumnStore(path)
+    length = store.length
+    files = [(TIMESTAMP_FILE, _TIMESTAMP_TYPECODE)] + [
+        (column_file(i), column.typecode) for i, column in enumerate(store.columns)
+    ]
+    store.close()
+    for name, typecode in files:
+        file_path = os.path.join(path, name)
+        size = length * array(typecode).itemsize
+        if os.path.getsize(file_path) != size:
+            os.truncate(file_path, size)
+    return ColumnStore(path)
+
+
+# Rewrite a store without the rows before `keep_from` (retention).
+# The retained rows are copied to a new directory that replaces the store.
+def compact_store(path, keep_from):
+    store = ColumnStore(path)
+    lo, _ = store.bounds(keep_from, store.last if store.length else keep_from)
+    tmp_path = path + ".tmp"
+    if os.path.exists(tmp_path):
+        shutil.rmtree(tmp_path)
+    os.makedirs(tmp_path)
+    files = [(TIMESTAMP_FILE, _TIMESTAMP_TYPECODE)] + [
+        (column_file(i), column.typecode) for i, column in enumerate(store.columns)
+    ]
+    for name, typecode in files:
+        itemsize = array(typecode).itemsize
+        with open(os.path.join(path, name), "rb") as src, open(os.path.join(tmp_path, name), "wb") as out:
+            src.seek(lo * itemsize)
+            remaining = (store.length - lo) * itemsize
+            while remaining > 0:
+                data = src.read(min(remaining, 1 << 20))
+                if not data:
+                    break
+                out.write(data)
+                remaining -= len(data)
+    write_header(tmp_path, store.header)
+    dropped = lo
+    store.close()
+    publish_store(tmp_path, path)
+    return dropped
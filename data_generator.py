@@ -1,215 +1,455 @@
+import argparse
+import calendar
+import contextlib
 import json
-import random
 import os
-from datetime import datetime, timedelta
+import shutil
+import time
 import csv
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - no advisory locks on Windows
+    fcntl = None
+
+from column_store import (
+    ColumnWriter, StoreError, compact_store, make_header, publish_store, repair_store, store_path, write_header,
+)
+from noise import KeyedNoise
+from param_specs import compile_node_specs
+from profiling import PROFILE_FORMATS, profile_run
+from time_query import TimeQueryError, align_up, count_points, parse_interval, parse_time
+from timeseries import CSV_TIME_FORMAT, format_timestamps, generate_range
+from topology import build_registry
+
+# Default history: one week at 15-minute intervals
+DEFAULT_SPAN = 7 * 86400
+DEFAULT_INTERVAL = 15 * 60
+
+# Points generated per block while writing; bounds the memory of a worker
+WRITE_CHUNK = 4096
+
+# Output formats: memory-mappable column store (column_store.py) or CSV.
+# CSV stays the default, as it always was; column stores are opt-in.
+OUTPUT_FORMATS = ("columnar", "csv")
+DEFAULT_FORMAT = "csv"
+
+# In append mode, rows past the retention window are only dropped once they
+# make up this fraction of it, so the rewrite is amortized over many runs
+RETENTION_SLACK = 0.1
+
+# Lock file that keeps two runs from writing the same output directory
+LOCK_FILE = ".generator.lock"
 
 # Load node configuration
-def load_config():
-    with open(os.path.join(os.path.dirname(__file__), "nodes.json"), "r") as f:
+def load_config(config_path=None):
+    with open(config_path or os.path.join(os.path.dirname(__file__), "nodes.json"), "r") as f:
         return json.load(f)
 
 # Create a directory for data if it doesn't exist
-def ensure_data_directory():
-    data_dir = os.path.join(os.path.dirname(__file__), "data")
+def ensure_data_directory(data_dir=None):
+    data_dir = data_dir or os.path.join(os.path.dirname(__file__), "data")
     if not os.path.exists(data_dir):
         os.makedirs(data_dir)
     return data_dir
 
-# Find node details by ID
-def find_node(nodes_config, node_id):
-    for domain in nodes_config["domains"]:
-        for sensor_type in domain["sensor_types"]:
-            for node in sensor_type["nodes"]:
-                if node["node_id"] == node_id:
-                    return {
-                        "node": node,
-                        "sensor_type": sensor_type,
-                        "domain": domain
-                    }
-    return None
-
-# Get parameters for a node
-def get_node_parameters(nodes_config, node_id):
-    node_info = find_node(nodes_config, node_id)
-    if not node_info:
+# Generate historical data for a week for a node, as points for save_to_csv.
+# `nodes_config` is the configuration as returned by load_config; specs
+# already compiled with compile_node_specs are accepted too. Points come from
+# the same row generator as the files written by generate_all_data.
+def generate_weekly_data(nodes_config, node_id, interval=DEFAULT_INTERVAL):
+    if "domains" in nodes_config:
+        nodes_config = compile_node_specs(build_registry(nodes_config))
+    specs = nodes_config.get(node_id)
+    if not specs:
         return None
-    
-    parameters = []
-    sensor_type = node_info["sensor_type"]
-    domain = node_info["domain"]
-    
-    for param_name in sensor_type["parameters"]:
-        # Find the parameter details in the domain parameters
-        for param in domain["parameters"]:
-            if param["parameter_name"] == param_name:
-                parameters.append(param)
-                break
-    
-    return parameters
-
-# Generate random value for a parameter
-def generate_random_value(param, timestamp):
-    # Extract numeric part from resolution
-    resolution_str = param["resolution"]
-    decimal_places = 1  # default
-    if "." in resolution_str:
-        parts = resolution_str.split(".")
-        if len(parts) > 1 and len(parts[1]) > 0:
-            num_str = ""
-            for char in parts[1]:
-                if char.isdigit():
-                    num_str += char
-                else:
-                    break
-            if num_str:
-                decimal_places = len(num_str)
-    
-    # Extract numeric part from accuracy for range
-    accuracy_str = param["accuracy"]
-    range_val = 1.0  # default
-    for part in accuracy_str.split():
-        if part.startswith("±"):
-            num_str = ""
-            for char in part[1:]:
-                if char.isdigit() or char == '.':
-                    num_str += char
-                else:
-                    break
-            if num_str:
-                range_val = float(num_str)
-            break
-    
-    # Generate a random value based on typical ranges for the parameter
-    base_value = 0
-    if "Temperature" in param["parameter_name"]:
-        # Add some daily variation
-        hour = timestamp.hour
-        base_value = 20 + 7 * (1 - abs(hour - 12) / 12)  # Higher during day, lower at night
-        # Add some seasonal variation if needed
-        day_of_year = timestamp.timetuple().tm_yday
-        seasonal_factor = 0.5 * (1 + (day_of_year % 365) / 365 * 2 - 1)  # Simplified seasonal factor
-        base_value += seasonal_factor * 5
-    elif "Humidity" in param["parameter_name"]:
-        hour = timestamp.hour
-        base_value = 60 - 20 * (1 - abs(hour - 12) / 12)  # Lower during day, higher at night
-    elif "PM2.5" in param["parameter_name"]:
-        hour = timestamp.hour
-        # Higher during morning and evening rush hours
-        rush_hour_factor = max(0, 1 - min(abs(hour - 8), abs(hour - 18)) / 4)
-        base_value = 15 + rush_hour_factor * 30
-    elif "CO2" in param["parameter_name"]:
-        hour = timestamp.hour
-        # Higher during daytime when activity is high
-        activity_factor = max(0, 1 - abs(hour - 14) / 10)
-        base_value = 400 + activity_factor * 800
-    elif "O3" in param["parameter_name"]:
-        hour = timestamp.hour
-        # Higher during sunny afternoon
-        sun_factor = max(0, 1 - abs(hour - 14) / 8)
-        base_value = 0.02 + sun_factor * 0.05
-    elif "NO2" in param["parameter_name"]:
-        hour = timestamp.hour
-        # Higher during morning and evening rush hours
-        rush_hour_factor = max(0, 1 - min(abs(hour - 8), abs(hour - 18)) / 4)
-        base_value = 0.02 + rush_hour_factor * 0.05
-    elif "pH" in param["parameter_name"]:
-        base_value = 7.0 + random.uniform(-0.5, 0.5)
-    elif "Turbidity" in param["parameter_name"]:
-        # Check if it's a rainy day (random)
-        is_rainy = random.random() < 0.3
-        base_value = 2.0 + (5.0 if is_rainy else 0)
-    elif "Dissolved Oxygen" in param["parameter_name"]:
-        # Temperature affects dissolved oxygen
-        temperature = 20 + 7 * (1 - abs(timestamp.hour - 12) / 12)
-        # Inverse relationship with temperature
-        base_value = 14 - temperature * 0.3
-        if base_value < 4:
-            base_value = 4
-    else:
-        base_value = random.uniform(0, 100)
-    
-    # Add some random noise within the accuracy range
-    value = round(base_value + random.uniform(-range_val, range_val), decimal_places)
-    
-    # Ensure values are within reasonable physical limits
-    if "Temperature" in param["parameter_name"] and (value < -20 or value > 50):
-        value = max(-20, min(50, value))
-    elif "Humidity" in param["parameter_name"] and (value < 0 or value > 100):
-        value = max(0, min(100, value))
-    elif "pH" in param["parameter_name"] and (value < 0 or value > 14):
-        value = max(0, min(14, value))
-    
-    return value
-
-# Generate historical data for a week for a node
-def generate_weekly_data(nodes_config, node_id):
-    parameters = get_node_parameters(nodes_config, node_id)
-    if not parameters:
-        return None
-    
-    end_time = datetime.now()
-    start_time = end_time - timedelta(days=7)
-    current_time = start_time
-    
-    data = []
-    
-    # Generate data points at 15-minute intervals
-    while current_time <= end_time:
-        data_point = {
-            "timestamp": current_time.strftime("%Y-%m-%d %H:%M:%S"),
-            "values": {}
-        }
-        
-        for param in parameters:
-            value = generate_random_value(param, current_time)
-            data_point["values"][param["parameter_name"]] = value
-        
-        data.append(data_point)
-        current_time += timedelta(minutes=15)
-    
-    return data
+
+    end_time = int(time.time())
+    start_time = end_time - DEFAULT_SPAN
+    names = [spec.name for spec in specs]
+
+    return [
+        {"timestamp": timestamp, "values": dict(zip(names, values))}
+        for timestamp, values in iter_csv_rows(node_id, specs, start_time, interval, (end_time - start_time) // interval + 1)
+    ]
 
 # Save data to CSV file
 def save_to_csv(data, node_id, data_dir):
     if not data:
         return
-    
+
     file_path = os.path.join(data_dir, f"{node_id}_historical_data.csv")
-    
+
     with open(file_path, 'w', newline='') as csvfile:
         # Get all parameter names from the first data point
         param_names = list(data[0]["values"].keys())
         fieldnames = ["timestamp"] + param_names
-        
+
         writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
         writer.writeheader()
-        
+
         for data_point in data:
             row = {"timestamp": data_point["timestamp"]}
             row.update(data_point["values"])
             writer.writerow(row)
-    
+
     print(f"Generated historical data for node {node_id} saved to {file_path}")
 
-# Main function to generate data for all nodes
-def generate_all_data():
-    nodes_config = load_config()
-    data_dir = ensure_data_directory()
-    
-    # Collect all node IDs
-    node_ids = []
-    for domain in nodes_config["domains"]:
-        for sensor_type in domain["sensor_types"]:
-            for node in sensor_type["nodes"]:
-                node_ids.append(node["node_id"])
-    
-    # Generate data for each node
+# Path of a node's CSV file
+def csv_file_path(data_dir, node_id):
+    return os.path.join(data_dir, f"{node_id}_historical_data.csv")
+
+# Points of a node as (CSV timestamp, values) rows, generated WRITE_CHUNK at a time
+def iter_csv_rows(node_id, specs, start, interval, count):
+    noise = KeyedNoise(node_id)
+    for offset in range(0, count, WRITE_CHUNK):
+        block = generate_range(specs, start + offset * interval, interval, min(WRITE_CHUNK, count - offset), noise)
+        yield from zip(format_timestamps(block.timestamp_values(), CSV_TIME_FORMAT), block.rows())
+
+# Stream points of a node to an open CSV file. Columns match save_to_csv.
+def write_csv_rows(csvfile, node_id, specs, start, interval, count, header=True):
+    writer = csv.writer(csvfile)
+    if header:
+        writer.writerow(["timestamp"] + [spec.name for spec in specs])
+    writer.writerows([timestamp] + values for timestamp, values in iter_csv_rows(node_id, specs, start, interval, count))
+
+# Stream points of a node into a column store directory, WRITE_CHUNK points at a time
+def write_columnar_rows(path, node_id, specs, start, interval, count):
+    noise = KeyedNoise(node_id)
+    with ColumnWriter(path, specs) as writer:
+        for offset in range(0, count, WRITE_CHUNK):
+            writer.write_block(generate_range(specs, start + offset * interval, interval, min(WRITE_CHUNK, count - offset), noise))
+
+# Path of a node's output in the given format
+def output_path(data_dir, node_id, output_format):
+    if output_format == "columnar":
+        return store_path(data_dir, node_id)
+    return csv_file_path(data_dir, node_id)
+
+# Split the work into units of (node_id, first timestamp, point count, part).
+# With chunk_points a node's range is split into parts of that many points
+# (part is 0, 1, ...); otherwise every node is one unit (part is None).
+def plan_units(node_ids, start, interval, count, chunk_points=0):
+    units = []
     for node_id in node_ids:
-        data = generate_weekly_data(nodes_config, node_id)
-        if data:
-            save_to_csv(data, node_id, data_dir)
+        if not chunk_points or count <= chunk_points:
+            units.append((node_id, start, count, None))
+            continue
+        for part, offset in enumerate(range(0, count, chunk_points)):
+            units.append((node_id, start + offset * interval, min(chunk_points, count - offset), part))
+    return units
+
+# Generate one unit into its file; returns (node_id, path, part, points)
+def run_unit(node_specs, unit, interval, data_dir, output_format=DEFAULT_FORMAT):
+    node_id, start, count, part = unit
+    specs = node_specs[node_id]
+    final_path = output_path(data_dir, node_id, output_format)
+    path = final_path + (f".part{part:05d}" if part is not None else ".tmp")
+    if output_format == "columnar":
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        write_columnar_rows(path, node_id, specs, start, interval, count)
+        if part is None:
+            write_header(path, make_header(node_id, specs, interval))
+            publish_store(path, final_path)
+            path = final_path
+        return node_id, path, part, count
+    with open(path, "w", newline="") as csvfile:
+        write_csv_rows(csvfile, node_id, specs, start, interval, count, header=not part)
+    if part is None:
+        os.replace(path, final_path)
+        path = final_path
+    return node_id, path, part, count
+
+# Join the part outputs of a node, in order, into its final output
+def merge_parts(node_id, part_paths, data_dir, output_format=DEFAULT_FORMAT, specs=None, interval=None):
+    final_path = output_path(data_dir, node_id, output_format)
+    tmp_path = final_path + ".tmp"
+    if output_format == "columnar":
+        if os.path.exists(tmp_path):
+            shutil.rmtree(tmp_path)
+        os.makedirs(tmp_path)
+        for name in os.listdir(part_paths[0]):
+            with open(os.path.join(tmp_path, name), "wb") as out:
+                for path in part_paths:
+                    with open(os.path.join(path, name), "rb") as part:
+                        shutil.copyfileobj(part, out)
+        write_header(tmp_path, make_header(node_id, specs, interval))
+        publish_store(tmp_path, final_path)
+        for path in part_paths:
+            shutil.rmtree(path)
+        return final_path
+    with open(tmp_path, "wb") as out:
+        for path in part_paths:
+            with open(path, "rb") as part:
+                shutil.copyfileobj(part, out)
+    os.replace(tmp_path, final_path)
+    for path in part_paths:
+        os.remove(path)
+    return final_path
+
+# Epoch seconds of a CSV timestamp (UTC)
+def parse_csv_timestamp(text):
+    return calendar.timegm(time.strptime(text, "%Y-%m-%d %H:%M:%S"))
+
+# (first, last) timestamps of a node's CSV file, or None when the file cannot
+# be appended to (different columns, or rows spaced by another interval than
+# `interval` as told by the last two rows). A partial last line left by an
+# interrupted run is cut off first; timestamps are None when there are no rows.
+def csv_bounds(path, specs, interval):
+    with open(path, "rb+") as f:
+        header = f.readline()
+        if next(csv.reader([header.decode("utf-8")]), None) != ["timestamp"] + [spec.name for spec in specs]:
+            return None
+        first_row = f.readline()
+        size = f.seek(0, os.SEEK_END)
+        tail_start = max(len(header), size - 65536)
+        f.seek(tail_start)
+        tail = f.read()
+        cut = tail.rfind(b"\n")
+        if tail_start + cut + 1 != size:
+            f.truncate(tail_start + cut + 1 if cut >= 0 else len(header))
+            return csv_bounds(path, specs, interval)
+    if not first_row:
+        return None, None
+    rows = tail[:-1].split(b"\n")[-2:] if tail else [first_row]
+    first, *last = [parse_csv_timestamp(row.decode("utf-8").split(",", 1)[0]) for row in [first_row] + rows]
+    # A single row only tells whether it lies on the interval grid
+    spaced = last[1] - last[0] == interval if len(last) == 2 else last[0] % interval == 0
+    return (first, last[-1]) if spaced else None
+
+# Rewrite a CSV file without the rows before `keep_from`; returns the number dropped
+def compact_csv(path, keep_from):
+    tmp_path = path + ".tmp"
+    dropped = 0
+    with open(path, "rb") as src, open(tmp_path, "wb") as out:
+        out.write(src.readline())
+        for line in src:
+            if parse_csv_timestamp(line.decode("utf-8").split(",", 1)[0]) >= keep_from:
+                out.write(line)
+                break
+            dropped += 1
+        shutil.copyfileobj(src, out)
+    os.replace(tmp_path, path)
+    return dropped
+
+# (first, last) timestamps of a node's column store, or None when it cannot
+# be appended to (different interval or columns). Rows of an interrupted
+# append are dropped first.
+def store_bounds(path, node_id, specs, interval):
+    try:
+        store = repair_store(path)
+    except StoreError:
+        return None
+    usable = (
+        store.interval == interval and store.regular
+        and store.header["columns"] == make_header(node_id, specs, interval)["columns"]
+    )
+    bounds = (store.first, store.last)
+    store.close()
+    return bounds if usable else None
+
+# Bring a node's output up to `end`. The high-water mark is the last complete
+# row already written: only the points after it are generated and appended.
+# Output that is missing or cannot be appended to is generated afresh from
+# `start`. With `retention` (seconds), rows older than end - retention are
+# dropped. Returns (node_id, path, None, points) like run_unit.
+def append_node(node_specs, node_id, start, end, interval, data_dir, output_format=DEFAULT_FORMAT, retention=None):
+    specs = node_specs[node_id]
+    path = output_path(data_dir, node_id, output_format)
+    if retention:
+        start = max(start, end - retention)
+
+    bounds = None
+    if os.path.exists(path):
+        if output_format == "columnar":
+            bounds = store_bounds(path, node_id, specs, interval)
+        else:
+            bounds = csv_bounds(path, specs, interval)
+    if bounds is None:
+        first = align_up(start, interval)
+        return run_unit(node_specs, (node_id, first, count_points(first, end, interval), None), interval, data_dir, output_format)
+
+    oldest, high_water_mark = bounds
+    first = high_water_mark + interval if high_water_mark is not None else align_up(start, interval)
+    count = count_points(first, end, interval)
+    if count:
+        if output_format == "columnar":
+            write_columnar_rows(path, node_id, specs, first, interval, count)
+        else:
+            with open(path, "a", newline="") as csvfile:
+                write_csv_rows(csvfile, node_id, specs, first, interval, count, header=False)
+
+    if retention and oldest is not None and oldest < end - retention * (1 + RETENTION_SLACK):
+        if output_format == "columnar":
+            compact_store(path, end - retention)
+        else:
+            compact_csv(path, end - retention)
+    return node_id, path, None, count
+
+# Per-process state of pool workers: compiled specs, loaded once per worker
+_worker_specs = None
+
+def _init_worker(config_path):
+    global _worker_specs
+    _worker_specs = compile_node_specs(build_registry(load_config(config_path)))
+
+def _run_unit_in_worker(args):
+    return run_unit(_worker_specs, *args)
+
+def _append_node_in_worker(args):
+    return append_node(_worker_specs, *args)
+
+# Hold an exclusive lock on the output directory, or return None when another
+# run holds it
+def lock_data_directory(data_dir):
+    lock = open(os.path.join(data_dir, LOCK_FILE), "a")
+    if fcntl is not None:
+        try:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock.close()
+            return None
+    return lock
+
+# Main function to generate data for all nodes (or a selection of them).
+# workers > 1 spreads the units over a process pool (0 means one per core);
+# rows are written as they are generated so memory stays bounded.
+# With `append`, existing output is extended instead of rewritten (see
+# append_node). Returns (node count, points written), or None when another
+# run is writing to the same directory.
+def generate_all_data(node_ids=None, start=None, end=None, interval=DEFAULT_INTERVAL, workers=1,
+                      chunk_points=0, data_dir=None, config_path=None, quiet=False, output_format=DEFAULT_FORMAT,
+                      append=False, retention=None):
+    registry = build_registry(load_config(config_path))
+    node_specs = compile_node_specs(registry)
+    data_dir = ensure_data_directory(data_dir)
+
+    if node_ids is None:
+        node_ids = list(registry.nodes)
+    node_ids = [node_id for node_id in node_ids if node_specs.get(node_id)]
+
+    if end is None:
+        end = int(time.time())
+    if start is None:
+        start = end - DEFAULT_SPAN
+
+    if append:
+        tasks = [(node_id, start, end, interval, data_dir, output_format, retention) for node_id in node_ids]
+        run, run_in_worker = append_node, _append_node_in_worker
+    else:
+        start = align_up(start, interval)
+        units = plan_units(node_ids, start, interval, count_points(start, end, interval), chunk_points)
+        tasks = [(unit, interval, data_dir, output_format) for unit in units]
+        run, run_in_worker = run_unit, _run_unit_in_worker
+    workers = workers or os.cpu_count() or 1
+
+    lock = lock_data_directory(data_dir)
+    if lock is None:
+        return None
+
+    if workers == 1:
+        results = (run(node_specs, *task) for task in tasks)
+        executor = None
+    else:
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(config_path,))
+        chunksize = max(1, min(64, len(tasks) // (workers * 8)))
+        results = executor.map(run_in_worker, tasks, chunksize=chunksize)
+
+    # Results arrive in unit order, so a node's parts are complete when the
+    # next node's first result shows up
+    total_points = 0
+    pending_node, pending_parts = None, []
+    try:
+        for node_id, path, part, points in results:
+            total_points += points
+            if part is None:
+                if not quiet:
+                    if append:
+                        print(f"Appended {points} points for node {node_id} to {path}")
+                    else:
+                        print(f"Generated historical data for node {node_id} saved to {path}")
+                continue
+            if pending_node is not None and node_id != pending_node:
+                final_path = merge_parts(pending_node, pending_parts, data_dir, output_format, node_specs[pending_node], interval)
+                if not quiet:
+                    print(f"Generated historical data for node {pending_node} saved to {final_path}")
+                pending_parts = []
+            pending_node = node_id
+            pending_parts.append(path)
+        if pending_parts:
+            final_path = merge_parts(pending_node, pending_parts, data_dir, output_format, node_specs[pending_node], interval)
+            if not quiet:
+                print(f"Generated historical data for node {pending_node} saved to {final_path}")
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        lock.close()
+
+    return len(node_ids), total_points
+
+# Command line interface
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate historical sensor data.")
+    parser.add_argument("--config", help="Path of nodes.json (default: next to this script)")
+    parser.add_argument("--output-dir", help="Output directory (default: ./data next to this script)")
+    parser.add_argument("--format", choices=OUTPUT_FORMATS, default=DEFAULT_FORMAT, help=f"Output format (default: {DEFAULT_FORMAT})")
+    parser.add_argument("--nodes", help="Comma-separated node IDs to generate")
+    parser.add_argument("--domain", help="Only nodes of this domain ID")
+    parser.add_argument("--sensor-type", help="Only nodes of this sensor type ID")
+    parser.add_argument("--area", help="Only nodes in this node_area")
+    parser.add_argument("--start", help="Range start (epoch seconds, ISO 8601 or YYYYMMDDTHHMMSS)")
+    parser.add_argument("--end", help="Range end, inclusive (default: now)")
+    parser.add_argument("--days", type=float, default=DEFAULT_SPAN / 86400, help="Span when --start is not given (default: 7)")
+    parser.add_argument("--interval", default=str(DEFAULT_INTERVAL), help="Point spacing, e.g. 60, 1m, 15m, 1h (default: 15m)")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes; 0 uses every core (default: 1)")
+    parser.add_argument("--chunk-points", type=int, default=0, help="Split each node into work units of this many points")
+    parser.add_argument("--append", action="store_true", help="Only add the points after each node's last written row")
+    parser.add_argument("--retention", help="With --append, drop rows older than this, e.g. 7d")
+    parser.add_argument("--quiet", action="store_true", help="Do not print a line per node")
+    parser.add_argument("--profile", help="Profile the run and write the result to this file (with --workers > 1 only the coordinating process is profiled)")
+    parser.add_argument("--profile-format", choices=PROFILE_FORMATS, default="pstats",
+                        help="pstats (cProfile, for python -m pstats or snakeviz) or collapsed stacks sampled for flame graphs (default: pstats)")
+    args = parser.parse_args(argv)
+
+    try:
+        interval = parse_interval(args.interval)
+        end = parse_time(args.end) if args.end else int(time.time())
+        start = parse_time(args.start) if args.start else end - int(args.days * 86400)
+        retention = parse_interval(args.retention) if args.retention else None
+    except TimeQueryError as e:
+        parser.error(str(e))
+
+    node_ids = None
+    if args.nodes or args.domain or args.sensor_type or args.area:
+        registry = build_registry(load_config(args.config))
+        node_ids = list(registry.select_nodes(domain=args.domain, sensor_type=args.sensor_type, area=args.area))
+        if args.nodes:
+            wanted = [node_id.strip() for node_id in args.nodes.split(",") if node_id.strip()]
+            unknown = [node_id for node_id in wanted if node_id not in registry.nodes]
+            if unknown:
+                parser.error(f"unknown node IDs: {', '.join(unknown)}")
+            selected = set(node_ids)
+            node_ids = [node_id for node_id in wanted if node_id in selected]
+
+    profiling = profile_run(args.profile, args.profile_format) if args.profile else contextlib.nullcontext()
+    started = time.perf_counter()
+    with profiling:
+        result = generate_all_data(
+            node_ids=node_ids, start=start, end=end, interval=interval, workers=args.workers,
+            chunk_points=args.chunk_points, data_dir=args.output_dir, config_path=args.config, quiet=args.quiet,
+            output_format=args.format, append=args.append, retention=retention,
+        )
+    if args.profile:
+        print(f"Profile written to {args.profile}")
+    if result is None:
+        print("Another run is writing to the output directory; nothing done.")
+        return
+    node_count, points = result
+    elapsed = time.perf_counter() - started
+    print(f"Generated {points} points for {node_count} nodes in {elapsed:.2f}s")
 
 if __name__ == "__main__":
-    generate_all_data()
+    main()
     print("Data generation complete.")
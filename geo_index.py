@@ -0,0 +1,170 @@
+import heapq
+import math
+
+EARTH_RADIUS_KM = 6371.0088
+
+# Grid cells are sized for about this many points each over the extent of
+# the indexed points, within these bounds (degrees)
+CELL_TARGET_POINTS = 4
+MIN_CELL_DEGREES = 0.0001
+MAX_CELL_DEGREES = 10.0
+
+
+# Great-circle distance between two points, in kilometres
+def haversine_km(lat1, lon1, lat2, lon2):
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    a = (math.sin((phi2 - phi1) / 2) ** 2
+         + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+# Spatial index over rows carrying a latitude and a longitude.
+# Points are bucketed in a uniform lat/lon grid whose cell size follows the
+# density of the data, so a bounding box or nearest-neighbour query only
+# looks at the cells around the answer, however many points are indexed.
+# Rows without valid coordinates are left out.
+class GeoIndex:
+    def __init__(self, rows, lat_field="node_latitude", lon_field="node_longitude"):
+        self.rows = tuple(rows)
+        points = []
+        for position, row in enumerate(self.rows):
+            lat, lon = row.get(lat_field), row.get(lon_field)
+            if not isinstance(lat, (int, float)) or not isinstance(lon, (int, float)):
+                continue
+            if -90 <= lat <= 90 and -180 <= lon <= 180:
+                points.append((position, float(lat), float(lon)))
+        self.size = len(points)
+
+        if points:
+            lat_span = max(lat for _, lat, _ in points) - min(lat for _, lat, _ in points)
+            lon_span = max(lon for _, _, lon in points) - min(lon for _, _, lon in points)
+            area = max(lat_span, MIN_CELL_DEGREES) * max(lon_span, MIN_CELL_DEGREES)
+            cell = math.sqrt(area * CELL_TARGET_POINTS / len(points))
+        else:
+            cell = MAX_CELL_DEGREES
+        # Whole columns around the globe, so the last one is as wide as the others
+        self.grid_cols = math.ceil(360 / min(max(cell, MIN_CELL_DEGREES), MAX_CELL_DEGREES))
+        self.cell = 360 / self.grid_cols
+        self.grid_rows = math.ceil(180 / self.cell)
+
+        self.cells = {}
+        for point in points:
+            self.cells.setdefault(self._cell_of(point[1], point[2]), []).append(point)
+
+    def _row_of(self, lat):
+        return min(int((lat + 90) / self.cell), self.grid_rows - 1)
+
+    def _col_of(self, lon):
+        return min(int((lon + 180) / self.cell), self.grid_cols - 1)
+
+    def _cell_of(self, lat, lon):
+        return self._row_of(lat), self._col_of(lon)
+
+    # Grid column ranges covering [min_lon, max_lon]; min_lon > max_lon
+    # crosses the antimeridian
+    def _col_ranges(self, min_lon, max_lon):
+        if min_lon > max_lon:
+            return self._col_ranges(min_lon, 180.0) + self._col_ranges(-180.0, max_lon)
+        first, last = self._col_of(min_lon), self._col_of(max_lon)
+        if max_lon >= 180.0:
+            last = self.grid_cols - 1
+        return [(first, last)]
+
+    # Positions of the rows inside a bounding box (edges included), in row order
+    def within(self, min_lat, min_lon, max_lat, max_lon):
+        if min_lat > max_lat or not self.cells:
+            return []
+        first_row, last_row = self._row_of(min_lat), self._row_of(max_lat)
+        col_ranges = self._col_ranges(min_lon, max_lon)
+        cell_count = (last_row - first_row + 1) * sum(last - first + 1 for first, last in col_ranges)
+        if cell_count <= len(self.cells):
+            buckets = (
+                self.cells.get((row, col), ())
+                for row in range(first_row, last_row + 1)
+                for first, last in col_ranges
+                for col in range(first, last + 1)
+            )
+        else:
+            # The box spans more of the grid than is occupied: walk the occupied cells
+            buckets = (
+                points for (row, col), points in self.cells.items()
+                if first_row <= row <= last_row and any(first <= col <= last for first, last in col_ranges)
+            )
+        wraps = min_lon > max_lon
+        found = []
+        for points in buckets:
+            for position, lat, lon in points:
+                if not min_lat <= lat <= max_lat:
+                    continue
+                if (min_lon <= lon or lon <= max_lon) if wraps else (min_lon <= lon <= max_lon):
+                    found.append(position)
+        found.sort()
+        return found
+
+    # Lower bound (km) on the distance from (lat, lon) to any point outside
+    # the square of cells `ring` steps around its own cell
+    def _outside_bound(self, lat, lon, row, col, ring):
+        bounds = []
+        low = (row - ring) * self.cell - 90
+        high = (row + ring + 1) * self.cell - 90
+        if low > -90:
+            bounds.append(lat - low)
+        if high < 90:
+            bounds.append(high - lat)
+        if 2 * ring + 1 < self.grid_cols:
+            # A point `gap` degrees of longitude away is at least this far
+            # from a meridian plane (the pole, past 90 degrees)
+            west = (col - ring) * self.cell - 180
+            east = (col + ring + 1) * self.cell - 180
+            gap = math.radians(min(lon - west, east - lon, 90.0))
+            bounds.append(math.degrees(math.asin(min(1.0, math.cos(math.radians(lat)) * math.sin(gap)))))
+        if not bounds:
+            return math.inf
+        return math.radians(max(min(bounds), 0.0)) * EARTH_RADIUS_KM
+
+    # The k rows nearest to (lat, lon), optionally within max_km:
+    # [(position, distance in km)] ordered by distance, then row order
+    def nearest(self, lat, lon, k, max_km=None):
+        if k <= 0 or not self.cells:
+            return []
+        limit = math.inf if max_km is None else max_km
+        row, col = self._cell_of(lat, lon)
+        best = []
+        seen = set()
+
+        def consider(points):
+            for position, point_lat, point_lon in points:
+                distance = haversine_km(lat, lon, point_lat, point_lon)
+                if distance > limit:
+                    continue
+                item = (-distance, -position)
+                if len(best) < k:
+                    heapq.heappush(best, item)
+                elif item > best[0]:
+                    heapq.heapreplace(best, item)
+
+        ring = 0
+        while True:
+            if (2 * ring + 1) ** 2 > 4 * len(self.cells):
+                # The search has spread over more cells than are occupied:
+                # finish with the occupied cells not visited yet
+                for key, points in self.cells.items():
+                    if key not in seen:
+                        consider(points)
+                break
+            for cell_row in range(max(row - ring, 0), min(row + ring, self.grid_rows - 1) + 1):
+                edge = abs(cell_row - row) == ring
+                for cell_col in range(col - ring, col + ring + 1) if edge else (col - ring, col + ring):
+                    key = (cell_row, cell_col % self.grid_cols)
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                    points = self.cells.get(key)
+                    if points:
+                        consider(points)
+            bound = self._outside_bound(lat, lon, row, col, ring)
+            if bound > limit or (len(best) == k and -best[0][0] <= bound) or bound == math.inf:
+                break
+            ring += 1
+        return sorted(((-position, -distance) for distance, position in best), key=lambda item: (item[1], item[0]))
@@ -0,0 +1,74 @@
+import threading
+from collections import OrderedDict
+
+# Rough per-record overhead of a cached bytes object and its list slot
+RECORD_OVERHEAD = 41
+
+
+# Bounded LRU cache of rendered history, one entry per aligned block of
+# points. Keys are (node_id, interval, block index); an entry holds the
+# records of a contiguous run of the block's points, starting at `first`
+# (its offset in the block), and grows as neighbouring points are requested.
+# An entry also remembers the parameter specs it was generated from, so a
+# configuration reload that changes a node's parameters turns its old
+# entries into misses.
+class HistoryCache:
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    # Cached (first, records) of a block, or None
+    def get(self, key, specs):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] is not specs:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[3], entry[1]
+
+    # Store the records of a block's points from offset `first` on, evicting
+    # least recently used blocks beyond the memory cap
+    def put(self, key, specs, records, first=0):
+        size = sum(len(record) for record in records) + RECORD_OVERHEAD * len(records)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.bytes -= old[2]
+            self._entries[key] = (specs, records, size, first)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, (_, _, evicted_size, _) = self._entries.popitem(last=False)
+                self.bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    # Counters for the admin endpoint
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
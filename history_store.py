@@ -0,0 +1,115 @@
+import logging
+import os
+import threading
+import time
+
+from column_store import TIMESTAMP_FILE, StoreError, open_store, store_path
+from noise import KeyedNoise
+from timeseries import generate_range
+
+logger = logging.getLogger(__name__)
+
+
+# Pre-generated per-node history (data_generator.py --format columnar) shared
+# by the API. Stores are opened once and memory-mapped, so every worker
+# process serving the same directory reads the same pages from the OS cache.
+# A node's store is re-checked at most every `refresh_interval` seconds and
+# reopened when the generator has appended to or replaced it.
+class HistoryStore:
+    def __init__(self, directory, refresh_interval=5.0):
+        self.directory = directory
+        self.refresh_interval = refresh_interval
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    # (inode, size) of a store's timestamp column, or None when absent
+    def _stat(self, node_id):
+        try:
+            stat = os.stat(os.path.join(store_path(self.directory, node_id), TIMESTAMP_FILE))
+        except OSError:
+            return None
+        return stat.st_ino, stat.st_size
+
+    # The opened store of a node, or None. A fresh entry is returned without
+    # locking; re-checking and reopening happen under the lock, so concurrent
+    # readers of a node see one refresh and one store.
+    def get(self, node_id):
+        entry = self._entries.get(node_id)
+        if entry is not None and time.monotonic() - entry[2] < self.refresh_interval:
+            return entry[0]
+        with self._lock:
+            now = time.monotonic()
+            entry = self._entries.get(node_id)
+            if entry is not None and now - entry[2] < self.refresh_interval:
+                return entry[0]
+            stat = self._stat(node_id)
+            if entry is not None and stat == entry[1]:
+                self._entries[node_id] = (entry[0], stat, now)
+                return entry[0]
+            store = None
+            if stat is not None:
+                try:
+                    store = open_store(self.directory, node_id)
+                except StoreError as e:
+                    logger.warning("History store for %s unavailable: %s", node_id, e)
+            # A replaced store is not closed: requests may still be reading it,
+            # and its mappings are released once they are done
+            self._entries[node_id] = (store, stat, now)
+            return store
+
+    # The store of a node if it holds the node's current parameters on a
+    # regular grid, or None
+    def lookup(self, node_id, specs):
+        store = self.get(node_id)
+        if store is None or not store.length or not store.regular:
+            return None
+        if len(store.columns) != len(specs) or any(
+            column.name != spec.name or column.data_type != spec.data_type
+            for column, spec in zip(store.columns, specs)
+        ):
+            return None
+        return store
+
+    # Block holding the stored point at or before `timestamp` on the store's
+    # grid, or None when the store does not reach that point
+    def latest(self, node_id, specs, timestamp):
+        store = self.lookup(node_id, specs)
+        if store is None:
+            return None
+        point = timestamp - (timestamp - store.first) % store.interval
+        row = store.row_of(point)
+        if row is None:
+            return None
+        return store.rows_block(row, row + 1)
+
+    # Number of nodes with an opened store
+    def __len__(self):
+        return sum(1 for store, _, _ in list(self._entries.values()) if store is not None)
+
+
+# Blocks of a node's history on the grid start, start + interval, ... in
+# chunks of at most `chunk` points. Points the store holds are sliced from it;
+# points before or after it, or when the grid does not line up with the
+# store's, are generated.
+def iter_blocks(history_store, node_id, specs, start, interval, count, chunk):
+    noise = KeyedNoise(node_id)
+    store = history_store.lookup(node_id, specs) if history_store is not None else None
+    if store is None or interval % store.interval or (start - store.first) % store.interval:
+        stored_from = stored_to = count
+    else:
+        # Points [stored_from, stored_to) of the request are in the store
+        stored_from = min(count, max(0, -((start - store.first) // interval)))
+        stored_to = min(count, max(stored_from, (store.last - start) // interval + 1))
+    step = interval // store.interval if store is not None else 1
+
+    for segment_start, segment_end, stored in (
+        (0, stored_from, False), (stored_from, stored_to, True), (stored_to, count, False),
+    ):
+        for offset in range(segment_start, segment_end, chunk):
+            size = min(chunk, segment_end - offset)
+            first = start + offset * interval
+            if stored:
+                row = (first - store.first) // store.interval
+                yield store.rows_block(row, row + size * step, step)
+            else:
+                yield generate_range(specs, first, interval, size, noise)
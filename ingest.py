@@ -0,0 +1,480 @@
+import ast
+import bisect
+import csv
+import io
+import json
+import logging
+import math
+import os
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+from time_query import TimeQueryError, parse_time
+from timeseries import CSV_TIME_FORMAT, Block, format_timestamps
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - exercised on installs without NumPy
+    np = None
+
+logger = logging.getLogger(__name__)
+
+# Typed column of each parameter data type: float64, int64, category codes
+COLUMN_TYPECODES = {"float": "d", "integer": "q", "string": "h"}
+
+# Longest "con" string that is parsed as a Python literal
+MAX_LITERAL_CON = 65536
+
+
+# Raised for a content instance that cannot be ingested
+class IngestError(ValueError):
+    pass
+
+
+# Typed value of a parameter from a pushed value
+def decode_value(spec, value):
+    if isinstance(value, bool):
+        raise IngestError(f"{spec.name}: invalid value {value!r}")
+    try:
+        if spec.data_type == "float":
+            number = float(value)
+            if not math.isfinite(number):
+                raise ValueError
+            return number
+        if spec.data_type == "integer":
+            if isinstance(value, float):
+                if not value.is_integer():
+                    raise ValueError
+                return int(value)
+            return int(value)
+    except (TypeError, ValueError):
+        raise IngestError(f"{spec.name}: invalid {spec.data_type} {value!r}") from None
+    if spec.categories is not None and value in spec.categories:
+        return spec.categories.index(value)
+    raise IngestError(f"{spec.name}: unknown value {value!r}")
+
+
+# Typed values (in spec order) of an m2m:cin "con": a list in parameter order,
+# an object keyed by parameter name, or either rendered as a string (the API
+# renders "con" as str(list))
+def decode_con(specs, con):
+    if isinstance(con, str):
+        text = con.strip()
+        try:
+            con = json.loads(text)
+        except ValueError:
+            if len(text) > MAX_LITERAL_CON:
+                raise IngestError("con is too long") from None
+            try:
+                con = ast.literal_eval(text)
+            except (ValueError, SyntaxError, MemoryError, RecursionError):
+                raise IngestError("con is neither JSON nor a list literal") from None
+    if isinstance(con, dict):
+        missing = [spec.name for spec in specs if spec.name not in con]
+        if missing:
+            raise IngestError(f"missing parameters: {', '.join(missing)}")
+        if len(con) != len(specs):
+            names = {spec.name for spec in specs}
+            raise IngestError(f"unknown parameters: {', '.join(str(name) for name in con if name not in names)}")
+        return [decode_value(spec, con[spec.name]) for spec in specs]
+    if isinstance(con, (list, tuple)):
+        if len(con) != len(specs):
+            raise IngestError(f"expected {len(specs)} values, got {len(con)}")
+        return [decode_value(spec, value) for spec, value in zip(specs, con)]
+    raise IngestError("con must be a list or an object")
+
+
+# (node_id, timestamp, typed values) of a pushed instance:
+# {"node_id": ..., "m2m:cin": {"con": ..., "ct": ...}}. Instances without
+# "ct" are stamped with `now`; `lookup(node_id)` gives the node's specs.
+def decode_instance(instance, lookup, now, max_skew):
+    if not isinstance(instance, dict):
+        raise IngestError("instance must be an object")
+    node_id = instance.get("node_id")
+    cin = instance.get("m2m:cin")
+    if not isinstance(node_id, str):
+        raise IngestError("node_id is required")
+    if not isinstance(cin, dict) or "con" not in cin:
+        raise IngestError("m2m:cin with con is required")
+    specs = lookup(node_id)
+    if not specs:
+        raise IngestError(f"Node with ID {node_id} not found")
+    timestamp = now
+    if cin.get("ct") is not None:
+        try:
+            timestamp = parse_time(str(cin["ct"]))
+        except TimeQueryError as e:
+            raise IngestError(f"ct: {e}") from None
+        if timestamp > now + max_skew:
+            raise IngestError("ct is in the future")
+    return node_id, specs, timestamp, decode_con(specs, cin["con"])
+
+
+# Readings of a node held in time order, from a snapshot of its ring.
+# `overlay` replaces the points of a block on a grid of `interval` seconds
+# that have a recent reading: each grid point takes the last reading at or
+# before it that is less than max(hold, interval) seconds old. A reading is
+# so held for one sampling interval (`hold`) on fine grids, and on coarser
+# grids shows at the next grid point; older readings leave gaps synthesized.
+class IngestWindow:
+    __slots__ = ("specs", "timestamps", "columns", "first", "last", "hold")
+
+    def __init__(self, specs, timestamps, columns, hold):
+        self.specs = specs
+        self.timestamps = timestamps
+        self.columns = columns
+        self.first = timestamps[0]
+        self.last = timestamps[-1]
+        self.hold = hold
+
+    def overlay(self, block, interval):
+        if not len(block):
+            return block
+        timestamps = block.timestamps
+        reach = max(self.hold, interval)
+        if timestamps[0] >= self.last + reach or timestamps[len(block) - 1] < self.first:
+            return block
+        if np is not None:
+            points = np.asarray(timestamps)
+            pushed_times = np.frombuffer(self.timestamps, dtype=np.int64)
+            rows = np.searchsorted(pushed_times, points, side="right") - 1
+            mask = rows >= 0
+            mask[mask] = points[mask] - pushed_times[rows[mask]] < reach
+            rows = rows[mask]
+            columns = []
+            for column, pushed in zip(block.columns, self.columns):
+                column = np.array(column, copy=True)
+                column[mask] = np.frombuffer(pushed, dtype=pushed.typecode)[rows]
+                columns.append(column)
+            return Block(block.specs, timestamps, columns)
+        columns = [array(column.typecode, column) if isinstance(column, array) else list(column) for column in block.columns]
+        for row, point in enumerate(timestamps):
+            source = bisect.bisect_right(self.timestamps, point) - 1
+            if source >= 0 and point - self.timestamps[source] < reach:
+                for column, pushed in zip(columns, self.columns):
+                    column[row] = pushed[source]
+        return Block(block.specs, timestamps, columns)
+
+
+# Columns a ring stores for the given specs: specs rebuilt by a configuration
+# reload with the same layout can use the readings already pushed
+def ring_layout(specs):
+    return tuple((spec.name, spec.data_type, spec.categories) for spec in specs)
+
+
+# Fixed-capacity ring of a node's pushed readings in typed columns.
+# Readings are kept in time order; once full, each new reading overwrites the
+# oldest. `appended` counts every reading ever stored and `flushed` those
+# written to disk, so the ones still to persist are the last appended - flushed.
+class NodeRing:
+    def __init__(self, specs, capacity):
+        self.specs = specs
+        self.layout = ring_layout(specs)
+        self.capacity = capacity
+        self.timestamps = array("q", [0]) * capacity
+        self.columns = [array(COLUMN_TYPECODES[spec.data_type], [0]) * capacity for spec in specs]
+        self.start = 0
+        self.count = 0
+        self.appended = 0
+        self.flushed = 0
+        self.checked_file = False
+        # (appended, encoded latest reading) rendered for /data
+        self.reading = None
+
+    @property
+    def nbytes(self):
+        return sum(column.itemsize * self.capacity for column in self.columns) + 8 * self.capacity
+
+    @property
+    def newest(self):
+        return self.timestamps[(self.start + self.count - 1) % self.capacity] if self.count else None
+
+    # Switch to `specs` when they store the same columns; False otherwise
+    def adopt(self, specs):
+        if specs is self.specs:
+            return True
+        if ring_layout(specs) != self.layout:
+            return False
+        self.specs = specs
+        return True
+
+    def append(self, timestamp, values):
+        position = (self.start + self.count) % self.capacity
+        if self.count == self.capacity:
+            self.start = (self.start + 1) % self.capacity
+        else:
+            self.count += 1
+        self.timestamps[position] = timestamp
+        for column, value in zip(self.columns, values):
+            column[position] = value
+        self.appended += 1
+
+    # Logical rows [first, first + count) as (timestamps, columns) copies
+    def slice(self, first, count):
+        physical = (self.start + first) % self.capacity
+        head = min(count, self.capacity - physical)
+        timestamps = self.timestamps[physical:physical + head] + self.timestamps[:count - head]
+        columns = [column[physical:physical + head] + column[:count - head] for column in self.columns]
+        return timestamps, columns
+
+    # Newest reading as (timestamp, values rendered as in m2m:cin "con")
+    def latest(self):
+        position = (self.start + self.count - 1) % self.capacity
+        values = []
+        for spec, column in zip(self.specs, self.columns):
+            value = column[position]
+            values.append(spec.categories[value] if spec.categories is not None else str(value))
+        return self.timestamps[position], values
+
+
+# Pushed readings of every node, in bounded per-node rings.
+# Rings are allocated on a node's first reading and hold `capacity` readings;
+# all rings together stay under `max_bytes` by dropping the least recently
+# written ring (whose readings are already on disk, when persisting). When `directory` is set,
+# a write-behind thread appends new readings to <directory>/<node>_ingested.csv
+# every `flush_interval` seconds, and a ring created for a node that has such
+# a file starts with its newest readings.
+class IngestStore:
+    def __init__(self, capacity, max_bytes, directory=None, flush_interval=1.0):
+        self.capacity = capacity
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.bytes = 0
+        self.accepted = 0
+        self.rejected = 0
+        self.written = 0
+        self.dropped = 0
+        self.evictions = 0
+        self._rings = OrderedDict()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def file_path(self, node_id):
+        return os.path.join(self.directory, f"{node_id}_ingested.csv")
+
+    # The ring of a node for the given specs, or None. A ring built for specs
+    # with other columns (before a configuration reload) is ignored.
+    def _ring(self, node_id, specs):
+        ring = self._rings.get(node_id)
+        return ring if ring is not None and ring.count and ring.adopt(specs) else None
+
+    # Allocate a ring, making room under max_bytes; None when every ring
+    # still has readings to persist. Called with the lock held.
+    def _allocate(self, node_id, specs):
+        ring = NodeRing(specs, self.capacity)
+        old = self._rings.pop(node_id, None)
+        if old is not None:
+            self.bytes -= old.nbytes
+        while self.bytes + ring.nbytes > self.max_bytes:
+            victim = next((
+                key for key, other in self._rings.items()
+                if not self.directory or other.appended == other.flushed
+            ), None)
+            if victim is None:
+                return None
+            self.bytes -= self._rings.pop(victim).nbytes
+            self.evictions += 1
+        if self.directory:
+            self._restore(node_id, ring)
+        self._rings[node_id] = ring
+        self.bytes += ring.nbytes
+        return ring
+
+    # Load the newest persisted readings of a node into a fresh ring
+    def _restore(self, node_id, ring):
+        path = self.file_path(node_id)
+        try:
+            with open(path, newline="", encoding="utf-8") as f:
+                header = next(csv.reader(f), None)
+            lines = _tail_lines(path, ring.capacity)
+        except (OSError, UnicodeDecodeError):
+            return
+        if header != ["timestamp"] + [spec.name for spec in ring.specs]:
+            return
+        for row in csv.reader(line.decode("utf-8", "replace") for line in lines):
+            try:
+                timestamp = parse_time(row[0])
+                values = [decode_value(spec, value) for spec, value in zip(ring.specs, row[1:])]
+            except (TimeQueryError, IngestError, IndexError):
+                continue
+            if len(values) == len(ring.specs) and (ring.newest is None or timestamp > ring.newest):
+                ring.append(timestamp, values)
+        ring.flushed = ring.appended
+        ring.checked_file = True
+
+    # Store decoded readings [(node_id, specs, timestamp, values)].
+    # Returns a list of (index, detail) for the readings that were refused.
+    def ingest(self, readings):
+        refused = []
+        order = sorted(range(len(readings)), key=lambda index: (readings[index][0], readings[index][2]))
+        with self._lock:
+            for index in order:
+                node_id, specs, timestamp, values = readings[index]
+                ring = self._rings.get(node_id)
+                if ring is None or not ring.adopt(specs):
+                    ring = self._allocate(node_id, specs)
+                    if ring is None:
+                        refused.append((index, "Ingest buffers are full"))
+                        continue
+                else:
+                    self._rings.move_to_end(node_id)
+                newest = ring.newest
+                if newest is not None and timestamp <= newest:
+                    refused.append((index, "ct is not newer than the node's last reading"))
+                    continue
+                ring.append(timestamp, values)
+            self.accepted += len(readings) - len(refused)
+            self.rejected += len(refused)
+        refused.sort()
+        return refused
+
+    # Count decoding failures of the ingest endpoint
+    def count_rejected(self, count):
+        with self._lock:
+            self.rejected += count
+
+    # Whether a node has pushed readings for the given specs
+    def has(self, node_id, specs):
+        return self._ring(node_id, specs) is not None
+
+    # Encoded latest reading of a node, rendered with render(values, timestamp)
+    # once per new reading; None when the node has no pushed readings or its
+    # latest one is older than `since`
+    def latest_reading(self, node_id, specs, render, since=None):
+        with self._lock:
+            ring = self._ring(node_id, specs)
+            if ring is None or (since is not None and ring.newest < since):
+                return None
+            cached = ring.reading
+            if cached is not None and cached[0] == ring.appended:
+                return cached[1]
+            appended = ring.appended
+            timestamp, values = ring.latest()
+        body = render(values, timestamp)
+        ring.reading = (appended, body)
+        return body
+
+    # Snapshot of a node's readings as an IngestWindow, or None
+    def window(self, node_id, specs, hold):
+        with self._lock:
+            ring = self._ring(node_id, specs)
+            if ring is None:
+                return None
+            timestamps, columns = ring.slice(0, ring.count)
+        return IngestWindow(specs, timestamps, columns, hold)
+
+    # Append readings not yet on disk to the nodes' CSV files
+    def flush(self):
+        if not self.directory:
+            return 0
+        with self._flush_lock:
+            pending = []
+            with self._lock:
+                for node_id, ring in self._rings.items():
+                    waiting = ring.appended - ring.flushed
+                    if not waiting:
+                        continue
+                    kept = min(waiting, ring.count)
+                    self.dropped += waiting - kept
+                    pending.append((node_id, ring, ring.appended) + ring.slice(ring.count - kept, kept))
+            written = 0
+            for node_id, ring, appended, timestamps, columns in pending:
+                try:
+                    self._write(node_id, ring, timestamps, columns)
+                except OSError as e:
+                    logger.warning("Cannot persist ingested readings of %s: %s", node_id, e)
+                    continue
+                ring.flushed = appended
+                written += len(timestamps)
+            self.written += written
+            return written
+
+    def _write(self, node_id, ring, timestamps, columns):
+        path = self.file_path(node_id)
+        header = ["timestamp"] + [spec.name for spec in ring.specs]
+        if not ring.checked_file:
+            os.makedirs(self.directory, exist_ok=True)
+            # A file written for other parameters is set aside, not appended to
+            try:
+                with open(path, newline="", encoding="utf-8") as f:
+                    current = next(csv.reader(f), None)
+                if current != header:
+                    os.replace(path, f"{path}.{int(time.time())}")
+            except OSError:
+                pass
+            ring.checked_file = True
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if not os.path.exists(path):
+            writer.writerow(header)
+        rendered = []
+        for spec, column in zip(ring.specs, columns):
+            values = column.tolist()
+            rendered.append([spec.categories[value] for value in values] if spec.categories is not None else values)
+        writer.writerows(
+            [timestamp] + list(values)
+            for timestamp, values in zip(format_timestamps(timestamps.tolist(), CSV_TIME_FORMAT), zip(*rendered))
+        )
+        with open(path, "a", newline="", encoding="utf-8") as f:
+            f.write(buffer.getvalue())
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    # Start the write-behind thread (no-op without a directory)
+    def start_flushing(self):
+        if not self.directory or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="ingest-flusher", daemon=True)
+        self._thread.start()
+
+    # Stop the write-behind thread and persist what is left
+    def stop_flushing(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.flush_interval + 1)
+            self._thread = None
+        self.flush()
+
+    def __len__(self):
+        return len(self._rings)
+
+    # Counters for the admin endpoint
+    def stats(self):
+        return {
+            "nodes": len(self._rings),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "capacity": self.capacity,
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "written": self.written,
+            "dropped": self.dropped,
+            "evictions": self.evictions,
+        }
+
+
+# Last `count` lines of a file (fewer when it is shorter), as bytes
+def _tail_lines(path, count):
+    with open(path, "rb") as f:
+        end = f.seek(0, os.SEEK_END)
+        position = end
+        data = b""
+        while position > 0 and data.count(b"\n") <= count:
+            step = min(65536, position)
+            position -= step
+            f.seek(position)
+            data = f.read(step) + data
+    lines = data.split(b"\n")
+    if lines and not lines[-1]:
+        lines.pop()
+    if position > 0:
+        lines = lines[1:]
+    return lines[-count:]
@@ -0,0 +1,69 @@
+import threading
+
+
+# Latest reading of each node, valid for one sampling slot.
+# Every caller asking for a node within the same slot gets the same reading;
+# concurrent misses for a node are coalesced so it is built only once.
+class LatestReadingCache:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._entries = {}
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    # The reading of `node_id` for `slot`, calling `build()` on a miss.
+    # Entries built from other parameter specs (before a reload) are stale.
+    def get(self, node_id, slot, specs, build):
+        entry = self._entries.get(node_id)
+        if entry is not None and entry[0] == slot and entry[1] is specs:
+            self.hits += 1
+            return entry[2]
+
+        with self._lock:
+            entry = self._entries.get(node_id)
+            if entry is not None and entry[0] == slot and entry[1] is specs:
+                self.hits += 1
+                return entry[2]
+            key = (node_id, slot)
+            pending = self._pending.get(key)
+            if pending is None:
+                pending = self._pending[key] = threading.Event()
+                owner = True
+                self.misses += 1
+            else:
+                owner = False
+                self.coalesced += 1
+
+        if not owner:
+            pending.wait()
+            entry = self._entries.get(node_id)
+            if entry is not None and entry[0] == slot and entry[1] is specs:
+                return entry[2]
+            # The builder failed or a newer slot replaced it; build our own
+            return build()
+
+        try:
+            value = build()
+            with self._lock:
+                current = self._entries.get(node_id)
+                if current is None or current[0] <= slot:
+                    self._entries[node_id] = (slot, specs, value)
+            return value
+        finally:
+            with self._lock:
+                del self._pending[key]
+            pending.set()
+
+    def __len__(self):
+        return len(self._entries)
+
+    # Counters for the admin endpoint
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+        }
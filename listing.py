@@ -0,0 +1,149 @@
+import hashlib
+import json
+import threading
+
+from time_query import TimeQueryError, decode_cursor, encode_cursor
+
+
+# Raised for a listing query that cannot be answered (unknown field, bad cursor)
+class ListingError(ValueError):
+    pass
+
+
+# A page of a listing query
+class ListingPage:
+    __slots__ = ("rows", "total", "offset", "next_offset")
+
+    def __init__(self, rows, total, offset, next_offset):
+        self.rows = rows
+        self.total = total
+        self.offset = offset
+        self.next_offset = next_offset
+
+
+# Rows of a list endpoint with secondary indexes on some of their fields.
+# Built once per configuration snapshot; a filter is answered by intersecting
+# index entries (smallest first) instead of scanning every row, and sort
+# orders over the whole listing are computed once and reused.
+class Listing:
+    def __init__(self, rows, index_fields):
+        self.rows = tuple(rows)
+        fields = {}
+        for row in self.rows:
+            fields.update(dict.fromkeys(row))
+        self.fields = tuple(fields)
+        self.index_fields = tuple(index_fields)
+        self.indexes = {}
+        for field in self.index_fields:
+            index = {}
+            for position, row in enumerate(self.rows):
+                index.setdefault(row.get(field), []).append(position)
+            self.indexes[field] = {value: tuple(positions) for value, positions in index.items()}
+        self._orders = {}
+        self._lock = threading.Lock()
+
+    # Row positions matching every filter (field -> value), in listing order;
+    # None when there are no filters
+    def select(self, filters):
+        candidates = []
+        for field, value in filters.items():
+            if value is None:
+                continue
+            if field not in self.indexes:
+                raise ListingError(f"Cannot filter on {field!r}")
+            candidates.append(self.indexes[field].get(value, ()))
+        if not candidates:
+            return None
+        candidates.sort(key=len)
+        if len(candidates) == 1:
+            return candidates[0]
+        others = [frozenset(positions) for positions in candidates[1:]]
+        return tuple(position for position in candidates[0] if all(position in group for group in others))
+
+    # Positions of all rows sorted by a field (None values last)
+    def _order(self, field, descending):
+        key = (field, descending)
+        order = self._orders.get(key)
+        if order is None:
+            rows = self.rows
+            present = [position for position in range(len(rows)) if rows[position].get(field) is not None]
+            missing = [position for position in range(len(rows)) if rows[position].get(field) is None]
+            present.sort(key=lambda position: rows[position][field], reverse=descending)
+            order = tuple(present + missing)
+            with self._lock:
+                self._orders[key] = order
+        return order
+
+    # Sort positions by "field" or "-field" (descending); ties keep listing order
+    def sort(self, positions, sort):
+        descending = sort.startswith("-")
+        field = sort[1:] if descending else sort
+        if field not in self.fields:
+            raise ListingError(f"Cannot sort on {field!r}")
+        order = self._order(field, descending)
+        if positions is None:
+            return order
+        # A small selection is cheaper to sort directly than to walk the full order
+        if len(positions) * 8 < len(order):
+            rows = self.rows
+            present = [position for position in positions if rows[position].get(field) is not None]
+            missing = [position for position in positions if rows[position].get(field) is None]
+            if descending:
+                # Keep listing order among equal values, as the precomputed order does
+                present.sort()
+                present.sort(key=lambda position: rows[position][field], reverse=True)
+            else:
+                present.sort(key=lambda position: rows[position][field])
+            return present + missing
+        selected = frozenset(positions)
+        return [position for position in order if position in selected]
+
+    # Check a projection and return the field names to keep (None keeps all)
+    def projection(self, fields):
+        if not fields:
+            return None
+        unknown = [field for field in fields if field not in self.fields]
+        if unknown:
+            raise ListingError(f"Unknown fields: {', '.join(unknown)}")
+        return fields
+
+    # Run a listing query: filter, sort, page and project
+    def query(self, filters=None, sort=None, fields=None, offset=0, limit=None):
+        keep = self.projection(fields)
+        positions = self.select(filters or {})
+        if sort:
+            positions = self.sort(positions, sort)
+        elif positions is None:
+            positions = range(len(self.rows))
+        total = len(positions)
+        end = total if limit is None else min(total, offset + limit)
+        rows = [self.rows[position] for position in positions[offset:end]]
+        if keep is not None:
+            rows = [{field: row.get(field) for field in keep} for row in rows]
+        return ListingPage(rows, total, offset, end if end < total else None)
+
+
+# Short digest identifying a listing query (without its paging), so a cursor
+# cannot be replayed against a different filter or sort order
+def query_subject(name, filters, sort, fields):
+    raw = json.dumps([name, filters, sort, fields], separators=(",", ":"), sort_keys=True)
+    return hashlib.blake2b(raw.encode("utf-8"), digest_size=6).hexdigest()
+
+
+# Opaque cursor for the next page of a listing query; `subject` ties it to
+# the listing and the query that produced it
+def encode_listing_cursor(subject, offset):
+    return encode_cursor(s=subject, o=offset)
+
+
+def decode_listing_cursor(subject, cursor):
+    try:
+        state = decode_cursor(cursor)
+        owner, offset = state["s"], int(state["o"])
+    except (TimeQueryError, KeyError, TypeError, ValueError):
+        raise ListingError("Invalid cursor") from None
+    if owner != subject:
+        raise ListingError("Cursor does not belong to this query")
+    if offset < 0:
+        raise ListingError("Invalid cursor")
+    return offset
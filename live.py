@@ -0,0 +1,135 @@
+import asyncio
+import heapq
+import logging
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+# One client's subscription to a set of nodes.
+# Readings wait in a bounded queue; when a slow consumer lets it fill up,
+# the oldest reading is dropped and counted.
+class Subscription:
+    def __init__(self, node_ids, max_queue):
+        self.node_ids = frozenset(node_ids)
+        self.dropped = 0
+        self._queue = deque(maxlen=max_queue)
+        self._ready = asyncio.Event()
+        self.closed = False
+
+    def push(self, item):
+        if len(self._queue) == self._queue.maxlen:
+            self.dropped += 1
+        self._queue.append(item)
+        self._ready.set()
+
+    # Wait up to `timeout` seconds for readings; returns the queued ones
+    # (possibly none on timeout)
+    async def next_batch(self, timeout=None):
+        if not self._queue:
+            self._ready.clear()
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return []
+        items = list(self._queue)
+        self._queue.clear()
+        return items
+
+    # Number of readings dropped since the last call
+    def take_dropped(self):
+        dropped, self.dropped = self.dropped, 0
+        return dropped
+
+
+# Generates each subscribed node's reading once per sampling interval and
+# fans it out to every subscriber of that node.
+# `interval_of(node_id)` gives a node's interval in seconds (None for an
+# unknown node) and `build_batch(node_ids, timestamp)` returns
+# {node_id: reading}; it runs in the default executor so generation does not
+# block the event loop. Readings are due on the interval grid (ts % interval == 0).
+class TickScheduler:
+    def __init__(self, interval_of, build_batch, tick=1.0):
+        self.interval_of = interval_of
+        self.build_batch = build_batch
+        self.tick = tick
+        self.readings_published = 0
+        self._subscribers = {}
+        self._due = []
+        self._scheduled = set()
+        self._task = None
+
+    @property
+    def subscription_count(self):
+        return len({id(sub) for subs in self._subscribers.values() for sub in subs})
+
+    # Register a subscription; starts the scheduler on first use
+    def subscribe(self, node_ids, max_queue):
+        subscription = Subscription(node_ids, max_queue)
+        now = int(time.time())
+        for node_id in subscription.node_ids:
+            subscribers = self._subscribers.get(node_id)
+            if subscribers is None:
+                interval = self.interval_of(node_id)
+                if not interval:
+                    continue
+                subscribers = self._subscribers[node_id] = set()
+                # A node left in the heap by an earlier subscription keeps its slot
+                if node_id not in self._scheduled:
+                    self._scheduled.add(node_id)
+                    heapq.heappush(self._due, (now - now % interval + interval, node_id))
+            subscribers.add(subscription)
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        return subscription
+
+    def unsubscribe(self, subscription):
+        subscription.closed = True
+        for node_id in subscription.node_ids:
+            subscribers = self._subscribers.get(node_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[node_id]
+
+    # Pop every node due at or before `now`, grouped by due timestamp
+    def _pop_due(self, now):
+        due = {}
+        while self._due and self._due[0][0] <= now:
+            timestamp, node_id = heapq.heappop(self._due)
+            interval = self.interval_of(node_id)
+            if node_id not in self._subscribers or not interval:
+                # Unsubscribed, or removed from the configuration by a reload
+                self._scheduled.discard(node_id)
+                self._subscribers.pop(node_id, None)
+                continue
+            # Readings missed while idle are skipped, not replayed
+            timestamp = max(timestamp, now - now % interval)
+            due.setdefault(timestamp, []).append(node_id)
+            heapq.heappush(self._due, (timestamp + interval, node_id))
+        return due
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while self._subscribers:
+            for timestamp, node_ids in self._pop_due(int(time.time())).items():
+                try:
+                    readings = await loop.run_in_executor(None, self.build_batch, node_ids, timestamp)
+                except Exception:
+                    logger.exception("Live reading generation failed")
+                    continue
+                for node_id, reading in readings.items():
+                    for subscription in self._subscribers.get(node_id, ()):
+                        subscription.push(reading)
+                self.readings_published += len(readings)
+            await asyncio.sleep(self.tick - time.time() % self.tick)
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -0,0 +1,219 @@
+import asyncio
+import bisect
+import collections
+import threading
+import time
+
+# Latency buckets (seconds) and response size buckets (bytes)
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216, 67108864)
+
+# Content type of the Prometheus text exposition format
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs.extend(f'{name}="{_escape(value)}"' for name, value in extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value)
+
+
+# Monotonic counter per label set
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, documentation, label_names=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels=(), amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        for labels, value in list(self._values.items()):
+            yield self.name, _labels(self.label_names, labels), value
+
+
+# Histogram per label set with fixed upper bounds
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, documentation, buckets, label_names=()):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self.label_names = tuple(label_names)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def samples(self):
+        for labels, (counts, total) in list(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                yield (
+                    f"{self.name}_bucket",
+                    _labels(self.label_names, labels, (("le", _number(float(bound))),)),
+                    cumulative,
+                )
+            yield f"{self.name}_sum", _labels(self.label_names, labels), total
+            yield f"{self.name}_count", _labels(self.label_names, labels), cumulative
+
+
+# Metric whose samples are read from `collect()` at scrape time:
+# an iterable of (label values, value)
+class Collected:
+    def __init__(self, name, documentation, kind, label_names, collect):
+        self.name = name
+        self.documentation = documentation
+        self.kind = kind
+        self.label_names = tuple(label_names)
+        self.collect = collect
+
+    def samples(self):
+        for labels, value in self.collect():
+            yield self.name, _labels(self.label_names, labels), value
+
+
+# The metrics of one process, rendered in the Prometheus text format
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, label_names=()):
+        return self.register(Counter(name, documentation, label_names))
+
+    def histogram(self, name, documentation, buckets, label_names=()):
+        return self.register(Histogram(name, documentation, buckets, label_names))
+
+    def collected(self, name, documentation, kind, label_names, collect):
+        return self.register(Collected(name, documentation, kind, label_names, collect))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+# Points generated per parameter model, shared by every generator in the process
+class PointCounter:
+    def __init__(self):
+        self.total = 0
+        self._by_model = {}
+        self._lock = threading.Lock()
+
+    def add(self, specs, count):
+        with self._lock:
+            for spec in specs:
+                self._by_model[spec.model] = self._by_model.get(spec.model, 0) + count
+            self.total += count * len(specs)
+
+    def by_model(self):
+        return list(self._by_model.items())
+
+
+points_generated = PointCounter()
+
+
+# Records each request's latency, status and response size, labelled with
+# the route template it matched (not the raw path, to bound cardinality)
+class MetricsMiddleware:
+    def __init__(self, app, requests, latency, sizes):
+        self.app = app
+        self.requests = requests
+        self.latency = latency
+        self.sizes = sizes
+        self._routes = None
+
+    def _route(self, scope):
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        if self._routes is None:
+            router = scope.get("router")
+            self._routes = {route.endpoint: route.path for route in getattr(router, "routes", ()) if hasattr(route, "endpoint")}
+        return self._routes.get(endpoint, "unmatched")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        state = [500, 0]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                state[0] = message["status"]
+            elif message["type"] == "http.response.body":
+                state[1] += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = self._route(scope)
+            method = scope["method"]
+            status = str(state[0])
+            self.requests.inc((method, route, status))
+            self.latency.observe((method, route, status), time.perf_counter() - started)
+            self.sizes.observe((method, route), state[1])
+
+
+# Samples how late the event loop wakes up from a sleep of `interval`
+# seconds and the rate at which points are generated over `window` seconds
+class RuntimeMonitor:
+    def __init__(self, interval=0.5, window=10.0):
+        self.interval = interval
+        self.window = window
+        self.lag = 0.0
+        self.max_lag = 0.0
+        self.points_per_second = 0.0
+        self._history = collections.deque()
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.lag = max(0.0, loop.time() - expected)
+            self.max_lag = max(self.max_lag, self.lag)
+            now = time.monotonic()
+            self._history.append((now, points_generated.total))
+            while len(self._history) > 2 and now - self._history[0][0] > self.window:
+                self._history.popleft()
+            first_time, first_total = self._history[0]
+            if now > first_time:
+                self.points_per_second = (points_generated.total - first_total) / (now - first_time)
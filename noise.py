@@ -0,0 +1,112 @@
+import hashlib
+import random
+from array import array
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - exercised on installs without NumPy
+    np = None
+
+MASK64 = (1 << 64) - 1
+# Weyl increment of SplitMix64
+GOLDEN_GAMMA = 0x9E3779B97F4A7C15
+# 2 ** -53, turns the top 53 bits of a 64-bit word into a float in [0, 1)
+UNIT = 1.0 / (1 << 53)
+
+
+# Stable 64-bit key of a tuple of strings.
+# Unlike hash(), this is the same in every process and on every restart.
+def stable_key(*parts):
+    digest = hashlib.blake2b("\x1f".join(str(part) for part in parts).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+# SplitMix64 finalizer
+def mix64(x):
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & MASK64
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & MASK64
+    return x ^ (x >> 31)
+
+
+# Uniform in [0, 1) that is a pure function of (key, counter)
+def counter_uniform(key, counter):
+    return (mix64((key + counter * GOLDEN_GAMMA) & MASK64) >> 11) * UNIT
+
+
+if np is not None:
+    _GAMMA = np.uint64(GOLDEN_GAMMA)
+    _M1 = np.uint64(0xBF58476D1CE4E5B9)
+    _M2 = np.uint64(0x94D049BB133111EB)
+    _S11, _S27, _S30, _S31 = np.uint64(11), np.uint64(27), np.uint64(30), np.uint64(31)
+
+    def _counter_uniforms_numpy(key, counters):
+        x = np.asarray(counters).astype(np.uint64) * _GAMMA + np.uint64(key)
+        x = (x ^ (x >> _S30)) * _M1
+        x = (x ^ (x >> _S27)) * _M2
+        x = x ^ (x >> _S31)
+        return (x >> _S11).astype(np.float64) * UNIT
+
+
+# Vector of counter_uniform(key, c) for every counter
+def counter_uniforms(key, counters):
+    if np is not None:
+        return _counter_uniforms_numpy(key, counters)
+    return array("d", [counter_uniform(key, counter) for counter in counters])
+
+
+# Keyed, counter-based noise for one node.
+# The draw for (parameter, stream, timestamp) never depends on what else was
+# generated before it, so any historical point can be recomputed in O(1) and
+# every worker process produces the same value.
+class KeyedNoise:
+    __slots__ = ("node_id", "_keys")
+
+    def __init__(self, node_id):
+        self.node_id = node_id
+        self._keys = {}
+
+    def key(self, name, stream):
+        key = self._keys.get((name, stream))
+        if key is None:
+            key = self._keys[(name, stream)] = stable_key(self.node_id, name, stream)
+        return key
+
+    def uniform(self, name, stream, timestamp):
+        return counter_uniform(self.key(name, stream), timestamp)
+
+    def uniforms(self, name, stream, timestamps):
+        return counter_uniforms(self.key(name, stream), timestamps)
+
+
+# Noise from a seeded pseudo-random stream, for callers that do not need
+# reproducible values
+class RandomNoise:
+    def __init__(self, seed=None):
+        self._random = random.Random(seed).random
+        self._numpy = np.random.default_rng(seed) if np is not None else None
+
+    def uniform(self, name, stream, timestamp):
+        return self._random()
+
+    def uniforms(self, name, stream, timestamps):
+        if self._numpy is not None:
+            return self._numpy.random(len(timestamps))
+        draw = self._random
+        return array("d", [draw() for _ in range(len(timestamps))])
+
+
+# Stable oneM2M resource identifiers of a content instance.
+# Derived from one digest of (node, timestamp) so they match across workers.
+def resource_ids(node_id, timestamp):
+    digest = hashlib.blake2b(f"{node_id}-{timestamp}".encode(), digest_size=32).digest()
+    pi = int.from_bytes(digest[0:9], "little") % 90000000000000000000 + 10000000000000000000
+    ri = int.from_bytes(digest[9:18], "little") % 90000000000000000000 + 10000000000000000000
+    rn = int.from_bytes(digest[18:26], "little") % 90000000000000000 + 10000000000000000
+    st = int.from_bytes(digest[26:29], "little") % 90000 + 10000
+    return {
+        "pi": f"3-{pi}",
+        "ri": f"4-{ri}",
+        "rn": f"4-{rn}",
+        "st": st,
+        "cr": f"SOriginAE-{digest[29]:02X}",
+    }
@@ -0,0 +1,273 @@
+import bisect
+import math
+import re
+import time
+
+from metrics import points_generated
+
+# Leading digits of the fractional part of a resolution, e.g. "0.01 ppm" -> "01"
+_RESOLUTION_DECIMALS = re.compile(r"\.(\d+)")
+# Numeric part of the first "±" token of an accuracy, e.g. "±0.5°C" -> "0.5"
+_ACCURACY_RANGE = re.compile(r"^±([\d.]+)")
+
+# Signal models by parameter name substring, checked in order.
+# "CO2" must come before "CO" and "AQL" before "AQI" so the longer names win.
+FLOAT_MODELS = (
+    ("Temperature", "temperature"),
+    ("Humidity", "humidity"),
+    ("PM2.5", "particulate"),
+    ("PM10", "particulate"),
+    ("CO2", "co2"),
+    ("CO", "co"),
+    ("O3", "o3"),
+    ("NO2", "no2"),
+    ("pH", "ph"),
+    ("Turbidity", "turbidity"),
+    ("Dissolved Oxygen", "dissolved_oxygen"),
+    ("TDS", "tds"),
+    ("AQI", "aqi"),
+)
+INTEGER_MODELS = (
+    ("AQI", "aqi"),
+    ("Data Interval", "data_interval"),
+)
+STRING_MODELS = (
+    ("AQL", "aql"),
+    ("AQI-MP", "main_pollutant"),
+)
+DEFAULT_MODELS = {"float": "uniform", "integer": "randint", "string": "unknown"}
+
+# Physical limits applied after noise
+CLAMPS = {
+    "temperature": (-20.0, 50.0),
+    "humidity": (0.0, 100.0),
+    "ph": (0.0, 14.0),
+}
+
+POLLUTANTS = ("PM2.5", "PM10", "NO2", "O3", "CO", "SO2")
+POLLUTANT_CUM_WEIGHTS = (0.4, 0.65, 0.8, 0.9, 0.95, 1.0)
+
+# Upper AQI bound of each air quality level
+AQL_LEVELS = (
+    (50, "Good"),
+    (100, "Moderate"),
+    (150, "Unhealthy for Sensitive Groups"),
+    (200, "Unhealthy"),
+    (300, "Very Unhealthy"),
+)
+
+
+# A parameter definition from nodes.json with its strings parsed once
+class ParameterSpec:
+    __slots__ = (
+        "name", "data_type", "decimal_places", "scale", "noise", "noise_low", "noise_span",
+        "model", "hour_table", "day_table", "term", "clamp", "categories", "param",
+    )
+
+    def __init__(self, name, data_type, decimal_places, noise, model, clamp, param):
+        self.name = name
+        self.data_type = data_type
+        self.decimal_places = decimal_places
+        self.scale = 10.0 ** decimal_places
+        self.noise = noise
+        self.noise_low = -noise
+        self.noise_span = 2 * noise
+        self.model = model
+        hour_fn, day_fn, term = MODEL_TERMS.get(model, (None, None, None))
+        self.hour_table = tuple(float(hour_fn(hour)) for hour in range(24)) if hour_fn else None
+        # Indexed by tm_yday (1-366); slot 0 is unused
+        self.day_table = tuple(float(day_fn(day)) for day in range(367)) if day_fn else None
+        self.term = term
+        self.clamp = clamp
+        self.categories = STRING_CATEGORIES.get(model) if data_type == "string" else None
+        self.param = param
+
+    def __repr__(self):
+        return f"ParameterSpec({self.name!r}, {self.data_type!r}, model={self.model!r})"
+
+
+# Number of decimal places implied by a resolution string (1 when unspecified)
+def parse_decimal_places(resolution):
+    match = _RESOLUTION_DECIMALS.search(resolution or "")
+    return len(match.group(1)) if match else 1
+
+
+# Noise half-range implied by an accuracy string (1.0 when unspecified)
+def parse_noise_range(accuracy):
+    for part in (accuracy or "").split():
+        if part.startswith("±"):
+            match = _ACCURACY_RANGE.match(part)
+            if match:
+                try:
+                    return float(match.group(1))
+                except ValueError:
+                    pass
+            break
+    return 1.0
+
+
+# Pick the signal model for a parameter from its name and data type
+def resolve_model(name, data_type):
+    table = {"float": FLOAT_MODELS, "integer": INTEGER_MODELS, "string": STRING_MODELS}.get(data_type, ())
+    for needle, model in table:
+        if needle in name:
+            return model
+    return DEFAULT_MODELS.get(data_type, "unknown")
+
+
+# Compile one parameter definition
+def compile_parameter(param):
+    name = param["parameter_name"]
+    data_type = param["data_type"]
+    model = resolve_model(name, data_type)
+    return ParameterSpec(
+        name=name,
+        data_type=data_type,
+        decimal_places=parse_decimal_places(param.get("resolution")),
+        noise=parse_noise_range(param.get("accuracy")),
+        model=model,
+        clamp=CLAMPS.get(model),
+        param=param,
+    )
+
+
+# Compile the parameter list of every node in a registry.
+# Parameter dicts shared between sensor types are compiled only once.
+def compile_node_specs(registry):
+    compiled = {}
+    node_specs = {}
+    for node_id, parameters in registry.node_parameters.items():
+        specs = []
+        for param in parameters:
+            spec = compiled.get(id(param))
+            if spec is None:
+                spec = compiled[id(param)] = compile_parameter(param)
+            specs.append(spec)
+        node_specs[node_id] = tuple(specs)
+    return node_specs
+
+
+# Sampling interval of a node in seconds: the value of its "Data Interval"
+# parameter where present, `default` otherwise
+def sampling_interval(specs, default):
+    for spec in specs:
+        if spec.model == "data_interval" and spec.hour_table is not None:
+            return max(1, int(spec.hour_table[0]))
+    return default
+
+
+# Curve shapes shared by the signal models, all in [0, 1]
+def daylight_factor(hour):
+    return 1 - abs(hour - 12) / 12
+
+
+def rush_hour_factor(hour):
+    return max(0, 1 - min(abs(hour - 8), abs(hour - 18)) / 4)
+
+
+def activity_factor(hour):
+    return max(0, 1 - abs(hour - 14) / 10)
+
+
+def sun_factor(hour):
+    return max(0, 1 - abs(hour - 14) / 8)
+
+
+def seasonal_factor(day_of_year):
+    return 0.5 * (1 + (day_of_year % 365) / 365 * 2 - 1)
+
+
+# Map an AQI value to its air quality level
+def air_quality_level(aqi):
+    for upper, level in AQL_LEVELS:
+        if aqi <= upper:
+            return level
+    return "Hazardous"
+
+
+# Signal models as lookup tables: a base value per hour of the day, an
+# optional offset per day of the year and an optional random term.
+# Keeping models in this shape lets the scalar generator below and the
+# batched engine in timeseries.py share exactly the same arithmetic.
+MODEL_TERMS = {
+    "temperature": (lambda hour: 20 + 7 * daylight_factor(hour), lambda day: seasonal_factor(day) * 5, None),
+    "humidity": (lambda hour: 60 - 20 * daylight_factor(hour), None, None),
+    "particulate": (lambda hour: 15 + rush_hour_factor(hour) * 30, None, None),
+    "co2": (lambda hour: 400 + activity_factor(hour) * 800, None, None),
+    "co": (lambda hour: 0.5 + rush_hour_factor(hour) * 1.0, None, None),
+    "o3": (lambda hour: 0.02 + sun_factor(hour) * 0.05, None, None),
+    "no2": (lambda hour: 0.02 + rush_hour_factor(hour) * 0.05, None, None),
+    "ph": (lambda hour: 7.0, None, ("uniform", -0.5, 0.5)),
+    "turbidity": (lambda hour: 2.0, None, ("bernoulli", 0.3, 5.0)),
+    "dissolved_oxygen": (lambda hour: max(4, 14 - (20 + 7 * daylight_factor(hour)) * 0.3), None, None),
+    "tds": (lambda hour: 250 + 15 * daylight_factor(hour), None, ("uniform", -20, 20)),
+    "aqi": (lambda hour: 60 + rush_hour_factor(hour) * 50, None, None),
+    "data_interval": (lambda hour: 60, None, None),
+    "randint": (lambda hour: 0, None, ("randint", 0, 100)),
+    "uniform": (lambda hour: 0, None, ("uniform", 0, 100)),
+}
+
+# Categories of the string models, in code order
+STRING_CATEGORIES = {
+    "aql": tuple(level for _, level in AQL_LEVELS) + ("Hazardous",),
+    "main_pollutant": POLLUTANTS,
+    "unknown": ("Unknown",),
+}
+
+# Hour table of the AQI model, used by AQL when a node has no AQI parameter
+AQI_HOUR_TABLE = tuple(float(MODEL_TERMS["aqi"][0](hour)) for hour in range(24))
+
+
+# Apply a random term to a base value given a uniform draw in [0, 1)
+def apply_term(term, value, u):
+    kind, a, b = term
+    if kind == "uniform":
+        return value + (a + (b - a) * u)
+    if kind == "bernoulli":
+        return value + (b if u < a else 0.0)
+    return value + (a + math.floor(u * (b - a + 1)))
+
+
+# Round half-to-even at a number of decimal places, the same way NumPy does
+def round_to(value, scale):
+    return round(value * scale) / scale
+
+
+# Generate one reading (a list of typed values) for compiled specs at an
+# epoch-second timestamp (UTC). Float values carry accuracy noise and are
+# rounded to the resolution, integer values are whole model values and string
+# values are categories. Draws come from a noise source (see noise.py) using
+# the same (parameter, stream, timestamp) addressing as timeseries.py, so a
+# point generated here matches the same point of a batched block.
+def generate_values(specs, timestamp, noise):
+    timestamp = int(timestamp)
+    hour = (timestamp // 3600) % 24
+    day_of_year = time.gmtime(timestamp).tm_yday
+    values = []
+    aqi = None
+    for spec in specs:
+        model = spec.model
+        if spec.hour_table is not None:
+            value = spec.hour_table[hour]
+            if spec.day_table is not None:
+                value += spec.day_table[day_of_year]
+            if spec.term is not None:
+                value = apply_term(spec.term, value, noise.uniform(spec.name, 0, timestamp))
+            if spec.data_type == "float":
+                u = noise.uniform(spec.name, 1, timestamp)
+                value = round_to(value + (spec.noise_low + spec.noise_span * u), spec.scale)
+                if spec.clamp is not None:
+                    value = max(spec.clamp[0], min(spec.clamp[1], value))
+            else:
+                value = int(value)
+            if model == "aqi" and aqi is None:
+                aqi = int(value)
+        elif model == "aql":
+            value = air_quality_level(aqi if aqi is not None else int(AQI_HOUR_TABLE[hour]))
+        elif model == "main_pollutant":
+            value = POLLUTANTS[bisect.bisect(POLLUTANT_CUM_WEIGHTS, noise.uniform(spec.name, 0, timestamp))]
+        else:
+            value = "Unknown"
+        values.append(value)
+    points_generated.add(specs, 1)
+    return values
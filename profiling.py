@@ -0,0 +1,215 @@
+import collections
+import contextlib
+import contextvars
+import cProfile
+import itertools
+import os
+import sys
+import threading
+import time
+
+# Phases of a profiled request, in the order they are reported
+PHASES = ("lookup", "generation", "envelope", "serialization")
+
+# Output formats of run profiles
+PROFILE_FORMATS = ("pstats", "collapsed")
+
+# Profile of the request being handled, if it is profiled. Context variables
+# follow the request into threadpool calls, so helpers anywhere on its path
+# can charge time to it without being passed the profile.
+current_profile = contextvars.ContextVar("current_profile", default=None)
+
+
+# Wall time of one request split by phase. Time is charged to the innermost
+# open phase only, so nested phases (generation pulled while serializing)
+# are not counted twice; time in no phase is reported as "other".
+class RequestProfile:
+    def __init__(self, route, sampled=False):
+        self.route = route
+        self.sampled = sampled
+        self.phases = dict.fromkeys(PHASES, 0.0)
+        self.started = time.perf_counter()
+        self.total = None
+        self._stack = []
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        now = time.perf_counter()
+        if self._stack:
+            outer = self._stack[-1]
+            self.phases[outer[0]] += now - outer[1]
+        self._stack.append([name, now])
+        try:
+            yield
+        finally:
+            now = time.perf_counter()
+            name, since = self._stack.pop()
+            self.phases[name] = self.phases.get(name, 0.0) + now - since
+            if self._stack:
+                self._stack[-1][1] = now
+
+    def finish(self):
+        if self.total is None:
+            self.total = time.perf_counter() - self.started
+        return self
+
+    def other(self):
+        return max(0.0, self.finish().total - sum(self.phases.values()))
+
+    # Server-Timing header value, durations in milliseconds
+    def server_timing(self):
+        parts = [f"{name};dur={seconds * 1000:.3f}" for name, seconds in self.phases.items()]
+        parts.append(f"other;dur={self.other() * 1000:.3f}")
+        parts.append(f"total;dur={self.total * 1000:.3f}")
+        return ", ".join(parts)
+
+    def describe(self):
+        result = {name: round(seconds, 6) for name, seconds in self.phases.items()}
+        result["other"] = round(self.other(), 6)
+        result["total"] = round(self.total, 6)
+        return {"route": self.route, "sampled": self.sampled, "seconds": result}
+
+
+# Time charged to `name` in the current request's profile; a no-op when the
+# request is not profiled
+def phase(name):
+    profile = current_profile.get()
+    if profile is None:
+        return contextlib.nullcontext()
+    return profile.phase(name)
+
+
+# Iterate `iterable`, charging the time spent producing each item to `name`
+def timed(name, iterable):
+    profile = current_profile.get()
+    if profile is None:
+        return iterable
+    return _timed(profile, name, iter(iterable))
+
+
+def _timed(profile, name, iterator):
+    while True:
+        with profile.phase(name):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+
+# Decides which requests are profiled and keeps what was recorded: the
+# `keep` most recent profiles and per-route phase totals.
+# `sample_every` > 0 profiles one request in that many without being asked.
+class Profiler:
+    def __init__(self, sample_every=0, keep=100):
+        self.sample_every = sample_every
+        self.requested = 0
+        self.sampled = 0
+        self._seen = itertools.count(1)
+        self._recent = collections.deque(maxlen=keep)
+        self._totals = {}
+        self._lock = threading.Lock()
+
+    # A profile for this request, or None. `requested` is whether the client
+    # asked for one and is allowed to.
+    def start(self, route, requested=False):
+        if requested:
+            self.requested += 1
+            return RequestProfile(route)
+        if self.sample_every > 0 and next(self._seen) % self.sample_every == 0:
+            self.sampled += 1
+            return RequestProfile(route, sampled=True)
+        return None
+
+    def record(self, profile):
+        profile.finish()
+        with self._lock:
+            self._recent.append(profile.describe())
+            totals = self._totals.get(profile.route)
+            if totals is None:
+                totals = self._totals[profile.route] = dict.fromkeys(PHASES + ("other", "total"), 0.0)
+                totals["count"] = 0
+            for name, seconds in profile.phases.items():
+                totals[name] = totals.get(name, 0.0) + seconds
+            totals["other"] += profile.other()
+            totals["total"] += profile.total
+            totals["count"] += 1
+
+    # Recorded profiles and per-route averages for the admin endpoint
+    def stats(self):
+        with self._lock:
+            averages = {
+                route: {name: round(value / totals["count"], 6) for name, value in totals.items() if name != "count"}
+                for route, totals in self._totals.items()
+            }
+            counts = {route: totals["count"] for route, totals in self._totals.items()}
+            recent = list(self._recent)
+        return {
+            "sample_every": self.sample_every,
+            "requested": self.requested,
+            "sampled": self.sampled,
+            "routes": {route: {"count": counts[route], "average_seconds": averages[route]} for route in averages},
+            "recent": recent,
+        }
+
+
+# Samples the stack of one thread every `interval` seconds from a background
+# thread and counts the stacks in the collapsed format of flame graph tools
+# ("outer;inner;leaf count"). Unlike cProfile it costs nothing per call.
+class StackSampler:
+    def __init__(self, interval=0.005, thread_id=None):
+        self.interval = interval
+        self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self.samples = collections.Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                return
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            self.samples[";".join(reversed(stack))] += 1
+
+    def write(self, path):
+        with open(path, "w") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+# Profile the calling thread until the block exits and write the result to
+# `path`: cProfile statistics (pstats) or sampled collapsed stacks
+@contextlib.contextmanager
+def profile_run(path, output_format="pstats", interval=0.005):
+    if output_format == "pstats":
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profiler.dump_stats(path)
+    elif output_format == "collapsed":
+        sampler = StackSampler(interval).start()
+        try:
+            yield
+        finally:
+            sampler.stop()
+            sampler.write(path)
+    else:
+        raise ValueError(f"Unknown profile format {output_format!r} (expected one of {', '.join(PROFILE_FORMATS)})")
@@ -0,0 +1,157 @@
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - exercised on installs without NumPy
+    np = None
+
+# Statistics reported per bucket, by parameter data type
+AGGREGATES = {
+    "float": ("min", "max", "mean", "last"),
+    "integer": ("min", "max", "mean", "last"),
+    "string": ("mode", "last"),
+}
+
+
+# Running statistics of one parameter in one bucket
+class _NumericState:
+    __slots__ = ("low", "high", "total", "count", "last")
+
+    def __init__(self):
+        self.low = None
+        self.high = None
+        self.total = 0.0
+        self.count = 0
+        self.last = None
+
+    def merge(self, low, high, total, count, last):
+        self.low = low if self.low is None or low < self.low else self.low
+        self.high = high if self.high is None or high > self.high else self.high
+        self.total += total
+        self.count += count
+        self.last = last
+
+
+class _CategoryState:
+    __slots__ = ("counts", "last")
+
+    def __init__(self, size):
+        self.counts = [0] * size
+        self.last = None
+
+    def merge(self, counts, last):
+        for code, count in enumerate(counts):
+            self.counts[code] += count
+        self.last = last
+
+
+# Folds blocks of a node's history (in time order) into per-bucket rollups
+# of the selected parameters. Buckets are `bucket` seconds long and aligned
+# to the epoch. Only running state per bucket is kept, so memory and the
+# result scale with the number of buckets, not with the raw points.
+class BucketAggregator:
+    def __init__(self, specs, indexes, bucket):
+        self.specs = specs
+        self.indexes = indexes
+        self.bucket = bucket
+        self._buckets = {}
+
+    def _state(self, bucket_start):
+        states = self._buckets.get(bucket_start)
+        if states is None:
+            states = self._buckets[bucket_start] = [0] + [
+                _CategoryState(len(self.specs[index].categories)) if self.specs[index].categories is not None
+                else _NumericState()
+                for index in self.indexes
+            ]
+        return states
+
+    # Add a Block of values
+    def add(self, block):
+        if not len(block):
+            return
+        if np is not None:
+            self._add_numpy(block)
+        else:
+            self._add_python(block)
+
+    def _add_numpy(self, block):
+        timestamps = np.asarray(block.timestamps)
+        starts = timestamps - timestamps % self.bucket
+        # Row offsets where a new bucket begins
+        edges = np.concatenate(([0], np.flatnonzero(np.diff(starts)) + 1))
+        ends = np.concatenate((edges[1:], [len(starts)]))
+        counts = (ends - edges).tolist()
+        bucket_starts = starts[edges].tolist()
+        states = [self._state(bucket_start) for bucket_start in bucket_starts]
+        for states_row, count in zip(states, counts):
+            states_row[0] += count
+        for slot, index in enumerate(self.indexes, 1):
+            spec = self.specs[index]
+            values = np.asarray(block.columns[index])
+            lasts = values[ends - 1].tolist()
+            if spec.categories is not None:
+                size = len(spec.categories)
+                bucket_of = np.repeat(np.arange(len(edges)), ends - edges)
+                table = np.bincount(bucket_of * size + values.astype(np.int64), minlength=len(edges) * size)
+                table = table.reshape(len(edges), size).tolist()
+                for states_row, row_counts, last in zip(states, table, lasts):
+                    states_row[slot].merge(row_counts, last)
+                continue
+            lows = np.minimum.reduceat(values, edges).tolist()
+            highs = np.maximum.reduceat(values, edges).tolist()
+            totals = np.add.reduceat(values.astype(np.float64), edges).tolist()
+            for states_row, low, high, total, count, last in zip(states, lows, highs, totals, counts, lasts):
+                states_row[slot].merge(low, high, total, count, last)
+
+    def _add_python(self, block):
+        timestamps = block.timestamps
+        bucket = self.bucket
+        edges = [0]
+        for row in range(1, len(timestamps)):
+            if timestamps[row] // bucket != timestamps[row - 1] // bucket:
+                edges.append(row)
+        ends = edges[1:] + [len(timestamps)]
+        states = [self._state(timestamps[edge] - timestamps[edge] % bucket) for edge in edges]
+        for states_row, edge, end in zip(states, edges, ends):
+            states_row[0] += end - edge
+        for slot, index in enumerate(self.indexes, 1):
+            spec = self.specs[index]
+            column = block.columns[index]
+            for states_row, edge, end in zip(states, edges, ends):
+                values = column[edge:end]
+                if spec.categories is not None:
+                    counts = [0] * len(spec.categories)
+                    for code in values:
+                        counts[code] += 1
+                    states_row[slot].merge(counts, values[-1])
+                else:
+                    states_row[slot].merge(min(values), max(values), float(sum(values)), len(values), values[-1])
+
+    # Rollups in time order: [(bucket start, point count, {parameter name: stats})]
+    def results(self):
+        out = []
+        for bucket_start in sorted(self._buckets):
+            states = self._buckets[bucket_start]
+            values = {}
+            for slot, index in enumerate(self.indexes, 1):
+                spec = self.specs[index]
+                state = states[slot]
+                if spec.categories is not None:
+                    # Ties go to the category listed first
+                    mode = max(range(len(state.counts)), key=lambda code: (state.counts[code], -code))
+                    values[spec.name] = {
+                        "mode": spec.categories[mode], "last": spec.categories[state.last],
+                    }
+                    continue
+                mean = state.total / state.count
+                if spec.data_type == "float":
+                    values[spec.name] = {
+                        "min": state.low, "max": state.high,
+                        "mean": round(mean, spec.decimal_places), "last": state.last,
+                    }
+                else:
+                    values[spec.name] = {
+                        "min": int(state.low), "max": int(state.high),
+                        "mean": round(mean, 2), "last": int(state.last),
+                    }
+            out.append((bucket_start, states[0], values))
+        return out
@@ -0,0 +1,162 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+from param_specs import compile_node_specs
+from static_cache import StaticResponseCache
+from topology import build_registry
+
+logger = logging.getLogger(__name__)
+
+
+# Raised when a configuration file cannot be turned into a snapshot
+class SnapshotError(Exception):
+    pass
+
+
+# Everything derived from one version of nodes.json.
+# A snapshot is never modified after it is published; a reload builds a new
+# one and swaps the reference, so a request that grabbed a snapshot keeps a
+# consistent view even if a reload happens while it runs.
+class Snapshot:
+    __slots__ = (
+        "version", "digest", "loaded_at", "source", "source_mtime",
+        "config", "registry", "node_specs", "static_cache", "listings", "geo",
+    )
+
+    def __init__(self, version, digest, source, source_mtime, config, registry, node_specs):
+        self.version = version
+        self.digest = digest
+        self.loaded_at = time.time()
+        self.source = source
+        self.source_mtime = source_mtime
+        self.config = config
+        self.registry = registry
+        self.node_specs = node_specs
+        self.static_cache = StaticResponseCache()
+        # Indexed rows of the list endpoints and the spatial index of the
+        # nodes, filled in before publishing
+        self.listings = {}
+        self.geo = None
+
+    # Summary for the admin endpoint
+    def describe(self):
+        return {
+            "version": self.version,
+            "digest": self.digest,
+            "loaded_at": self.loaded_at,
+            "source": self.source,
+            "source_mtime": self.source_mtime,
+            "domain_count": len(self.registry.domains),
+            "sensor_type_count": len(self.registry.sensor_types),
+            "node_count": len(self.registry.nodes),
+            "conflicts": list(self.registry.conflicts),
+        }
+
+
+# Parse and index raw nodes.json bytes into a snapshot
+def build_snapshot(raw, version, source=None, source_mtime=None):
+    try:
+        config = json.loads(raw)
+    except ValueError as e:
+        raise SnapshotError(f"invalid JSON: {e}") from None
+    if not isinstance(config, dict) or not isinstance(config.get("domains"), list):
+        raise SnapshotError("configuration must be an object with a 'domains' list")
+    try:
+        registry = build_registry(config)
+        node_specs = compile_node_specs(registry)
+    except (KeyError, TypeError, AttributeError) as e:
+        raise SnapshotError(f"malformed configuration: {e!r}") from None
+    digest = hashlib.blake2b(raw, digest_size=8).hexdigest()
+    return Snapshot(version, digest, source, source_mtime, config, registry, node_specs)
+
+
+# Owns the published snapshot of a configuration file and reloads it when
+# the file changes. `on_build(snapshot)` runs on every new snapshot before it
+# is published, e.g. to pre-render responses.
+class SnapshotManager:
+    def __init__(self, path, on_build=None, poll_interval=2.0):
+        self.path = path
+        self.on_build = on_build
+        self.poll_interval = poll_interval
+        self.last_error = None
+        self._reload_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._stat = None
+        self._snapshot = None
+        self._version = 0
+
+    # The published snapshot; reading it is a single reference load
+    def current(self):
+        return self._snapshot
+
+    def _file_stat(self):
+        stat = os.stat(self.path)
+        return stat.st_mtime_ns, stat.st_size
+
+    # Load the file and publish a new snapshot if its content changed.
+    # Returns (snapshot, changed). Raises SnapshotError if the file is invalid,
+    # in which case the previous snapshot stays published.
+    def reload(self, force=False):
+        with self._reload_lock:
+            try:
+                stat = self._file_stat()
+                with open(self.path, "rb") as f:
+                    raw = f.read()
+            except OSError as e:
+                self.last_error = f"cannot read {self.path}: {e}"
+                raise SnapshotError(self.last_error) from None
+
+            current = self._snapshot
+            self._stat = stat
+            digest = hashlib.blake2b(raw, digest_size=8).hexdigest()
+            if current is not None and not force and digest == current.digest:
+                return current, False
+
+            try:
+                snapshot = build_snapshot(raw, self._version + 1, self.path, stat[0] / 1e9)
+                if self.on_build is not None:
+                    self.on_build(snapshot)
+            except SnapshotError as e:
+                self.last_error = str(e)
+                logger.error("Not reloading %s: %s", self.path, e)
+                raise
+
+            self._version = snapshot.version
+            self._snapshot = snapshot
+            self.last_error = None
+            if current is not None:
+                logger.info("Reloaded %s as snapshot version %d", self.path, snapshot.version)
+            return snapshot, True
+
+    # Poll the file's mtime and size and reload on change
+    def _watch(self):
+        while not self._stop.wait(self.poll_interval):
+            try:
+                if self._file_stat() == self._stat:
+                    continue
+                self.reload()
+            except (OSError, SnapshotError):
+                # Keep serving the last good snapshot; retry on the next change
+                try:
+                    self._stat = self._file_stat()
+                except OSError:
+                    pass
+
+    # Start the background watcher thread (no-op when polling is disabled)
+    def start_watching(self):
+        if self.poll_interval <= 0 or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._watch, name="nodes-config-watcher", daemon=True)
+        self._thread.start()
+
+    def stop_watching(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.poll_interval + 1)
+            self._thread = None
@@ -0,0 +1,164 @@
+import gzip
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+from fastapi.responses import Response
+
+# Bodies smaller than this are not worth compressing
+GZIP_MIN_SIZE = 512
+
+
+# A JSON body rendered once, with its gzip variant and strong ETags
+class RenderedResponse:
+    __slots__ = ("body", "gzip_body", "etag", "gzip_etag")
+
+    def __init__(self, body):
+        self.body = body
+        digest = hashlib.blake2b(body, digest_size=16).hexdigest()
+        self.etag = f'"{digest}"'
+        if len(body) >= GZIP_MIN_SIZE:
+            self.gzip_body = gzip.compress(body, compresslevel=6, mtime=0)
+            self.gzip_etag = f'"{digest}-gzip"'
+        else:
+            self.gzip_body = None
+            self.gzip_etag = None
+
+
+# Render content exactly as FastAPI's JSONResponse would
+def render_json(content):
+    return RenderedResponse(
+        json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+    )
+
+
+# Whether an If-None-Match header matches one of the given ETags
+def etag_matches(if_none_match, *etags):
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate in etags:
+            return True
+    return False
+
+
+# Whether the client accepts a gzip-encoded response
+def accepts_gzip(accept_encoding):
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        if coding.strip().lower() in ("gzip", "*"):
+            return params.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000")
+    return False
+
+
+# Build the response for a rendered body: 304 when the client's copy is
+# current, otherwise the stored bytes (gzip when accepted)
+def serve(request, rendered, cache_control):
+    headers = {"Cache-Control": cache_control, "Vary": "Accept-Encoding"}
+    use_gzip = rendered.gzip_body is not None and accepts_gzip(request.headers.get("accept-encoding", ""))
+    etag = rendered.gzip_etag if use_gzip else rendered.etag
+    headers["ETag"] = etag
+
+    if etag_matches(request.headers.get("if-none-match"), rendered.etag, rendered.gzip_etag):
+        return Response(status_code=304, headers=headers)
+
+    if use_gzip:
+        headers["Content-Encoding"] = "gzip"
+        return Response(content=rendered.gzip_body, media_type="application/json", headers=headers)
+    return Response(content=rendered.body, media_type="application/json", headers=headers)
+
+
+# Rendered responses of the static topology endpoints for one configuration.
+# Entries are rendered on first use (or by warm()) and kept until the
+# configuration changes, at which point a new cache replaces this one.
+class StaticResponseCache:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    # Rendered response for `key`, building it with `build()` on a miss.
+    # `build` returns the JSON content, or None when the resource does not exist.
+    def get(self, key, build):
+        rendered = self._entries.get(key)
+        if rendered is not None:
+            self.hits += 1
+            return rendered
+        self.misses += 1
+        content = build()
+        if content is None:
+            return None
+        rendered = render_json(content)
+        with self._lock:
+            return self._entries.setdefault(key, rendered)
+
+    # Render a set of entries ahead of the first request
+    def warm(self, builders):
+        for key, build in builders.items():
+            self.get(key, build)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# Bounded LRU cache of rendered query results (filtered, sorted or paged
+# lists), keyed by the configuration version and the query. Each entry is
+# (RenderedResponse, extra) where `extra` is whatever the caller needs to
+# answer without re-running the query.
+class RenderedPageCache:
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    # Cached (rendered, extra) for `key`, or None
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0], entry[1]
+
+    # Store an entry, evicting least recently used ones beyond the memory cap
+    def put(self, key, rendered, extra=None):
+        size = len(rendered.body) + len(rendered.gzip_body or b"")
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.bytes -= old[2]
+            self._entries[key] = (rendered, extra, size)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self.bytes -= evicted_size
+                self.evictions += 1
+
+    def __len__(self):
+        return len(self._entries)
+
+    # Counters for the admin endpoint
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
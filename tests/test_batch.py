@@ -0,0 +1,40 @@
+import asyncio
+import json
+import time
+
+import api
+
+
+def call(path):
+    scope = {
+        "type": "http", "http_version": "1.1", "method": "GET", "scheme": "http", "root_path": "",
+        "path": path.split("?")[0], "raw_path": path.split("?")[0].encode(),
+        "query_string": path.partition("?")[2].encode(), "headers": [],
+        "server": ("test", 80), "client": ("127.0.0.1", 1),
+    }
+    response = {"body": b""}
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+        elif message["type"] == "http.response.body":
+            response["body"] += message.get("body", b"")
+
+    asyncio.run(api.app(scope, receive, send))
+    return response["status"], json.loads(response["body"])
+
+
+def test_batch_readings_are_the_shared_readings_of_data(monkeypatch):
+    monkeypatch.setattr(api, "OFFLOAD_MODE", "process")
+    # One sampling slot for every call
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now)
+    status, batch = call("/data/batch?nodes=n001,n002")
+    assert status == 200
+    for node_id in ("n001", "n002"):
+        status, single = call(f"/data?node={node_id}")
+        assert status == 200
+        assert batch["results"][node_id] == single
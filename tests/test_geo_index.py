@@ -0,0 +1,35 @@
+import random
+
+from geo_index import GeoIndex, haversine_km
+
+
+def brute_force(rows, lat, lon, k):
+    distances = sorted(
+        (haversine_km(lat, lon, row["node_latitude"], row["node_longitude"]), position)
+        for position, row in enumerate(rows)
+    )
+    return [round(distance, 6) for distance, _ in distances[:k]]
+
+
+def test_nearest_across_the_antimeridian_matches_brute_force():
+    for seed in range(60):
+        generator = random.Random(seed)
+        span = generator.uniform(5, 80)
+        rows = [
+            {"node_latitude": generator.uniform(-span, span), "node_longitude": generator.uniform(-180, 180)}
+            for _ in range(generator.choice((20, 95, 200, 500)))
+        ]
+        index = GeoIndex(rows)
+        assert index.cell * index.grid_cols == 360
+        for _ in range(20):
+            lat = generator.uniform(-span, span)
+            lon = generator.choice((1, -1)) * generator.uniform(178, 180)
+            found = [round(distance, 6) for _, distance in index.nearest(lat, lon, 3)]
+            assert found == brute_force(rows, lat, lon, 3), (seed, index.cell, lat, lon)
+
+
+def test_partial_column_cell_is_snapped():
+    rows = [{"node_latitude": 0.0, "node_longitude": -179.5}, {"node_latitude": 0.2, "node_longitude": 179.8}]
+    index = GeoIndex(rows)
+    assert [position for position, _ in index.nearest(0.1, 179.95, 2)] == [1, 0]
+    assert index.within(-1, 179, 1, -179) == [0, 1]
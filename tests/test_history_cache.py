@@ -0,0 +1,51 @@
+import itertools
+
+import api
+from metrics import points_generated
+
+START = 1790000000 // 3600 * 3600
+
+
+def records(node, start, interval, count):
+    return list(itertools.chain.from_iterable(api.iter_history_records(node, api.get_node_specs(node), start, interval, count)))
+
+
+def uncached(node, start, interval, count):
+    return [
+        api.encode_record(point)
+        for points in api.iter_history_points(node, api.get_node_specs(node), start, interval, count)
+        for point in points
+    ]
+
+
+def test_cold_small_page_generates_only_its_points():
+    api.history_cache.clear()
+    specs = api.get_node_specs("n001")
+    before = points_generated.total
+    assert len(records("n001", START, 60, 1)) == 1
+    assert points_generated.total - before == len(specs)
+
+    before = points_generated.total
+    assert len(records("n001", START, 6 * 3600, 28)) == 28
+    assert points_generated.total - before == 28 * len(specs)
+
+
+def test_only_uncached_edges_are_generated():
+    api.history_cache.clear()
+    specs = api.get_node_specs("n002")
+    records("n002", START + 100 * 60, 60, 50)
+
+    expected = uncached("n002", START + 80 * 60, 60, 100)
+    before = points_generated.total
+    assert records("n002", START + 80 * 60, 60, 100) == expected
+    assert points_generated.total - before == 50 * len(specs)
+
+    before = points_generated.total
+    assert records("n002", START + 90 * 60, 60, 60) == expected[10:70]
+    assert points_generated.total == before
+
+
+def test_ranges_across_blocks_match_uncached_history():
+    api.history_cache.clear()
+    for start, count in ((START, 3000), (START + 500 * 60, 2000), (START + 7000 * 60, 10)):
+        assert records("n003", start, 60, count) == uncached("n003", start, 60, count)
@@ -0,0 +1,36 @@
+import threading
+
+import data_generator
+import history_store
+from history_store import HistoryStore
+
+
+def test_concurrent_refreshes_open_one_store(tmp_path, monkeypatch):
+    data_generator.generate_all_data(
+        node_ids=["n001"], start=1790000100, end=1790086400, interval=900,
+        data_dir=str(tmp_path), quiet=True, output_format="columnar",
+    )
+    opened = []
+    open_store = history_store.open_store
+
+    def counting_open(directory, node_id):
+        opened.append(node_id)
+        return open_store(directory, node_id)
+
+    monkeypatch.setattr(history_store, "open_store", counting_open)
+    store = HistoryStore(str(tmp_path), refresh_interval=0)
+    barrier = threading.Barrier(8)
+    results = []
+
+    def read():
+        barrier.wait()
+        results.append(store.get("n001"))
+
+    threads = [threading.Thread(target=read) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert opened == ["n001"]
+    assert len({id(result) for result in results}) == 1
+    assert results[0].length == 96
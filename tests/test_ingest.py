@@ -0,0 +1,45 @@
+from array import array
+
+import pytest
+
+import api
+import ingest
+from ingest import IngestWindow
+from timeseries import generate_range
+
+SPECS = api.get_node_specs("n001")
+BASE = 1790000000 // 86400 * 86400
+
+
+def window(*timestamps, hold):
+    columns = [
+        array(column.typecode, [index + 1000 for index in range(len(timestamps))])
+        for column in (array(ingest.COLUMN_TYPECODES[spec.data_type]) for spec in SPECS)
+    ]
+    return IngestWindow(SPECS, array("q", timestamps), columns, hold)
+
+
+def pushed_rows(window, start, interval, count):
+    block = window.overlay(generate_range(SPECS, start, interval, count), interval)
+    column = list(block.columns[0])
+    return [offset for offset, value in enumerate(column) if value >= 1000]
+
+
+@pytest.fixture(params=["numpy", "array"])
+def backend(request, monkeypatch):
+    if request.param == "array":
+        monkeypatch.setattr(ingest, "np", None)
+    elif ingest.np is None:
+        pytest.skip("NumPy is not installed")
+
+
+def test_reading_is_held_for_one_sampling_interval(backend):
+    # Readings at 0 and 600 s, held 120 s, on a 60 s grid
+    rows = pushed_rows(window(BASE, BASE + 600, hold=120), BASE, 60, 15)
+    assert rows == [0, 1, 10, 11]
+
+
+def test_reading_between_grid_points_shows_at_the_next_one(backend):
+    # A reading half-way between hourly points, held 10 s
+    rows = pushed_rows(window(BASE + 1800, hold=10), BASE, 3600, 4)
+    assert rows == [1]
@@ -0,0 +1,140 @@
+import base64
+import binascii
+import json
+import re
+from datetime import datetime, timezone
+
+# oneM2M basic time format, e.g. "20250101T000000"
+_ONEM2M_TIME = re.compile(r"^(\d{8})T(\d{6})(?:,\d+)?$")
+# Interval such as "900", "15m", "6h", "1d"
+_INTERVAL = re.compile(r"^(\d+)\s*([smhdw]?)$")
+_UNIT_SECONDS = {"": 1, "s": 1, "m": 60, "h": 3600, "d": 86400, "w": 7 * 86400}
+
+
+# Raised for malformed or inconsistent time query parameters
+class TimeQueryError(ValueError):
+    pass
+
+
+# Parse a point in time to epoch seconds (UTC).
+# Accepts epoch seconds, oneM2M basic format and ISO 8601; naive values are UTC.
+def parse_time(value):
+    value = value.strip()
+    if re.fullmatch(r"-?\d+(\.\d+)?", value):
+        return int(float(value))
+    match = _ONEM2M_TIME.match(value)
+    try:
+        if match:
+            parsed = datetime.strptime(match.group(1) + match.group(2), "%Y%m%d%H%M%S")
+        else:
+            parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        raise TimeQueryError(f"Invalid time {value!r}") from None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return int(parsed.timestamp())
+
+
+# Parse an interval to a positive number of seconds
+def parse_interval(value):
+    match = _INTERVAL.match(str(value).strip().lower())
+    if not match:
+        raise TimeQueryError(f"Invalid interval {value!r}")
+    seconds = int(match.group(1)) * _UNIT_SECONDS[match.group(2)]
+    if seconds <= 0:
+        raise TimeQueryError("Interval must be positive")
+    return seconds
+
+
+# First multiple of `interval` at or after `timestamp`
+def align_up(timestamp, interval):
+    return -(-timestamp // interval) * interval
+
+
+# Number of grid points of `interval` in [start, end], with start on the grid
+def count_points(start, end, interval):
+    if end < start:
+        return 0
+    return (end - start) // interval + 1
+
+
+# Opaque continuation cursor for a paged range query
+def encode_cursor(**state):
+    raw = json.dumps(state, separators=(",", ":"), sort_keys=True).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        state = json.loads(raw)
+    except (binascii.Error, ValueError):
+        raise TimeQueryError("Invalid cursor") from None
+    if not isinstance(state, dict):
+        raise TimeQueryError("Invalid cursor")
+    return state
+
+
+# A resolved, grid-aligned range query: points start, start + interval, ...
+# up to and including end, `count` of them in this page.
+class RangeQuery:
+    __slots__ = ("start", "end", "interval", "count", "next_start")
+
+    def __init__(self, start, end, interval, count, next_start):
+        self.start = start
+        self.end = end
+        self.interval = interval
+        self.count = count
+        self.next_start = next_start
+
+    # Cursor for the page after this one, or None on the last page
+    def next_cursor(self, subject):
+        if self.next_start is None:
+            return None
+        return encode_cursor(s=subject, t=self.next_start, e=self.end, i=self.interval)
+
+
+# Resolve query parameters (explicit range, oneM2M filter criteria or a
+# cursor) into one bounded page of a grid-aligned range.
+# `cra`/`crb` are exclusive bounds as in oneM2M filter criteria; `lim` is an
+# alias of `limit`. Without any range the default span ending now is used.
+def resolve_range(subject, now, default_span, default_interval, max_page,
+                  start=None, end=None, interval=None, limit=None, cursor=None,
+                  cra=None, crb=None, lim=None):
+    if limit is None:
+        limit = lim
+    if limit is not None and limit <= 0:
+        raise TimeQueryError("Limit must be positive")
+    page = min(limit, max_page) if limit is not None else max_page
+
+    if cursor:
+        state = decode_cursor(cursor)
+        try:
+            owner = state["s"]
+            first, end, step = int(state["t"]), int(state["e"]), int(state["i"])
+        except (KeyError, TypeError, ValueError):
+            raise TimeQueryError("Invalid cursor") from None
+        if owner != subject:
+            raise TimeQueryError("Cursor does not belong to this query")
+        if step <= 0:
+            raise TimeQueryError("Invalid cursor")
+    else:
+        step = parse_interval(interval) if interval is not None else default_interval
+        if end is not None:
+            end = parse_time(end)
+        elif crb is not None:
+            end = parse_time(crb) - 1
+        else:
+            end = now
+        if start is not None:
+            start = parse_time(start)
+        elif cra is not None:
+            start = parse_time(cra) + 1
+        else:
+            start = end - default_span
+        first = align_up(start, step)
+
+    total = count_points(first, end, step)
+    count = min(total, page)
+    next_start = first + count * step if total > count else None
+    return RangeQuery(first, end, step, count, next_start)
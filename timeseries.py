@@ -0,0 +1,218 @@
+import bisect
+import math
+import time
+from array import array
+
+from metrics import points_generated
+from noise import RandomNoise
+from param_specs import AQI_HOUR_TABLE, AQL_LEVELS, POLLUTANT_CUM_WEIGHTS
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - exercised on installs without NumPy
+    np = None
+
+# Upper AQI bounds of the air quality levels, for vectorized AQL lookup
+_AQL_BOUNDS = tuple(float(upper) for upper, _ in AQL_LEVELS)
+
+# (date strftime format, time-of-day format) pairs understood by format_timestamps
+ONEM2M_TIME_FORMAT = ("%Y%m%dT", "{:02d}{:02d}{:02d}")
+CSV_TIME_FORMAT = ("%Y-%m-%d ", "{:02d}:{:02d}:{:02d}")
+
+
+# A (timestamps x parameters) block of generated values.
+# Numeric columns are float64/int64 arrays; string columns hold category
+# codes into spec.categories.
+class Block:
+    __slots__ = ("specs", "timestamps", "columns")
+
+    def __init__(self, specs, timestamps, columns):
+        self.specs = specs
+        self.timestamps = timestamps
+        self.columns = columns
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    # Python values of one column
+    def column_values(self, index):
+        spec = self.specs[index]
+        column = self.columns[index]
+        values = column.tolist()
+        if spec.categories is not None:
+            categories = spec.categories
+            return [categories[code] for code in values]
+        return values
+
+    # Python timestamps (epoch seconds)
+    def timestamp_values(self):
+        return self.timestamps.tolist()
+
+    # Rows of typed values, in spec order
+    def rows(self):
+        if not self.specs:
+            return [[] for _ in range(len(self))]
+        return [list(row) for row in zip(*[self.column_values(i) for i in range(len(self.specs))])]
+
+    # Rows of values rendered as strings, as they appear in m2m:cin "con"
+    def string_rows(self):
+        if not self.specs:
+            return [[] for _ in range(len(self))]
+        columns = []
+        for index, spec in enumerate(self.specs):
+            values = self.column_values(index)
+            columns.append(values if spec.categories is not None else [str(value) for value in values])
+        return [list(row) for row in zip(*columns)]
+
+
+# Timestamps start, start + interval, ... as an int64 array
+def make_timestamps(start, interval, count):
+    if np is not None:
+        return np.arange(count, dtype=np.int64) * int(interval) + int(start)
+    start = int(start)
+    interval = int(interval)
+    return array("q", range(start, start + interval * count, interval)) if count > 0 else array("q")
+
+
+# Day of year (1-366, UTC) of a day number since the epoch
+def _day_of_year(day):
+    return time.gmtime(day * 86400).tm_yday
+
+
+# Hour of day and day of year columns for epoch-second timestamps (UTC).
+# Days are few compared with samples, so day-of-year is computed once per day.
+def calendar_columns(timestamps):
+    if np is not None:
+        if len(timestamps) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        hours = (timestamps // 3600) % 24
+        days = timestamps // 86400
+        first = int(days.min())
+        table = np.array([_day_of_year(day) for day in range(first, int(days.max()) + 1)], dtype=np.int64)
+        return hours, table[days - first]
+    hours = array("q", [(ts // 3600) % 24 for ts in timestamps])
+    cache = {}
+    day_of_year = array("q")
+    for ts in timestamps:
+        day = ts // 86400
+        value = cache.get(day)
+        if value is None:
+            value = cache[day] = _day_of_year(day)
+        day_of_year.append(value)
+    return hours, day_of_year
+
+
+# Format epoch-second timestamps (UTC) as strings, e.g. "20250101T000000".
+# The date part is rendered once per day and the time of day with str.format.
+def format_timestamps(timestamps, style=ONEM2M_TIME_FORMAT):
+    date_format, time_format = style
+    dates = {}
+    out = []
+    for ts in (timestamps.tolist() if hasattr(timestamps, "tolist") else timestamps):
+        day, second = divmod(ts, 86400)
+        prefix = dates.get(day)
+        if prefix is None:
+            prefix = dates[day] = time.strftime(date_format, time.gmtime(day * 86400))
+        hour, rest = divmod(second, 3600)
+        out.append(prefix + time_format.format(hour, rest // 60, rest % 60))
+    return out
+
+
+# Format a single epoch-second timestamp (UTC)
+def format_timestamp(ts, style=ONEM2M_TIME_FORMAT):
+    return format_timestamps((int(ts),), style)[0]
+
+
+def _numpy_column(spec, hours, days, noise, timestamps, aqi):
+    if spec.hour_table is not None:
+        values = np.asarray(spec.hour_table)[hours]
+        if spec.day_table is not None:
+            values = values + np.asarray(spec.day_table)[days]
+        if spec.term is not None:
+            kind, a, b = spec.term
+            u = noise.uniforms(spec.name, 0, timestamps)
+            if kind == "uniform":
+                values = values + (a + (b - a) * u)
+            elif kind == "bernoulli":
+                values = values + np.where(u < a, b, 0.0)
+            else:
+                values = values + (a + np.floor(u * (b - a + 1)))
+        if spec.data_type == "float":
+            u = noise.uniforms(spec.name, 1, timestamps)
+            # + 0.0 turns rint's -0.0 into 0.0, as Python's round() gives
+            values = (np.rint((values + (spec.noise_low + spec.noise_span * u)) * spec.scale) + 0.0) / spec.scale
+            if spec.clamp is not None:
+                values = np.clip(values, spec.clamp[0], spec.clamp[1])
+            return values
+        return values.astype(np.int64)
+    if spec.model == "aql":
+        if aqi is None:
+            aqi = np.asarray(AQI_HOUR_TABLE)[hours]
+        return np.searchsorted(_AQL_BOUNDS, np.trunc(aqi), side="left").astype(np.uint8)
+    if spec.model == "main_pollutant":
+        u = noise.uniforms(spec.name, 0, timestamps)
+        return np.searchsorted(POLLUTANT_CUM_WEIGHTS, u, side="right").astype(np.uint8)
+    return np.zeros(len(timestamps), dtype=np.uint8)
+
+
+def _array_column(spec, hours, days, noise, timestamps, aqi):
+    if spec.hour_table is not None:
+        table = spec.hour_table
+        values = [table[hour] for hour in hours]
+        if spec.day_table is not None:
+            table = spec.day_table
+            values = [value + table[day] for value, day in zip(values, days)]
+        if spec.term is not None:
+            kind, a, b = spec.term
+            u = noise.uniforms(spec.name, 0, timestamps)
+            if kind == "uniform":
+                values = [value + (a + (b - a) * x) for value, x in zip(values, u)]
+            elif kind == "bernoulli":
+                values = [value + (b if x < a else 0.0) for value, x in zip(values, u)]
+            else:
+                floor = math.floor
+                values = [value + (a + floor(x * (b - a + 1))) for value, x in zip(values, u)]
+        if spec.data_type == "float":
+            u = noise.uniforms(spec.name, 1, timestamps)
+            low, span, scale = spec.noise_low, spec.noise_span, spec.scale
+            values = [round((value + (low + span * x)) * scale) / scale for value, x in zip(values, u)]
+            if spec.clamp is not None:
+                lo, hi = spec.clamp
+                values = [lo if value < lo else hi if value > hi else value for value in values]
+            return array("d", values)
+        return array("q", [int(value) for value in values])
+    if spec.model == "aql":
+        if aqi is None:
+            aqi = [AQI_HOUR_TABLE[hour] for hour in hours]
+        return array("B", [bisect.bisect_left(_AQL_BOUNDS, float(int(value))) for value in aqi])
+    if spec.model == "main_pollutant":
+        u = noise.uniforms(spec.name, 0, timestamps)
+        return array("B", [bisect.bisect_right(POLLUTANT_CUM_WEIGHTS, x) for x in u])
+    return array("B", bytes(len(timestamps)))
+
+
+# Generate a whole (timestamps x parameters) block in one pass.
+# Uses NumPy array math when available and the stdlib `array` module
+# otherwise; both produce the same values for the same noise draws.
+# `noise` is a noise source from noise.py (e.g. KeyedNoise(node_id)); draws
+# are requested per (parameter name, stream) with stream 0 feeding a model's
+# random term and stream 1 the accuracy noise.
+def generate_block(specs, timestamps, noise=None):
+    if noise is None:
+        noise = RandomNoise()
+    hours, days = calendar_columns(timestamps)
+    build = _numpy_column if np is not None else _array_column
+    columns = []
+    aqi = None
+    for spec in specs:
+        column = build(spec, hours, days, noise, timestamps, aqi)
+        if spec.model == "aqi" and aqi is None:
+            aqi = column
+        columns.append(column)
+    points_generated.add(specs, len(timestamps))
+    return Block(specs, timestamps, columns)
+
+
+# Generate `count` points starting at `start` every `interval` seconds
+def generate_range(specs, start, interval, count, noise=None):
+    return generate_block(specs, make_timestamps(start, interval, count), noise)
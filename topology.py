@@ -0,0 +1,129 @@
+import logging
+from types import MappingProxyType
+
+logger = logging.getLogger(__name__)
+
+
+# Read-only, indexed view over a nodes.json configuration.
+# Built once per configuration so lookups by id are O(1) instead of walking
+# every domain, sensor type and node on each request.
+class TopologyRegistry:
+    __slots__ = (
+        "config", "domains", "sensor_types", "nodes", "node_parameters", "conflicts",
+        "nodes_by_domain", "nodes_by_sensor_type", "nodes_by_area",
+    )
+
+    def __init__(self, config, domains, sensor_types, nodes, node_parameters, conflicts):
+        self.config = config
+        self.domains = MappingProxyType(domains)
+        self.sensor_types = MappingProxyType(sensor_types)
+        self.nodes = MappingProxyType(nodes)
+        self.node_parameters = MappingProxyType(node_parameters)
+        self.conflicts = tuple(conflicts)
+
+        # Secondary indexes: attribute value -> node ids in configuration order
+        self.nodes_by_domain = _group(nodes, lambda info: info["domain"]["domain_id"])
+        self.nodes_by_sensor_type = _group(nodes, lambda info: info["sensor_type"]["sensor_type_id"])
+        self.nodes_by_area = _group(nodes, lambda info: info["node"].get("node_area"))
+
+    # Returns {"node", "sensor_type", "domain"} for a node id, or None
+    def find_node(self, node_id):
+        return self.nodes.get(node_id)
+
+    # Returns the resolved parameter definitions of a node, or None
+    def get_node_parameters(self, node_id):
+        return self.node_parameters.get(node_id)
+
+    # Returns {"sensor_type", "domain"} for a sensor type id, or None
+    def find_sensor_type(self, sensor_type_id):
+        return self.sensor_types.get(sensor_type_id)
+
+    # Returns the domain dict for a domain id, or None
+    def find_domain(self, domain_id):
+        return self.domains.get(domain_id)
+
+    # Node ids matching every given selector (None means "any"), in
+    # configuration order. Walks the smallest matching index only.
+    def select_nodes(self, **selectors):
+        candidates = []
+        for name, value in selectors.items():
+            if value is None:
+                continue
+            index = getattr(self, f"nodes_by_{name}")
+            candidates.append(index.get(value, ()))
+        if not candidates:
+            return tuple(self.nodes)
+        candidates.sort(key=len)
+        if len(candidates) == 1:
+            return candidates[0]
+        others = [frozenset(group) for group in candidates[1:]]
+        return tuple(node_id for node_id in candidates[0] if all(node_id in group for group in others))
+
+
+# Group node ids by an attribute of their node info
+def _group(nodes, key):
+    groups = {}
+    for node_id, info in nodes.items():
+        groups.setdefault(key(info), []).append(node_id)
+    return MappingProxyType({value: tuple(node_ids) for value, node_ids in groups.items()})
+
+
+# Build the registry from a parsed nodes.json document.
+# The first occurrence of a duplicated id wins, which is what the old linear
+# scans returned; every shadowed duplicate is recorded in `conflicts`.
+def build_registry(nodes_config):
+    domains = {}
+    sensor_types = {}
+    nodes = {}
+    node_parameters = {}
+    conflicts = []
+
+    for domain in nodes_config.get("domains", []):
+        domain_id = domain["domain_id"]
+        if domain_id in domains:
+            conflicts.append(
+                f"duplicate domain_id {domain_id!r}: {domain.get('domain_name')!r} is shadowed by "
+                f"{domains[domain_id].get('domain_name')!r}"
+            )
+        else:
+            domains[domain_id] = domain
+
+        # Parameter definitions by name within this domain
+        domain_params = {}
+        for param in domain.get("parameters", []):
+            name = param["parameter_name"]
+            if name in domain_params:
+                conflicts.append(f"duplicate parameter {name!r} in domain {domain_id!r}")
+                continue
+            domain_params[name] = param
+
+        for sensor_type in domain.get("sensor_types", []):
+            sensor_type_id = sensor_type["sensor_type_id"]
+            if sensor_type_id in sensor_types:
+                conflicts.append(f"duplicate sensor_type_id {sensor_type_id!r} in domain {domain_id!r}")
+            else:
+                sensor_types[sensor_type_id] = {"sensor_type": sensor_type, "domain": domain}
+
+            parameters = []
+            for param_name in sensor_type.get("parameters", []):
+                param = domain_params.get(param_name)
+                if param is None:
+                    conflicts.append(
+                        f"sensor type {sensor_type_id!r} references unknown parameter {param_name!r}"
+                    )
+                    continue
+                parameters.append(param)
+            parameters = tuple(parameters)
+
+            for node in sensor_type.get("nodes", []):
+                node_id = node["node_id"]
+                if node_id in nodes:
+                    conflicts.append(f"duplicate node_id {node_id!r} in sensor type {sensor_type_id!r}")
+                    continue
+                nodes[node_id] = {"node": node, "sensor_type": sensor_type, "domain": domain}
+                node_parameters[node_id] = parameters
+
+    for conflict in conflicts:
+        logger.warning("nodes.json: %s", conflict)
+
+    return TopologyRegistry(nodes_config, domains, sensor_types, nodes, node_parameters, conflicts)